@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""Compare request latency of a two-checker chain run concurrently (as BaseServiceHandler
+does) against the same chain run one checker after the other, as it used to be
+
+    python -m benchmarks.checker_chain [requests]
+
+The first checker stands in for a slow spool read, the second for a backend probe that
+fails; each takes a random 0-20ms.
+"""
+
+from __future__ import print_function
+
+import datetime
+import random
+import sys
+import time
+
+import tornado.gen
+import tornado.httpclient
+import tornado.httpserver
+import tornado.ioloop
+import tornado.testing
+import tornado.web
+
+from hacheck import handlers
+
+
+def delayed(code, message):
+    @tornado.gen.coroutine
+    def checker(service_name, port, query, io_loop, query_params, headers):
+        yield tornado.gen.Task(io_loop.add_timeout, datetime.timedelta(seconds=random.uniform(0, 0.02)))
+        raise tornado.gen.Return((code, message))
+    return checker
+
+
+CHAIN = [delayed(200, 'spool is up'), delayed(503, 'backend is down')]
+
+
+class ConcurrentHandler(handlers.BaseServiceHandler):
+    CHECKERS = CHAIN
+
+
+class SequentialHandler(tornado.web.RequestHandler):
+    @tornado.web.asynchronous
+    @tornado.gen.coroutine
+    def get(self, service_name, port, query):
+        for checker in CHAIN:
+            code, message = yield checker(service_name, int(port), query, io_loop=tornado.ioloop.IOLoop.current(),
+                                          query_params='', headers={})
+            if code > 200:
+                break
+        self.set_status(code)
+        self.finish(message)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main(requests=200):
+    io_loop = tornado.ioloop.IOLoop.current()
+    sock, port = tornado.testing.bind_unused_port()
+    server = tornado.httpserver.HTTPServer(tornado.web.Application([
+        (r'/concurrent/([a-zA-Z0-9_-]+)/([0-9]+)/?(.*)', ConcurrentHandler),
+        (r'/sequential/([a-zA-Z0-9_-]+)/([0-9]+)/?(.*)', SequentialHandler),
+    ], log_function=lambda handler: None), io_loop=io_loop)
+    server.add_socket(sock)
+    client = tornado.httpclient.AsyncHTTPClient(io_loop=io_loop)
+
+    @tornado.gen.coroutine
+    def run():
+        for mode in ('sequential', 'concurrent'):
+            latencies = []
+            for i in range(requests):
+                start = time.time()
+                try:
+                    yield client.fetch('http://127.0.0.1:%d/%s/svc%d/1/' % (port, mode, i))
+                except tornado.httpclient.HTTPError as e:
+                    assert e.code == 503, e.code
+                latencies.append(1000.0 * (time.time() - start))
+            print('%-10s p50 %6.2fms  p99 %6.2fms' % (mode, percentile(latencies, 0.5), percentile(latencies, 0.99)))
+
+    try:
+        io_loop.run_sync(run)
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    sys.exit(main(*[int(arg) for arg in sys.argv[1:]]))
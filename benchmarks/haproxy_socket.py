@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+"""Time `show stat' fetches over a persistent stats-socket connection against a fake HAProxy
+
+    python -m benchmarks.haproxy_socket [backends] [iterations]
+"""
+
+from __future__ import print_function
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import tornado.gen
+import tornado.ioloop
+
+from hacheck import haproxy
+from tests import fake_haproxy
+
+
+def main(backends=300, iterations=200):
+    io_loop = tornado.ioloop.IOLoop.current()
+    root = tempfile.mkdtemp()
+    statuses = {}
+    for i in range(backends):
+        statuses[('service%d' % i, 'BACKEND')] = 'UP'
+        for j in range(3):
+            statuses[('service%d' % i, 'server%d' % j)] = 'UP'
+    server = fake_haproxy.FakeStatsSocketServer(os.path.join(root, 'stats.sock'), statuses, io_loop=io_loop)
+    server.start_listening()
+
+    @tornado.gen.coroutine
+    def run():
+        client = haproxy.stats_socket(server.path, io_loop=io_loop)
+        yield client.show_stat()
+        start = time.time()
+        for _ in range(iterations):
+            table = yield client.show_stat()
+        elapsed = time.time() - start
+        print('%d rows: %.3fms per fetch+parse over %d connection(s)' % (
+            len(table), 1000.0 * elapsed / iterations, server.connections))
+
+    try:
+        io_loop.run_sync(run)
+    finally:
+        server.stop()
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    sys.exit(main(*[int(arg) for arg in sys.argv[1:]]))
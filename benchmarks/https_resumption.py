@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+"""Time HTTPS fetches from a local server when every fetch makes a new
+connection with a full TLS handshake, when every fetch makes a new connection
+resuming the previous session, and over one kept-alive connection
+
+    python -m benchmarks.https_resumption [iterations]
+
+Resumption needs Python 3.6 or later; before that the middle case is the same
+as the first.
+"""
+
+from __future__ import print_function
+
+import logging
+import os
+import ssl
+import sys
+import time
+
+import tornado.gen
+import tornado.httpserver
+import tornado.ioloop
+import tornado.testing
+import tornado.web
+
+from hacheck import keepalive
+
+TLS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tests', 'tls')
+
+
+class OK(tornado.web.RequestHandler):
+    def get(self):
+        self.write('OK')
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main(iterations=500):
+    # the server complains about every client that hangs up without a close_notify
+    logging.getLogger('tornado.general').setLevel(logging.CRITICAL)
+    io_loop = tornado.ioloop.IOLoop.current()
+    context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+    context.load_cert_chain(os.path.join(TLS_DIR, 'cert.pem'), os.path.join(TLS_DIR, 'key.pem'))
+    server = tornado.httpserver.HTTPServer(tornado.web.Application([('/', OK)], log_function=lambda handler: None),
+                                           ssl_options=context, io_loop=io_loop)
+    sock, port = tornado.testing.bind_unused_port()
+    server.add_socket(sock)
+
+    @tornado.gen.coroutine
+    def measure(reconnect, resume):
+        keepalive.reset_stats()
+        tls = keepalive.TLSSessions()
+        conn = keepalive.HTTPConnection(('127.0.0.1', port), tls=tls, io_loop=io_loop)
+        times = []
+        for _ in range(iterations):
+            if not resume:
+                tls.session = None
+            start = time.time()
+            yield conn.fetch('/')
+            times.append(1000.0 * (time.time() - start))
+            if reconnect:
+                conn.close()
+        conn.close()
+        raise tornado.gen.Return((times, keepalive.get_stats()))
+
+    @tornado.gen.coroutine
+    def run():
+        for mode, reconnect, resume in (('full', True, False), ('resumed', True, True), ('keepalive', False, True)):
+            times, stats = yield measure(reconnect, resume)
+            handshake = 1000.0 * stats['tls_handshake_time'] / stats['tls_handshakes']
+            print('%-9s p50 %6.3fms  p99 %6.3fms  %4d handshakes of %6.3fms, %3.0f%% resumed' % (
+                mode, percentile(times, 0.5), percentile(times, 0.99), stats['tls_handshakes'], handshake,
+                100 * (stats['tls_resumption_rate'] or 0)))
+
+    try:
+        io_loop.run_sync(run)
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    sys.exit(main(*[int(arg) for arg in sys.argv[1:]]))
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+"""Measure how long starting hacheck spends importing modules: hacheck.main as
+it is (checkers imported on first use), against hacheck.main plus every
+built-in checker, as every process used to import
+
+    python -m benchmarks.import_time [runs]
+
+Each run is a fresh interpreter, so nothing is already imported.
+"""
+
+from __future__ import print_function
+
+import subprocess
+import sys
+
+from hacheck import registry
+
+SCRIPT = '''
+import sys
+import time
+start = time.time()
+import hacheck.main
+%s
+print("%%f %%d" %% (time.time() - start, len(sys.modules)))
+'''
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def measure(imports, runs):
+    times = []
+    modules = 0
+    for _ in range(runs):
+        output = subprocess.check_output([sys.executable, '-c', SCRIPT % imports])
+        elapsed, modules = output.split()
+        times.append(1000.0 * float(elapsed))
+    return times, int(modules)
+
+
+def main(runs=20):
+    everything = '\n'.join(
+        'import %s' % reference.partition(':')[0] for reference in sorted(set(registry.BUILTIN_CHECKERS.values()))
+    )
+    for mode, imports in (('lazy', ''), ('eager', everything)):
+        times, modules = measure(imports, runs)
+        print('%-6s p50 %6.2fms  p99 %6.2fms  %d modules' % (
+            mode, percentile(times, 0.5), percentile(times, 0.99), modules
+        ))
+
+
+if __name__ == '__main__':
+    sys.exit(main(*[int(arg) for arg in sys.argv[1:]]))
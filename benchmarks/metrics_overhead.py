@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+"""Time what recording metrics adds to every check: one probe (with its
+in-progress count and latency histogram) and one request (histogram and
+response code), spread over a number of services
+
+    python -m benchmarks.metrics_overhead [services] [iterations]
+"""
+
+from __future__ import print_function
+
+import sys
+import time
+
+import tornado.concurrent
+
+from hacheck import metrics
+
+
+def main(services=200, iterations=200000):
+    names = ['service%d' % i for i in range(services)]
+    futures = []
+    start = time.time()
+    for i in range(iterations):
+        future = tornado.concurrent.Future()
+        metrics.record_probe('check_tcp', names[i % services], future)
+        futures.append(future)
+    for future in futures:
+        future.set_result((200, 'OK'))
+    probe = time.time() - start
+    start = time.time()
+    for i in range(iterations):
+        metrics.record_request(names[i % services], 200, 0.001 * (i % 100))
+    request = time.time() - start
+    start = time.time()
+    body = metrics.render(time.time())
+    render = time.time() - start
+    print('record_probe %.2fus  record_request %.2fus  render %.2fms (%d bytes)' % (
+        1e6 * probe / iterations, 1e6 * request / iterations, 1000.0 * render, len(body)))
+
+
+if __name__ == '__main__':
+    sys.exit(main(*[int(arg) for arg in sys.argv[1:]]))
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+"""Compare the INFO parser against the regex-per-line parser it replaced, on real INFO payloads
+
+    python -m benchmarks.redis_info_parser [iterations]
+"""
+
+from __future__ import print_function
+
+import json
+import re
+import sys
+import timeit
+
+from hacheck import redis
+from tests import fake_redis
+
+
+def legacy_parse(data, is_sentinel):
+    # what gen_info_cb used to do on every request, including the JSON view
+    info = {}
+    for line in data.decode('utf-8').split('\n'):
+        if is_sentinel:
+            ipport = re.findall(r'\d{1,3}.\d{1,3}.\d{1,3}.\d{1,3}:\d{1,5}', line)
+            if ipport:
+                info['redis_master'] = ipport[0]
+        if ':' in line:
+            try:
+                k, v = line.strip().split(':')
+                info[k] = v
+            except ValueError:
+                continue
+    return json.dumps(info)
+
+
+def main(iterations=20000):
+    for name, payload, is_sentinel in (
+        ('redis', fake_redis.REDIS_INFO, False),
+        ('sentinel', fake_redis.SENTINEL_INFO, True),
+    ):
+        legacy = timeit.timeit(lambda: legacy_parse(payload, is_sentinel), number=iterations)
+        parsed = timeit.timeit(lambda: redis.InfoSnapshot(payload).json, number=iterations)
+        print('%-8s legacy %.1fus, InfoSnapshot %.1fus per parse+JSON' % (
+            name, 1e6 * legacy / iterations, 1e6 * parsed / iterations))
+        # later match queries and JSON views within the cache window share the snapshot
+        snapshot = redis.InfoSnapshot(payload)
+        shared = timeit.timeit(lambda: (snapshot.json, snapshot.match({'role': ['master']})), number=iterations)
+        print('%-8s shared snapshot %.2fus per request' % (name, 1e6 * shared / iterations))
+
+
+if __name__ == '__main__':
+    sys.exit(main(*[int(arg) for arg in sys.argv[1:]]))
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+"""Time /recent and /status/count with many services, and how long they hold up
+the IOLoop, written a chunk at a time against all at once
+
+    python -m benchmarks.service_pages [services] [requests]
+
+The IOLoop is held up for about as long as the longest chunk takes to render,
+which the lag monitor (sampling every millisecond) sees as its worst lag.
+"""
+
+from __future__ import print_function
+
+import sys
+import time
+
+import mock
+import tornado.gen
+import tornado.httpclient
+import tornado.httpserver
+import tornado.ioloop
+import tornado.testing
+
+from hacheck import accounting
+from hacheck import handlers
+from hacheck import looplag
+from hacheck import main as hacheck_main
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main(services=20000, requests=20):
+    io_loop = tornado.ioloop.IOLoop.current()
+    accounting.configure(max_services=services)
+    now = time.time()
+    for i in range(services):
+        name = 'service%05d' % i
+        for j in range(3):
+            accounting.record_request(name, '10.0.%d.%d' % (j, i % 250), now=now)
+        accounting.record_status(name, 200, '10.0.0.1', now)
+    sock, port = tornado.testing.bind_unused_port()
+    server = tornado.httpserver.HTTPServer(hacheck_main.get_app(), io_loop=io_loop)
+    server.add_socket(sock)
+    client = tornado.httpclient.AsyncHTTPClient(io_loop=io_loop)
+
+    @tornado.gen.coroutine
+    def run():
+        for mode, chunk_size in (('all at once', services + 1), ('chunked', handlers.ServicePageHandler.CHUNK_SIZE)):
+            for path in ('/recent', '/status/count'):
+                with mock.patch.object(handlers.ServicePageHandler, 'CHUNK_SIZE', chunk_size):
+                    latencies = []
+                    lags = []
+                    for _ in range(requests):
+                        looplag.reset_stats()
+                        looplag.start(interval=0.001, io_loop=io_loop)
+                        start = time.time()
+                        yield client.fetch('http://127.0.0.1:%d%s' % (port, path), request_timeout=60)
+                        latencies.append(1000.0 * (time.time() - start))
+                        looplag.stop()
+                        lags.append(looplag.get_stats()['lag_max_ms'] or 0.0)
+                print('%-11s %-13s p50 %7.2fms  worst loop lag p50 %7.2fms' % (
+                    mode, path, percentile(latencies, 0.5), percentile(lags, 0.5)))
+
+    try:
+        io_loop.run_sync(run, timeout=600)
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    sys.exit(main(*[int(arg) for arg in sys.argv[1:]]))
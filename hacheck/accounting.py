@@ -0,0 +1,304 @@
+"""which services have been checked, by whom, and with what result, in bounded memory
+
+For each service we keep when it was last checked, its last status, and how
+many checks each source made over the last `window' seconds. Those counts are
+kept in a ring of `buckets' time buckets, each holding a space-saving sketch of
+at most `top_sources' sources. Once a busy service has had more sources than
+that in a bucket, that bucket's counts become estimates which may overcount,
+by at most the smallest count in it. Services not checked for `window' seconds
+are forgotten. If there are ever more than `max_services', the least recently
+checked are forgotten too. Anything else kept per service (metrics, agent
+latencies) is bounded the same way, by forgetting a service's entries when
+accounting does: see forget_callbacks.
+
+The results of the last `history' probes of each service's backend (that is,
+of checks decided by a checker which missed the cache, rather than by the
+cache or the spool) are kept too, oldest first.
+
+The names of the services are also kept sorted, so that they can be listed a
+page at a time, or by prefix, without sorting them all every time.
+"""
+
+import bisect
+import collections
+import copy
+import heapq
+import sys
+import time
+try:
+    from collections import Counter
+except:
+    from .compat import Counter
+
+from six.moves import intern
+
+StatusResponse = collections.namedtuple('StatusResponse', ['code', 'remote_ip', 'ts'])
+Result = collections.namedtuple('Result', ['ts', 'code', 'latency'])
+
+config = {
+    'window': 86400,
+    'buckets': 24,
+    'top_sources': 10,
+    'max_services': 10000,
+    'history': 20,
+}
+
+default_stats = Counter({
+    'expired_services': 0,
+    'evicted_services': 0,
+    'evicted_sources': 0,
+})
+
+stats = Counter()
+
+_services = {}
+# the keys of _services, sorted
+_names = []
+# numbers of buckets, of (source, count) entries across every sketch and of
+# results across every history, kept up to date so that memory use can be reported without walking them all
+_sizes = Counter()
+_next_prune = [0.0]
+# called with the names of the services forgotten, whenever some are
+forget_callbacks = []
+
+
+def _intern(s):
+    # Python 2 only interns byte strings, and tornado hands us unicode
+    return intern(s) if isinstance(s, str) else s
+
+
+class SpaceSaving(object):
+    """Counts of at most `capacity' items. When a new item arrives and the sketch is
+    full, it replaces the item with the smallest count, and inherits that count."""
+    __slots__ = ('capacity', 'counts')
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = {}
+
+    def add(self, item):
+        """Count `item' once
+
+        :returns: the change in the number of items held (0 or 1)
+        """
+        counts = self.counts
+        if item in counts:
+            counts[item] += 1
+            return 0
+        if len(counts) < self.capacity:
+            counts[item] = 1
+            return 1
+        smallest = min(counts, key=counts.get)
+        counts[item] = counts.pop(smallest) + 1
+        stats['evicted_sources'] += 1
+        return 0
+
+
+class _Bucket(object):
+    __slots__ = ('epoch', 'sources')
+
+    def __init__(self, epoch):
+        self.epoch = epoch
+        self.sources = SpaceSaving(config['top_sources'])
+
+
+class ServiceRecord(object):
+    __slots__ = ('name', 'last_seen', 'status', 'buckets', 'results')
+
+    def __init__(self, name):
+        self.name = name
+        self.last_seen = 0.0
+        self.status = None
+        # allocated the first time this service is checked
+        self.buckets = None
+        # allocated the first time it is probed
+        self.results = None
+
+    def source_counts(self, epoch):
+        """The counts by source of every bucket which is still within the window
+        ending in bucket `epoch'"""
+        counts = Counter()
+        for bucket in self.buckets or ():
+            if bucket is not None and bucket.epoch > epoch - config['buckets']:
+                for source, count in bucket.sources.counts.items():
+                    counts[source] += count
+        return counts
+
+
+def configure(window=config['window'], buckets=config['buckets'], top_sources=config['top_sources'],
+              max_services=config['max_services'], history=config['history']):
+    """Configure accounting, and forget everything accounted so far"""
+    config['window'] = window
+    config['buckets'] = buckets
+    config['top_sources'] = top_sources
+    config['max_services'] = max_services
+    config['history'] = history
+    reset()
+
+
+def reset():
+    """Forget everything accounted so far"""
+    stats.clear()
+    stats.update(default_stats)
+    _services.clear()
+    del _names[:]
+    _sizes.clear()
+    _next_prune[0] = 0.0
+
+
+def _bucket_width():
+    return float(config['window']) / config['buckets']
+
+
+def _forget(names):
+    for name in names:
+        record = _services.pop(name)
+        for bucket in record.buckets or ():
+            if bucket is not None:
+                _sizes['buckets'] -= 1
+                _sizes['source_entries'] -= len(bucket.sources.counts)
+        _sizes['results'] -= len(record.results or ())
+    if names:
+        names = frozenset(names)
+        for callback in forget_callbacks:
+            callback(names)
+
+
+def _prune(now):
+    expired = [name for name, record in _services.items() if record.last_seen < now - config['window']]
+    _forget(expired)
+    stats['expired_services'] += len(expired)
+    excess = len(_services) - config['max_services']
+    if excess > 0:
+        # make room for a tenth more, so that this full scan is rare
+        excess += config['max_services'] // 10
+        oldest = heapq.nsmallest(excess, _services.values(), key=lambda record: record.last_seen)
+        _forget([record.name for record in oldest])
+        stats['evicted_services'] += len(oldest)
+    if len(_names) != len(_services):
+        _names[:] = [name for name in _names if name in _services]
+    _next_prune[0] = now + _bucket_width()
+
+
+def record_request(service_name, remote_ip, now=None):
+    """Note that `remote_ip' just checked `service_name'"""
+    if now is None:
+        now = time.time()
+    record = _services.get(service_name)
+    if record is None:
+        service_name = _intern(service_name)
+        record = _services[service_name] = ServiceRecord(service_name)
+        bisect.insort(_names, service_name)
+    record.last_seen = now
+    epoch = current_epoch(now)
+    if record.buckets is None:
+        record.buckets = [None] * config['buckets']
+    slot = epoch % len(record.buckets)
+    bucket = record.buckets[slot]
+    if bucket is None or bucket.epoch != epoch:
+        if bucket is None:
+            _sizes['buckets'] += 1
+        else:
+            _sizes['source_entries'] -= len(bucket.sources.counts)
+        bucket = record.buckets[slot] = _Bucket(epoch)
+    _sizes['source_entries'] += bucket.sources.add(_intern(remote_ip))
+    if now >= _next_prune[0] or len(_services) > config['max_services']:
+        _prune(now)
+
+
+def record_status(service_name, code, remote_ip, ts):
+    """Note the result of a check of `service_name'
+
+    :returns: the StatusResponse of the check before, or None
+    """
+    record = _services.get(service_name)
+    if record is None:
+        return None
+    previous = record.status
+    record.status = StatusResponse(code, _intern(remote_ip), ts)
+    return previous
+
+
+def record_result(service_name, code, latency, ts):
+    """Add the result of a probe of `service_name' to its history"""
+    record = _services.get(service_name)
+    if record is None:
+        return
+    if record.results is None:
+        record.results = collections.deque(maxlen=config['history'])
+    if len(record.results) < config['history']:
+        _sizes['results'] += 1
+    record.results.append(Result(ts, code, latency))
+
+
+def results(service_name):
+    """The Results of the last probes of `service_name', oldest first, or None
+    if it hasn't been checked (lately)"""
+    record = _services.get(service_name)
+    if record is None:
+        return None
+    return list(record.results or ())
+
+
+def last_seen(service_name):
+    """When `service_name' was last checked, or None if it hasn't been (lately)"""
+    record = _services.get(service_name)
+    return record.last_seen if record is not None else None
+
+
+def last_status(service_name):
+    """The StatusResponse of the last check of `service_name', or None"""
+    record = _services.get(service_name)
+    return record.status if record is not None else None
+
+
+def current_epoch(now=None):
+    """The number of the time bucket `now' falls in"""
+    if now is None:
+        now = time.time()
+    return int(now // _bucket_width())
+
+
+def scan(prefix='', after=None, limit=None):
+    """The ServiceRecords of up to `limit' services whose names start with
+    `prefix' and (if `after' is given) sort after `after', in name order"""
+    if after is not None and after >= prefix:
+        start = bisect.bisect_right(_names, after)
+    else:
+        start = bisect.bisect_left(_names, prefix)
+    end = start + limit if limit is not None else len(_names)
+    records = []
+    for name in _names[start:end]:
+        if not name.startswith(prefix):
+            break
+        records.append(_services[name])
+    return records
+
+
+# sizes of the structures above, for an estimate of the memory they use
+_RECORD_SIZE = sys.getsizeof(ServiceRecord('')) + sys.getsizeof(StatusResponse(0, '', 0.0))
+_BUCKET_SIZE = sys.getsizeof(_Bucket(0)) + sys.getsizeof(SpaceSaving(0)) + sys.getsizeof({})
+_POINTER_SIZE = 8
+# a dict slot (hash, key and value), plus the count; the source strings are
+# interned, so shared
+_ENTRY_SIZE = 3 * _POINTER_SIZE + sys.getsizeof(1)
+_RESULT_SIZE = _POINTER_SIZE + sys.getsizeof(Result(0.0, 0, 0.0)) + 2 * sys.getsizeof(0.0)
+
+
+def get_stats():
+    s = copy.copy(stats)
+    s['services'] = len(_services)
+    s['buckets'] = _sizes['buckets']
+    s['source_entries'] = _sizes['source_entries']
+    s['results'] = _sizes['results']
+    s['approx_memory_bytes'] = (
+        sys.getsizeof(_services) +
+        len(_services) * (_RECORD_SIZE + _POINTER_SIZE * (config['buckets'] + 1)) +
+        _sizes['buckets'] * _BUCKET_SIZE +
+        _sizes['source_entries'] * _ENTRY_SIZE +
+        _sizes['results'] * _RESULT_SIZE
+    )
+    return s
+
+
+configure()
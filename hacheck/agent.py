@@ -0,0 +1,129 @@
+"""a listener for HAProxy's agent-check protocol, answering from the same checker chains as the HTTP endpoints"""
+
+import datetime
+import logging
+import time
+
+import tornado.gen
+import tornado.httputil
+import tornado.iostream
+import tornado.tcpserver
+
+from . import accounting
+from . import cache
+from . import handlers
+from . import metrics
+
+log = logging.getLogger('hacheck')
+
+MAX_LINE = 1024
+
+# weight of the newest latency sample in a check's moving average
+LATENCY_ALPHA = 0.3
+
+
+class AgentServer(tornado.tcpserver.TCPServer):
+    """Answers agent checks with `up', `up NN%' or `down' and hangs up
+
+    Connections to a port in `checks' run the check configured for that port;
+    on any other port, the check to run is read from the connection (HAProxy's
+    `agent-send'), written like the path of a single check, e.g. `tcp/foo/8080'.
+
+    If `latency_target' (in seconds) is set, healthy servers whose probes have
+    recently been slower than that get a proportionally lower weight, down to
+    `min_weight' percent, instead of being marked down.
+    """
+
+    def __init__(self, checks=None, latency_target=None, min_weight=10, timeout=10, io_loop=None):
+        super(AgentServer, self).__init__(io_loop=io_loop)
+        self.checks = checks or {}
+        self.latency_target = latency_target
+        self.min_weight = min_weight
+        self.timeout = timeout
+        self.latencies = {}
+        # the service each check in `latencies' checks, so that its latency
+        # is forgotten along with the service
+        self.check_services = {}
+        accounting.forget_callbacks.append(self.forget)
+
+    def stop(self):
+        super(AgentServer, self).stop()
+        if self.forget in accounting.forget_callbacks:
+            accounting.forget_callbacks.remove(self.forget)
+
+    def forget(self, service_names):
+        for check, service_name in list(self.check_services.items()):
+            if service_name in service_names:
+                del self.check_services[check]
+                self.latencies.pop(check, None)
+
+    @tornado.gen.coroutine
+    def read_check(self, stream):
+        def timed_out():
+            stream.close()
+
+        handle = self.io_loop.add_timeout(datetime.timedelta(seconds=self.timeout), timed_out)
+        try:
+            line = yield stream.read_until(b'\n', max_bytes=MAX_LINE)
+        finally:
+            self.io_loop.remove_timeout(handle)
+        raise tornado.gen.Return(line.decode('utf-8', 'replace').strip())
+
+    def record_latency(self, check, latency):
+        previous = self.latencies.get(check)
+        if previous is None:
+            self.latencies[check] = latency
+        else:
+            self.latencies[check] = LATENCY_ALPHA * latency + (1 - LATENCY_ALPHA) * previous
+
+    def weight(self, check):
+        latency = self.latencies.get(check)
+        if self.latency_target is None or latency is None or latency <= self.latency_target:
+            return 100
+        return max(self.min_weight, int(100 * self.latency_target / latency))
+
+    @tornado.gen.coroutine
+    def run_check(self, check, remote_ip):
+        parsed = handlers.parse_check(check)
+        if parsed is None:
+            log.warning('Unknown agent check %r from %s', check, remote_ip)
+            raise tornado.gen.Return('down')
+        checkers, service_name, port, query, query_params = parsed
+        start = time.time()
+        misses = cache.stats['misses']
+        # run_checkers starts every checker before it first yields, so any
+        # cache miss (that is, a real probe) has been counted by now
+        result = handlers.run_checkers(checkers, service_name, port, query, query_params=query_params,
+                                       headers=tornado.httputil.HTTPHeaders(), remote_ip=remote_ip)
+        probed = cache.stats['misses'] != misses
+        code, message = yield result
+        latency = time.time() - start
+        metrics.record_request(service_name, handlers.response_code(code), latency)
+        if code > 200:
+            raise tornado.gen.Return('down')
+        if probed:
+            self.check_services[check] = service_name
+            self.record_latency(check, latency)
+        if self.latency_target is not None:
+            # HAProxy keeps the last weight it was sent until it is sent
+            # another, so once weights are in use, always send one
+            raise tornado.gen.Return('up %d%%' % self.weight(check))
+        raise tornado.gen.Return('up')
+
+    @tornado.gen.coroutine
+    def handle_stream(self, stream, address):
+        remote_ip = address[0] if address else 'agent'
+        try:
+            check = self.checks.get(stream.socket.getsockname()[1])
+            if check is None:
+                check = yield self.read_check(stream)
+            try:
+                reply = yield self.run_check(check, remote_ip)
+            except Exception:
+                log.exception('Unhandled exception running agent check %s', check)
+                reply = 'down'
+            yield stream.write(reply.encode('ascii') + b'\n')
+        except tornado.iostream.StreamClosedError:
+            pass
+        finally:
+            stream.close()
@@ -0,0 +1 @@
+"""checkers for particular backends, each imported only when a chain using it first runs (see registry)"""
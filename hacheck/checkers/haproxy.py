@@ -0,0 +1,89 @@
+"""checks of a service's state in HAProxy, from its stats page or stats socket"""
+
+import socket
+
+import tornado.gen
+import tornado.httpclient
+import tornado.iostream
+
+from .. import cache
+from .. import checker
+from .. import config
+from .. import haproxy
+
+
+# One fetch of the stats page per HAProxy port and cache window, shared by
+# every service checked against that HAProxy
+@cache.cached
+@tornado.gen.coroutine
+def fetch_haproxy_stats(port, io_loop):
+    path = 'http://127.0.0.1:%d/;csv' % (port,)
+    request = tornado.httpclient.HTTPRequest(
+        path,
+        method='GET',
+        request_timeout=checker.TIMEOUT
+    )
+    http_client = tornado.httpclient.AsyncHTTPClient(io_loop=io_loop)
+    response = yield http_client.fetch(request)
+    raise tornado.gen.Return(haproxy.parse_stats(response.body.decode('utf-8')))
+
+
+def haproxy_status(table, service_name, server_name):
+    if server_name == 'BACKEND':
+        name = service_name
+    else:
+        name = '%s/%s' % (service_name, server_name)
+    status = table.get((service_name, server_name))
+    if status is None:
+        return 500, '%s is not found' % name
+    elif haproxy.is_up(status):
+        return 200, '%s is %s' % (name, status)
+    else:
+        return 500, '%s is %s' % (name, status)
+
+
+@cache.cached
+@tornado.gen.coroutine
+def check_haproxy(service_name, port, check_path, io_loop, query_params, headers):
+    server_name = check_path.strip('/') or 'BACKEND'
+    try:
+        table = yield fetch_haproxy_stats(port, io_loop=io_loop)
+        code, reason = haproxy_status(table, service_name, server_name)
+    except tornado.httpclient.HTTPError as exc:
+        code = exc.code
+        reason = exc.response.body if exc.response else ""
+    except Exception as e:
+        code = 599
+        reason = 'Unhandled exception %s %s %s' % (e, service_name, port)
+    raise tornado.gen.Return((code, reason))
+
+
+@cache.cached
+@tornado.gen.coroutine
+def fetch_haproxy_socket_stats(path, io_loop):
+    client = haproxy.stats_socket(path, timeout=checker.TIMEOUT, io_loop=io_loop)
+    table = yield client.show_stat()
+    raise tornado.gen.Return(table)
+
+
+@cache.cached
+@tornado.gen.coroutine
+def check_haproxy_socket(service_name, port, check_path, io_loop, query_params, headers):
+    path_template = config.config['haproxy_stats_socket']
+    if path_template is None:
+        raise tornado.gen.Return((500, 'No haproxy_stats_socket in config file'))
+    path = path_template.format(port=port)
+    server_name = check_path.strip('/') or 'BACKEND'
+    try:
+        table = yield fetch_haproxy_socket_stats(path, io_loop=io_loop)
+        code, reason = haproxy_status(table, service_name, server_name)
+    except checker.Timeout as e:
+        code = 503
+        reason = 'HAProxy stats socket %s: %s' % (path, e)
+    except (socket.error, tornado.iostream.StreamClosedError) as e:
+        code = 503
+        reason = 'Unable to read stats from %s: %s' % (path, e)
+    except Exception as e:
+        code = 599
+        reason = 'Unhandled exception %s %s %s' % (e, service_name, path)
+    raise tornado.gen.Return((code, reason))
@@ -0,0 +1,62 @@
+"""checks over HTTP connections which are kept alive between checks"""
+
+import os
+import socket
+import time
+
+import tornado.gen
+import tornado.iostream
+
+from .. import cache
+from .. import checker
+from .. import config
+from .. import keepalive
+
+
+#
+# GET `check_path' from a keepalive.HTTPPool to `target', the way check_http
+# would.
+#
+@tornado.gen.coroutine
+def check_keepalive_http(pool, target, service_name, check_path, query_params, headers):
+    if not check_path.startswith("/"):
+        check_path = "/" + check_path
+    start = time.time()
+    try:
+        response = yield pool.fetch(check_path + ('?' + query_params if query_params else ''),
+                                    checker.http_headers(service_name, headers))
+    except checker.Timeout:
+        raise tornado.gen.Return((503, 'Request to %s timed out after %.2fs' % (target, time.time() - start)))
+    except keepalive.ProtocolError as e:
+        raise tornado.gen.Return((500, 'Bad response from %s: %s' % (target, e)))
+    except (socket.error, tornado.iostream.StreamClosedError) as e:
+        raise tornado.gen.Return((503, 'Unexpected error %s after %.2fs' % (e, time.time() - start)))
+    raise tornado.gen.Return((response.code, response.body))
+
+
+# Like check_http, but `socket_name' (in place of the port) names a UNIX socket
+# in http_unix_socket_dir, to which connections are kept alive between checks
+@cache.cached
+@tornado.gen.coroutine
+def check_http_unix(service_name, socket_name, check_path, io_loop, query_params, headers):
+    socket_dir = config.config['http_unix_socket_dir']
+    if socket_dir is None:
+        raise tornado.gen.Return((500, 'No http_unix_socket_dir in config file'))
+    if socket_name in ('.', '..') or '/' in socket_name:
+        raise tornado.gen.Return((400, 'Bad socket name %s' % socket_name))
+    path = os.path.join(socket_dir, socket_name)
+    pool = keepalive.pool(path, family=socket.AF_UNIX, size=config.config['http_pool_size'], timeout=checker.TIMEOUT,
+                          io_loop=io_loop)
+    r = yield check_keepalive_http(pool, path, service_name, check_path, query_params, headers)
+    raise tornado.gen.Return(r)
+
+
+# Like check_http, over HTTPS; connections are kept alive between checks, and
+# TLS sessions resumed when they have to be reopened
+@cache.cached
+@tornado.gen.coroutine
+def check_https(service_name, port, check_path, io_loop, query_params, headers):
+    pool = keepalive.tls_pool(('127.0.0.1', port), ca_file=config.config['https_ca_file'],
+                              size=config.config['http_pool_size'], timeout=checker.TIMEOUT, io_loop=io_loop)
+    r = yield check_keepalive_http(pool, 'port %d' % port, service_name, check_path, query_params, headers)
+    raise tornado.gen.Return(r)
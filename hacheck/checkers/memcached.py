@@ -0,0 +1,90 @@
+"""checks of memcached servers and their stats"""
+
+import socket
+import time
+
+import tornado.gen
+import tornado.iostream
+
+try:
+    from urllib.parse import parse_qs
+except ImportError:
+    from urlparse import parse_qs
+
+from .. import cache
+from .. import checker
+from .. import memcached
+
+
+def memcached_connection(port, io_loop):
+    return memcached.persistent_connection(port, timeout=checker.TIMEOUT, io_loop=io_loop)
+
+
+@cache.cached
+@tornado.gen.coroutine
+def fetch_memcached_version(port, io_loop):
+    version = yield memcached_connection(port, io_loop).version()
+    raise tornado.gen.Return(version)
+
+
+# `stats' is fetched once per port and cache window, and every threshold query
+# against that port evaluated against the one reply; rates are per second since
+# the reply before
+@cache.cached
+@tornado.gen.coroutine
+def fetch_memcached_stats(port, io_loop):
+    snapshot = yield memcached_connection(port, io_loop).fetch_stats()
+    raise tornado.gen.Return(snapshot)
+
+
+def parse_thresholds(query_params):
+    """Parse `max_<stat>=N' and `min_<stat>=N' query parameters
+
+    :returns: list of (stat, bound, limit), sorted by stat
+    :raises: ValueError if a limit is not a number
+    """
+    thresholds = []
+    for key, values in parse_qs(query_params).items():
+        for bound in ('max', 'min'):
+            if key.startswith(bound + '_'):
+                thresholds.append((key[len(bound) + 1:], bound, float(values[-1])))
+    return sorted(thresholds)
+
+
+def memcached_thresholds_status(snapshot, thresholds):
+    for name, bound, limit in thresholds:
+        try:
+            value = snapshot.get(name)
+        except KeyError:
+            return (500, 'memcached has no stat %s' % name)
+        if value is None:
+            # rates are unknown until the second sample
+            continue
+        if (bound == 'max' and value > limit) or (bound == 'min' and value < limit):
+            return (500, '%s is %g, %s is %g' % (name, value, bound, limit))
+    return (200, 'memcached stats within thresholds')
+
+
+# Not cached itself: `version' and `stats' are, and checks with different
+# thresholds must not share a result
+@tornado.gen.coroutine
+def check_memcached(service_name, port, query, io_loop, query_params, headers):
+    try:
+        thresholds = parse_thresholds(query_params)
+    except ValueError:
+        raise tornado.gen.Return((400, 'Thresholds must be numbers'))
+    start = time.time()
+    try:
+        if thresholds or (query or '').strip('/') == 'stats':
+            snapshot = yield fetch_memcached_stats(port, io_loop=io_loop)
+            r = memcached_thresholds_status(snapshot, thresholds)
+        else:
+            version = yield fetch_memcached_version(port, io_loop=io_loop)
+            r = (200, 'memcached version %s' % version)
+    except checker.Timeout:
+        r = (503, 'memcached timed out after %.2fs' % (time.time() - start))
+    except memcached.MemcachedError as e:
+        r = (500, 'memcached sez %s' % e)
+    except (socket.error, tornado.iostream.StreamClosedError) as e:
+        r = (503, 'Unexpected error %s after %.2fs' % (e, time.time() - start))
+    raise tornado.gen.Return(r)
@@ -0,0 +1,127 @@
+"""checks of MySQL servers and replicas"""
+
+import socket
+import time
+
+import tornado.gen
+import tornado.iostream
+
+try:
+    from urllib.parse import parse_qs
+except ImportError:
+    from urlparse import parse_qs
+
+from .. import cache
+from .. import checker
+from .. import config
+from .. import mysql
+
+
+@cache.cached
+@tornado.gen.coroutine
+def check_mysql(service_name, port, query, io_loop, query_params, headers):
+    username = config.config.get('mysql_username', None)
+    password = config.config.get('mysql_password', None)
+    if username is None or password is None:
+        raise tornado.gen.Return((500, 'No MySQL username/pasword in config file'))
+
+    if config.config['mysql_persistent']:
+        r = yield check_mysql_ping(port, username, password, io_loop)
+        raise tornado.gen.Return(r)
+
+    def timed_out(duration):
+        raise tornado.gen.Return((503, 'MySQL timed out after %.2fs' % (duration)))
+
+    conn = mysql.MySQLClient(port=port, global_timeout=checker.TIMEOUT, io_loop=io_loop)
+    response = yield conn.connect(username, password)
+    if not response.OK:
+        raise tornado.gen.Return((500, 'MySQL sez %s' % response))
+    yield conn.quit()
+    raise tornado.gen.Return((200, 'MySQL connect response: %s' % response))
+
+
+def mysql_connection(port, username, password, io_loop):
+    return mysql.persistent_connection(port, username, password, timeout=checker.TIMEOUT, io_loop=io_loop)
+
+
+#
+# Wait for the reply to a command sent over a persistent MySQL connection and
+# process it using `callback'.
+#
+@tornado.gen.coroutine
+def check_mysql_reply(reply_future, callback):
+    start = time.time()
+    try:
+        reply = yield reply_future
+    except checker.Timeout:
+        raise tornado.gen.Return((503, 'MySQL timed out after %.2fs' % (time.time() - start)))
+    except mysql.MySQLError as e:
+        raise tornado.gen.Return((500, 'MySQL sez %s' % e.response))
+    except (socket.error, tornado.iostream.StreamClosedError) as e:
+        raise tornado.gen.Return((503, 'Unexpected error %s after %.2fs' % (e, time.time() - start)))
+    raise tornado.gen.Return(callback(reply))
+
+
+@tornado.gen.coroutine
+def check_mysql_ping(port, username, password, io_loop):
+    conn = mysql_connection(port, username, password, io_loop)
+
+    def cb(response):
+        return (
+            200,
+            'MySQL ping response: %s (ping %.4fs, connect %.4fs)' % (response, conn.ping_time, conn.connect_time)
+        )
+
+    r = yield check_mysql_reply(conn.ping(), cb)
+    raise tornado.gen.Return(r)
+
+
+# SHOW SLAVE STATUS is run once per port and cache window; every max_lag is
+# evaluated against that one result
+@cache.cached
+@tornado.gen.coroutine
+def fetch_mysql_slave_status(port, username, password, io_loop):
+    result = yield mysql_connection(port, username, password, io_loop).query('SHOW SLAVE STATUS')
+    rows = result.dicts()
+    if not rows:
+        raise tornado.gen.Return(None)
+    raise tornado.gen.Return(dict(
+        (column, value.decode('utf-8') if value is not None else None)
+        for column, value in rows[0].items()
+    ))
+
+
+def replica_status(status, max_lag):
+    if status is None:
+        return (500, 'Not a replica')
+    for thread, error in (('Slave_IO_Running', 'Last_IO_Error'), ('Slave_SQL_Running', 'Last_SQL_Error')):
+        if status.get(thread) != 'Yes':
+            return (500, '%s is %s: %s' % (thread, status.get(thread), status.get(error)))
+    lag = status.get('Seconds_Behind_Master')
+    if lag is None:
+        return (500, 'Replication lag is unknown')
+    lag = int(lag)
+    if max_lag is not None and lag > max_lag:
+        return (500, 'Replication lag %ds exceeds %ds' % (lag, max_lag))
+    return (200, 'Replication lag %ds' % lag)
+
+
+# Not cached itself: SHOW SLAVE STATUS is, and checks with different max_lag
+# must not share a result
+@tornado.gen.coroutine
+def check_mysql_replica(service_name, port, query, io_loop, query_params, headers):
+    username = config.config.get('mysql_username', None)
+    password = config.config.get('mysql_password', None)
+    if username is None or password is None:
+        raise tornado.gen.Return((500, 'No MySQL username/pasword in config file'))
+    max_lag = parse_qs(query_params).get('max_lag')
+    try:
+        max_lag = int(max_lag[-1]) if max_lag else None
+    except ValueError:
+        raise tornado.gen.Return((400, 'max_lag must be an integer'))
+
+    r = yield check_mysql_reply(
+        fetch_mysql_slave_status(port, username, password, io_loop=io_loop),
+        lambda status: replica_status(status, max_lag)
+    )
+    raise tornado.gen.Return(r)
@@ -0,0 +1,73 @@
+"""checks of PostgreSQL servers and their role"""
+
+import socket
+import time
+
+import tornado.gen
+import tornado.iostream
+
+from .. import cache
+from .. import checker
+from .. import config
+from .. import postgres
+
+
+#
+# Wait for the reply to a command sent to PostgreSQL and process it using
+# `callback'.
+#
+@tornado.gen.coroutine
+def check_postgres_reply(reply_future, callback):
+    start = time.time()
+    try:
+        reply = yield reply_future
+    except checker.Timeout:
+        raise tornado.gen.Return((503, 'PostgreSQL timed out after %.2fs' % (time.time() - start)))
+    except postgres.PostgresError as e:
+        raise tornado.gen.Return((500, 'PostgreSQL sez %s' % e))
+    except (socket.error, tornado.iostream.StreamClosedError) as e:
+        raise tornado.gen.Return((503, 'Unexpected error %s after %.2fs' % (e, time.time() - start)))
+    raise tornado.gen.Return(callback(reply))
+
+
+def gen_postgres_role_cb(role):
+    def cb(rows):
+        actual = 'replica' if rows and rows[0][0] == b't' else 'primary'
+        if actual != role:
+            return (500, 'PostgreSQL is a %s, not a %s' % (actual, role))
+        return (200, 'PostgreSQL is a %s' % actual)
+    return cb
+
+
+@cache.cached
+@tornado.gen.coroutine
+def check_postgres(service_name, port, query, io_loop, query_params, headers):
+    user = config.config['postgres_user']
+    if user is None:
+        raise tornado.gen.Return((500, 'No PostgreSQL user in config file'))
+    role = (query or '').strip('/')
+    if role not in ('', 'primary', 'replica'):
+        raise tornado.gen.Return((400, 'Unknown role %s, expected primary or replica' % role))
+
+    persistent = config.config['postgres_persistent']
+    args = (port, user, config.config['postgres_password'], config.config['postgres_database'])
+    if persistent:
+        conn = postgres.persistent_connection(*args, timeout=checker.TIMEOUT, io_loop=io_loop)
+    else:
+        conn = postgres.PostgresConnection(*args, timeout=checker.TIMEOUT, io_loop=io_loop)
+
+    if role:
+        reply, cb = conn.query('SELECT pg_is_in_recovery()'), gen_postgres_role_cb(role)
+    elif persistent:
+        reply, cb = conn.query('SELECT 1'), lambda rows: (
+            200, 'PostgreSQL SELECT 1 in %.4fs (connect %.4fs)' % (conn.query_time, conn.connect_time)
+        )
+    else:
+        # the cheap check: log in, wait for ReadyForQuery, and hang up
+        reply, cb = conn.startup(), lambda _: (200, 'PostgreSQL ready for query in %.4fs' % conn.connect_time)
+    try:
+        r = yield check_postgres_reply(reply, cb)
+    finally:
+        if not persistent:
+            conn.terminate()
+    raise tornado.gen.Return(r)
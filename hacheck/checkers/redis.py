@@ -0,0 +1,120 @@
+"""checks of Redis and Redis Sentinel"""
+
+import socket
+import time
+
+import tornado.gen
+import tornado.iostream
+
+try:
+    from urllib.parse import parse_qs
+except ImportError:
+    from urlparse import parse_qs
+
+from .. import cache
+from .. import checker
+from .. import config
+from .. import redis
+
+
+def redis_pool(port, io_loop):
+    return redis.pool(
+        port,
+        size=config.config['redis_pool_size'],
+        password=config.config['redis_password'],
+        timeout=checker.TIMEOUT,
+        io_loop=io_loop,
+    )
+
+
+# INFO is fetched and parsed once per port and cache window, and the snapshot
+# shared by the JSON view and every match query against that port
+@cache.cached
+@tornado.gen.coroutine
+def fetch_redis_info(port, io_loop):
+    reply = yield redis_pool(port, io_loop).execute('INFO')
+    raise tornado.gen.Return(redis.InfoSnapshot(reply))
+
+
+#
+# Wait for the reply to `command' sent to a Redis (or Sentinel) instance and
+# process it using `callback'.
+#
+@tornado.gen.coroutine
+def check_redis(reply_future, command, callback):
+    start = time.time()
+    try:
+        reply = yield reply_future
+    except checker.Timeout:
+        raise tornado.gen.Return((
+            503,
+            'Connection timed out after %.2fs' % (time.time() - start)
+        ))
+    except redis.RedisError as e:
+        raise tornado.gen.Return((500, 'Sent %s, got back error %s' % (command, e)))
+    except (socket.error, tornado.iostream.StreamClosedError, redis.ProtocolError) as e:
+        raise tornado.gen.Return((
+            503,
+            'Unexpected error %s after %.2fs' % (e, time.time() - start)
+        ))
+    raise tornado.gen.Return(callback(reply))
+
+
+@cache.cached
+@tornado.gen.coroutine
+def check_redis_sentinel(service_name, port, query, io_loop, query_params, headers):
+    def cb(data):
+        if data != b'PONG':
+            return (500, 'Sent PING, got back %s' % data)
+        else:
+            return (200, 'Sent PING, got back +PONG')
+
+    r = yield check_redis(redis_pool(port, io_loop).execute('PING'), 'PING', cb)
+    raise tornado.gen.Return(r)
+
+
+#
+# Generate a callback for processing a redis or sentinel INFO snapshot.
+#
+def gen_info_cb(query, query_params):
+    mdict = {}
+    if query == 'match':
+        mdict = parse_qs(query_params)
+
+    def cb(snapshot):
+        if 'redis_version' not in snapshot.fields:
+            return (500, 'Sent INFO, got back %s' % snapshot.json)
+
+        # If we are not doing a 'match' query, then we just return the
+        # INFO result.
+        if not mdict:
+            return (200, snapshot.json)
+
+        found = snapshot.match(mdict)
+        if found is not None:
+            return (200, 'Match found: field %s, value %s' % found)
+
+        return (500, 'No matching field found')
+
+    return cb
+
+
+# Not cached themselves: the INFO snapshot is, and match queries with
+# different parameters must not share a result
+@tornado.gen.coroutine
+def check_redis_info(service_name, port, query, io_loop, query_params, headers):
+    cb = gen_info_cb(query, query_params)
+    r = yield check_redis(fetch_redis_info(port, io_loop=io_loop), 'INFO', cb)
+    raise tornado.gen.Return(r)
+
+
+# Answered straight from the pub/sub-maintained table if we are subscribed to
+# this sentinel, and by polling INFO otherwise
+@tornado.gen.coroutine
+def check_sentinel_info(service_name, port, query, io_loop, query_params, headers):
+    cb = gen_info_cb(query, query_params)
+    monitor = redis.sentinel_monitor(port)
+    if monitor is not None and monitor.subscribed:
+        raise tornado.gen.Return(cb(monitor.snapshot()))
+    r = yield check_redis(fetch_redis_info(port, io_loop=io_loop), 'INFO', cb)
+    raise tornado.gen.Return(r)
@@ -0,0 +1,34 @@
+"""checks run by whitelisted scripts"""
+
+import tornado.gen
+
+from .. import cache
+from .. import config
+from .. import scripts
+
+
+# Cached like any other check, so each script runs at most once per service,
+# port and cache window however often it is asked for
+@cache.cached
+@tornado.gen.coroutine
+def check_exec(service_name, port, query, io_loop, query_params, headers):
+    name = (query or '').strip('/')
+    command = config.config['exec_commands'].get(name)
+    if command is None:
+        raise tornado.gen.Return((404, 'No command %s in config file' % name))
+    timeout = command['timeout'] or config.config['exec_timeout']
+    pool = scripts.pool(config.config['exec_concurrency'], io_loop=io_loop)
+    try:
+        result = yield pool.run(
+            command['argv'],
+            env=scripts.environment(service_name, port),
+            timeout=timeout,
+            max_output=config.config['exec_max_output'],
+        )
+    except OSError as e:
+        raise tornado.gen.Return((500, 'Could not run %s: %s' % (name, e)))
+    if result.timed_out:
+        raise tornado.gen.Return((503, 'Command %s timed out after %.2fs' % (name, timeout)))
+    code = command['exit_codes'].get(result.returncode, 200 if result.returncode == 0 else 503)
+    output = result.output.decode('utf-8', 'replace').strip()
+    raise tornado.gen.Return((code, output or 'Command %s exited with %d' % (name, result.returncode)))
@@ -2,7 +2,11 @@
 
 import contextlib
 import collections
+import hashlib
+import hmac
+import struct
 import sys
+import time
 
 
 def Counter(*args):
@@ -57,6 +61,7 @@ def nested3(*managers):
 def bchr3(c):
     return bytes((c,))
 
+
 def bchr2(c):
     return chr(c)
 
@@ -67,3 +72,24 @@ if sys.version_info < (3, 0):
 else:
     nested = nested3
     bchr = bchr3
+
+if sys.version_info < (3, 3):
+    # there's no monotonic clock in the standard library; the wall clock will have to do
+    monotonic = time.time
+else:
+    monotonic = time.monotonic
+
+
+def pbkdf2_hmac2(hash_name, password, salt, iterations):
+    """PBKDF2 (RFC 2898), for Pythons before 2.7.8"""
+    digest = getattr(hashlib, hash_name)
+    u = hmac.new(password, salt + struct.pack('!I', 1), digest).digest()
+    result = bytearray(u)
+    for _ in range(iterations - 1):
+        u = hmac.new(password, u, digest).digest()
+        for i, c in enumerate(bytearray(u)):
+            result[i] ^= c
+    return bytes(result)
+
+
+pbkdf2_hmac = getattr(hashlib, 'pbkdf2_hmac', pbkdf2_hmac2)
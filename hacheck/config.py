@@ -1,3 +1,5 @@
+import shlex
+
 import yaml
 
 
@@ -8,13 +10,97 @@ def max_or_int(some_str_value):
         return int(some_str_value)
 
 
+def positive_int(some_str_value):
+    value = int(some_str_value)
+    if value < 1:
+        raise ValueError('must be at least 1')
+    return value
+
+
+def list_of_ints(some_list_value):
+    return [int(v) for v in some_list_value]
+
+
+def dict_of_int_to_str(some_dict_value):
+    return dict((int(k), str(v)) for k, v in some_dict_value.items())
+
+
+def dict_of_str_to_str(some_dict_value):
+    return dict((str(k), str(v)) for k, v in some_dict_value.items())
+
+
+def dict_of_str_to_list_of_str(some_dict_value):
+    return dict((str(k), [str(v) for v in vs]) for k, vs in some_dict_value.items())
+
+
+def exec_commands(some_dict_value):
+    """Each command is either a command line, or a dict of `command' (a command
+    line or a list of arguments) and, optionally, `timeout' and `exit_codes' (a
+    map of exit code to HTTP status)"""
+    commands = {}
+    for name, command in some_dict_value.items():
+        if not isinstance(command, dict):
+            command = {'command': command}
+        argv = command['command']
+        if not isinstance(argv, list):
+            argv = shlex.split(argv)
+        commands[str(name)] = {
+            'argv': [str(arg) for arg in argv],
+            'timeout': float(command['timeout']) if 'timeout' in command else None,
+            'exit_codes': dict((int(k), int(v)) for k, v in command.get('exit_codes', {}).items()),
+        }
+    return commands
+
+
 DEFAULTS = {
     'cache_time': (float, 10.0),
     'service_name_header': (str, None),
     'log_path': (str, 'stderr'),
     'mysql_username': (str, None),
     'mysql_password': (str, None),
-    'rlimit_nofile': (max_or_int, None)
+    'mysql_persistent': (bool, False),
+    'postgres_user': (str, None),
+    'postgres_password': (str, None),
+    'postgres_database': (str, None),
+    'postgres_persistent': (bool, False),
+    'rlimit_nofile': (max_or_int, None),
+    'server_timing': (bool, False),
+    'loop_lag_interval_ms': (int, 100),
+    'blocking_threshold_ms': (int, None),
+    'accounting_window': (int, 86400),
+    'accounting_buckets': (int, 24),
+    'accounting_top_sources': (int, 10),
+    'accounting_max_services': (int, 10000),
+    'events_replay': (int, 100),
+    'events_buffer': (int, 1000),
+    'history_size': (int, 20),
+    'flap_threshold': (int, 0),
+    'flap_stable_probes': (int, 5),
+    'flap_cache_factor': (float, 3),
+    'batch_concurrency': (positive_int, 50),
+    'batch_max_checks': (positive_int, 1000),
+    'agent_port': (int, None),
+    'agent_checks': (dict_of_int_to_str, {}),
+    'agent_latency_target_ms': (float, None),
+    'agent_min_weight': (int, 10),
+    'checkers': (dict_of_str_to_str, {}),
+    'protocols': (dict_of_str_to_list_of_str, {}),
+    'exec_commands': (exec_commands, {}),
+    'exec_concurrency': (int, 4),
+    'exec_timeout': (float, 10.0),
+    'exec_max_output': (int, 4096),
+    'listen_refresh_ms': (int, 1000),
+    'haproxy_stats_socket': (str, None),
+    'http_unix_socket_dir': (str, None),
+    'http_pool_size': (int, 2),
+    'https_ca_file': (str, None),
+    'statsd_address': (str, None),
+    'statsd_prefix': (str, 'hacheck'),
+    'statsd_flush_ms': (int, 1000),
+    'statsd_packet_size': (int, 1432),
+    'redis_password': (str, None),
+    'redis_pool_size': (int, 2),
+    'sentinel_ports': (list_of_ints, []),
 }
 
 
@@ -29,5 +115,8 @@ def load_from(path):
         for key, value in c.items():
             if key in DEFAULTS:
                 constructor, default = DEFAULTS[key]
-                config[key] = constructor(value)
+                try:
+                    config[key] = constructor(value)
+                except (TypeError, ValueError) as e:
+                    raise ValueError('Bad %s %r in %s: %s' % (key, value, path, e))
     return config
@@ -0,0 +1,113 @@
+"""long-lived stream connections, shared by the protocol clients that keep their backends connected"""
+
+import datetime
+import socket
+import time
+
+import tornado.gen
+import tornado.ioloop
+import tornado.iostream
+
+
+class Timeout(Exception):
+    pass
+
+
+class PersistentConnection(object):
+    """A lazily (re)connected IOStream to `address'
+
+    Subclasses override `handshake' for per-connection setup (authentication,
+    switching protocol modes, ...) and run their requests through `call', which
+    reconnects as needed and closes the connection if anything goes wrong, so
+    that the next request starts from a clean slate. Protocols that answer one
+    request at a time use `command' instead, which queues behind the previous one.
+    """
+
+    def __init__(self, address, family=socket.AF_INET, timeout=10, io_loop=None):
+        self.address = address
+        self.family = family
+        self.timeout = timeout
+        if io_loop is None:
+            io_loop = tornado.ioloop.IOLoop.current()
+        self.io_loop = io_loop
+        self.stream = None
+        self._connecting = None
+        self._last = None
+        self.connects = 0
+        self.connect_time = None
+
+    def closed(self):
+        return self.stream is None or self.stream.closed()
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.close()
+        self.stream = None
+
+    def make_stream(self, sock):
+        return tornado.iostream.IOStream(sock, io_loop=self.io_loop)
+
+    @tornado.gen.coroutine
+    def handshake(self):
+        pass
+
+    def ensure_connected(self):
+        """Connect (and handshake) unless already connected. Concurrent callers
+        share a single connection attempt."""
+        if self._connecting is None or (self._connecting.done() and self.closed()):
+            self._connecting = self._connect()
+        return self._connecting
+
+    @tornado.gen.coroutine
+    def _connect(self):
+        start = time.time()
+        stream = self.stream = self.make_stream(socket.socket(self.family, socket.SOCK_STREAM, 0))
+        try:
+            yield stream.connect(self.address)
+        except tornado.iostream.StreamClosedError:
+            if stream.error is not None:
+                raise stream.error
+            raise
+        yield self.handshake()
+        self.connects += 1
+        self.connect_time = time.time() - start
+
+    @tornado.gen.coroutine
+    def call(self, func, *args):
+        """Connect if necessary, then run the coroutine `func(*args)'
+
+        :raises: Timeout if connecting and running `func' take longer than `timeout'
+        """
+        timed_out = []
+
+        def on_timeout():
+            timed_out.append(True)
+            self.close()
+
+        handle = self.io_loop.add_timeout(datetime.timedelta(seconds=self.timeout), on_timeout)
+        try:
+            yield self.ensure_connected()
+            result = yield func(*args)
+        except Exception:
+            self.close()
+            if timed_out:
+                raise Timeout('Timed out after %.2fs' % self.timeout)
+            raise
+        finally:
+            self.io_loop.remove_timeout(handle)
+        raise tornado.gen.Return(result)
+
+    @tornado.gen.coroutine
+    def _after(self, previous, func, *args):
+        if previous is not None:
+            try:
+                yield previous
+            except Exception:
+                pass
+        result = yield self.call(func, *args)
+        raise tornado.gen.Return(result)
+
+    def command(self, func, *args):
+        """Like `call', but only once every command issued before it has finished"""
+        self._last = self._after(self._last, func, *args)
+        return self._last
@@ -0,0 +1,124 @@
+"""changes in the results services are checked with, published as they happen to the subscribers of /events
+
+The most recent `replay' events are kept, so that a subscriber can catch up on
+what it missed (since it last connected, or just lately). Each subscriber has a
+buffer of at most `buffer' events waiting to be sent; a subscriber that doesn't
+keep up loses the oldest, and is told how many it lost.
+"""
+
+import collections
+import copy
+try:
+    from collections import Counter
+except:
+    from .compat import Counter
+
+import tornado.concurrent
+
+Event = collections.namedtuple('Event', ['id', 'service', 'old_code', 'new_code', 'remote_ip', 'ts'])
+
+config = {
+    'replay': 100,
+    'buffer': 1000,
+}
+
+default_stats = Counter({
+    'published': 0,
+    'dropped': 0,
+})
+
+stats = Counter()
+
+_history = collections.deque(maxlen=config['replay'])
+_subscribers = set()
+_next_id = [1]
+
+
+def configure(replay=config['replay'], buffer_size=config['buffer']):
+    """Configure events, forgetting past ones"""
+    global _history
+    config['replay'] = replay
+    config['buffer'] = buffer_size
+    _history = collections.deque(maxlen=replay)
+    stats.clear()
+    stats.update(default_stats)
+
+
+class Subscriber(object):
+    def __init__(self, buffer_size):
+        self.buffer_size = buffer_size
+        self.events = collections.deque()
+        # events lost since they were last taken
+        self.dropped = 0
+        self.closed = False
+        self._waiter = None
+
+    def push(self, event):
+        if len(self.events) >= self.buffer_size:
+            self.events.popleft()
+            self.dropped += 1
+            stats['dropped'] += 1
+        self.events.append(event)
+        self._wake()
+
+    def _wake(self):
+        waiter, self._waiter = self._waiter, None
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    def wait(self):
+        """A Future resolved as soon as there are events to take (or the
+        subscription is closed)"""
+        future = tornado.concurrent.Future()
+        if self.events or self.dropped or self.closed:
+            future.set_result(None)
+        else:
+            self._waiter = future
+        return future
+
+    def take(self):
+        """:returns: (the events waiting, how many were lost since the last take)"""
+        events = list(self.events)
+        self.events.clear()
+        dropped, self.dropped = self.dropped, 0
+        return events, dropped
+
+    def close(self):
+        _subscribers.discard(self)
+        self.closed = True
+        self._wake()
+
+
+def subscribe(replay=0, last_event_id=None):
+    """Subscribe to events from now on, preceded by those after `last_event_id'
+    or else by the last `replay' events (of those kept)"""
+    subscriber = Subscriber(config['buffer'])
+    if last_event_id is not None:
+        past = [event for event in _history if event.id > last_event_id]
+    elif replay > 0:
+        past = list(_history)[-replay:]
+    else:
+        past = []
+    for event in past:
+        subscriber.push(event)
+    _subscribers.add(subscriber)
+    return subscriber
+
+
+def publish(service_name, old_code, new_code, remote_ip, ts):
+    event = Event(_next_id[0], service_name, old_code, new_code, remote_ip, ts)
+    _next_id[0] += 1
+    _history.append(event)
+    stats['published'] += 1
+    for subscriber in list(_subscribers):
+        subscriber.push(event)
+    return event
+
+
+def get_stats():
+    s = copy.copy(stats)
+    s['subscribers'] = len(_subscribers)
+    return s
+
+
+configure()
@@ -0,0 +1,92 @@
+"""damping of services which flap between up and down
+
+A service is flapping once its history (see accounting) holds at least
+`threshold' changes between up and down. A flapping service is held down
+until its last `stable_probes' probes have all found it up, and the results
+of probing it are cached `cache_factor' times as long, so that it is probed
+less often while it flaps. A `threshold' of 0 turns damping off.
+"""
+
+import copy
+try:
+    from collections import Counter
+except:
+    from .compat import Counter
+
+config = {
+    'threshold': 0,
+    'stable_probes': 5,
+    'cache_factor': 3,
+}
+
+default_stats = Counter({
+    # checks answered with a damped result, and checks of flapping services
+    'held_down': 0,
+    'flapping_checks': 0,
+})
+
+stats = Counter()
+
+
+def configure(threshold=config['threshold'], stable_probes=config['stable_probes'],
+              cache_factor=config['cache_factor']):
+    config['threshold'] = threshold
+    config['stable_probes'] = stable_probes
+    config['cache_factor'] = cache_factor
+    reset_stats()
+
+
+def reset_stats():
+    stats.clear()
+    stats.update(default_stats)
+
+
+def _up(code):
+    return code <= 200
+
+
+def flips(results):
+    """The number of changes between up and down in a list of Results"""
+    return sum(1 for before, after in zip(results, results[1:]) if _up(before.code) != _up(after.code))
+
+
+def stable_for(results):
+    """How many of the last Results have all been up"""
+    count = 0
+    for result in reversed(results):
+        if not _up(result.code):
+            break
+        count += 1
+    return count
+
+
+def is_flapping(results):
+    return bool(config['threshold']) and results is not None and flips(results) >= config['threshold']
+
+
+def cache_factor(results):
+    """How many times as long to cache the results of probing a service with
+    these Results"""
+    if is_flapping(results):
+        stats['flapping_checks'] += 1
+        return config['cache_factor']
+    return 1
+
+
+def damp(results, code, message):
+    """The (code, message) to answer a check with, given its outcome and the
+    Results of the service (including this outcome's, if it was probed)"""
+    if not _up(code) or not is_flapping(results):
+        return code, message
+    stable = stable_for(results)
+    if stable >= config['stable_probes']:
+        return code, message
+    stats['held_down'] += 1
+    return 503, 'Held down: flapping, up for %d of %d probes' % (stable, config['stable_probes'])
+
+
+def get_stats():
+    return copy.copy(stats)
+
+
+reset_stats()
@@ -1,134 +1,640 @@
-import collections
+import datetime
+import json
 import logging
+import re
+import sys
 import time
 
 import tornado.ioloop
 import tornado.httputil
 import tornado.httpclient
+import tornado.iostream
 import tornado.gen
+import tornado.util
 import tornado.web
 
+from . import accounting
 from . import cache
-from . import checker
+from . import config
+from . import events
+from . import flapping
+from . import looplag
+from . import metrics
+from . import registry
+from .compat import monotonic
 
 log = logging.getLogger('hacheck')
 
-StatusResponse = collections.namedtuple('StatusResponse', ['code', 'remote_ip', 'ts'])
 
-if hasattr(collections, 'Counter'):
-    Counter = collections.Counter  # fast
-else:
-    def Counter():
-        return collections.defaultdict(lambda: 0)
-
-seen_services = {}
-service_count = collections.defaultdict(Counter)
-last_statuses = {}
+def _reset_stats():
+    accounting.reset()
 
 
-def _reset_stats():
-    seen_services.clear()
-    service_count.clear()
-    last_statuses.clear()
+# (key in /status, module, function returning its stats) for every backend;
+# only those which have been imported (by a checker using them) are reported
+BACKEND_STATS = (
+    ('haproxy', 'hacheck.haproxy', 'get_stats'),
+    ('http_keepalive', 'hacheck.keepalive', 'get_stats'),
+    ('memcached', 'hacheck.memcached', 'get_stats'),
+    ('mysql', 'hacheck.mysql', 'get_stats'),
+    ('postgres', 'hacheck.postgres', 'get_stats'),
+    ('sentinels', 'hacheck.redis', 'get_sentinel_stats'),
+    ('exec', 'hacheck.scripts', 'get_stats'),
+    ('statsd', 'hacheck.statsd', 'get_stats'),
+)
 
 
 class StatusHandler(tornado.web.RequestHandler):
     def get(self):
         stats = {}
         stats['cache'] = cache.get_stats()
+        stats['ioloop'] = looplag.get_stats()
+        stats['accounting'] = accounting.get_stats()
+        stats['events'] = events.get_stats()
+        stats['flapping'] = flapping.get_stats()
+        for key, module_name, function in BACKEND_STATS:
+            module = sys.modules.get(module_name)
+            if module is not None:
+                stats[key] = getattr(module, function)()
         stats['uptime'] = time.time() - self.settings['start_time']
         self.set_status(200)
         self.write(stats)
 
 
-class ListRecentHandler(tornado.web.RequestHandler):
+class MetricsHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.set_header('Content-Type', metrics.CONTENT_TYPE)
+        self.write(metrics.render(self.settings['start_time']))
+
+
+class ServicePageHandler(tornado.web.RequestHandler):
+    """Lists services in name order, as JSON written a chunk at a time so that
+    other requests are served between chunks. Given `prefix', only services
+    whose names start with it are listed; given `limit', at most that many are,
+    and the response's `next_cursor', passed back as `cursor', gets the next
+    page."""
+
+    # the key the services are listed under, and whether as a list or an object
+    KEY = None
+    BRACKETS = '[]'
+    # services written per chunk
+    CHUNK_SIZE = 500
+
+    def page_arguments(self):
+        limit = self.get_argument('limit', None)
+        if limit is not None:
+            try:
+                limit = int(limit)
+            except ValueError:
+                limit = 0
+            if limit < 1:
+                raise tornado.web.HTTPError(400, 'limit must be a positive integer')
+        return self.get_argument('prefix', ''), self.get_argument('cursor', None), limit
+
+    @tornado.gen.coroutine
+    def write_services(self, render, prefix, cursor, limit):
+        """Write `render(record)' (a JSON string, or None to skip the service) for
+        each service on the page, separated by commas
+
+        :returns: Future of the cursor of the next page, or None if there is none
+        """
+        written = 0
+        last_name = None
+        while True:
+            records = accounting.scan(prefix, cursor, self.CHUNK_SIZE)
+            chunk = []
+            for record in records:
+                rendered = render(record)
+                if rendered is None:
+                    continue
+                if written + len(chunk) == limit:
+                    # the page is full, and this service is on the next one
+                    if chunk:
+                        self.write((', ' if written else '') + ', '.join(chunk))
+                    raise tornado.gen.Return(last_name)
+                chunk.append(rendered)
+                last_name = record.name
+            if chunk:
+                self.write((', ' if written else '') + ', '.join(chunk))
+                written += len(chunk)
+            if len(records) < self.CHUNK_SIZE:
+                raise tornado.gen.Return(None)
+            cursor = records[-1].name
+            yield self.flush()
+            # the flush is usually done already, and then it wouldn't let other callbacks run
+            yield tornado.gen.moment
+
+    @tornado.gen.coroutine
+    def write_page(self, render, **fields):
+        """Write the page of services, then `fields' and, if there are more
+        services, the cursor of the next page"""
+        prefix, cursor, limit = self.page_arguments()
+        self.set_header('Content-Type', 'application/json; charset=UTF-8')
+        self.write('{%s: %s' % (json.dumps(self.KEY), self.BRACKETS[0]))
+        next_cursor = yield self.write_services(render, prefix, cursor, limit)
+        self.write(self.BRACKETS[1])
+        for name, value in sorted(fields.items()):
+            self.write(', %s: %s' % (json.dumps(name), json.dumps(value)))
+        if next_cursor is not None:
+            self.write(', "next_cursor": %s' % json.dumps(next_cursor))
+        self.finish('}')
+
+
+class ListRecentHandler(ServicePageHandler):
+    KEY = 'seen_services'
+
+    @tornado.web.asynchronous
+    @tornado.gen.coroutine
     def get(self):
         now = time.time()
         recency_threshold = int(self.get_argument('threshold', 10 * 60))
-        response = []
-        for service_name, t in seen_services.items():
-            if now - t > recency_threshold:
-                continue
-            last_status = last_statuses.get(service_name, None)
-            if last_status is not None:
-                last_status = last_status._asdict()
-            response.append((service_name, last_status))
+
+        def render(record):
+            if now - record.last_seen > recency_threshold:
+                return None
+            last_status = record.status._asdict() if record.status is not None else None
+            return json.dumps([record.name, last_status])
+
+        yield self.write_page(render, threshold_seconds=recency_threshold)
+
+
+class ServiceCountHandler(ServicePageHandler):
+    KEY = 'service_access_counts'
+    BRACKETS = '{}'
+
+    @tornado.web.asynchronous
+    @tornado.gen.coroutine
+    def get(self):
+        epoch = accounting.current_epoch()
+
+        def render(record):
+            counts = record.source_counts(epoch)
+            if not counts:
+                return None
+            return '%s: %s' % (json.dumps(record.name), json.dumps(counts))
+
+        yield self.write_page(render)
+
+
+class HistoryHandler(tornado.web.RequestHandler):
+    """The results of the last probes of a service, oldest first, and whether
+    it is flapping"""
+    def get(self, service_name):
+        results = accounting.results(service_name)
+        if results is None:
+            raise tornado.web.HTTPError(404)
         self.write({
-            'seen_services': list(sorted(response)),
-            'threshold_seconds': recency_threshold
+            'service': service_name,
+            'results': [result._asdict() for result in results],
+            'flips': flapping.flips(results),
+            'flapping': flapping.is_flapping(results),
+            'stable_for': flapping.stable_for(results),
         })
 
 
-class ServiceCountHandler(tornado.web.RequestHandler):
+class EventsHandler(tornado.web.RequestHandler):
+    """A stream of server-sent events: a `transition' event, with the service,
+    its old and new codes, who checked it and when, whenever the code a service
+    is checked with changes; and a `dropped' event, with how many were lost,
+    whenever this client hasn't kept up. Given `replay', the stream starts with
+    (up to) that many past events; a reconnecting client's Last-Event-ID picks
+    up where it left off instead."""
+
+    # how often to send something down an idle stream, so that we notice when
+    # the client has gone away
+    KEEPALIVE_SECONDS = 15
+
+    subscriber = None
+
+    def positive_argument(self, name):
+        try:
+            value = int(self.get_argument(name, 0))
+        except ValueError:
+            value = -1
+        if value < 0:
+            raise tornado.web.HTTPError(400, '%s must be a positive integer' % name)
+        return value
+
+    @tornado.web.asynchronous
+    @tornado.gen.coroutine
     def get(self):
-        self.write({'service_access_counts': dict(service_count)})
+        replay = self.positive_argument('replay')
+        try:
+            last_event_id = int(self.request.headers['Last-Event-ID'])
+        except (KeyError, ValueError):
+            last_event_id = None
+        self.set_header('Content-Type', 'text/event-stream')
+        self.set_header('Cache-Control', 'no-cache')
+        self.subscriber = events.subscribe(replay=replay, last_event_id=last_event_id)
+        try:
+            # let the client know it is connected, even if nothing happens for a while
+            yield self.flush()
+            while not self.subscriber.closed:
+                try:
+                    yield tornado.gen.with_timeout(datetime.timedelta(seconds=self.KEEPALIVE_SECONDS),
+                                                   self.subscriber.wait())
+                except tornado.gen.TimeoutError:
+                    self.write(': keepalive\n\n')
+                pending, dropped = self.subscriber.take()
+                if dropped:
+                    self.write('event: dropped\ndata: %d\n\n' % dropped)
+                for event in pending:
+                    self.write('id: %d\nevent: transition\ndata: %s\n\n' % (event.id, json.dumps(event._asdict())))
+                # while this client is slow to read, events wait (or are dropped) in its buffer
+                yield self.flush()
+        except tornado.iostream.StreamClosedError:
+            pass
+        finally:
+            self.subscriber.close()
+
+    def on_connection_close(self):
+        if self.subscriber is not None:
+            self.subscriber.close()
+
+
+def _abandon(future):
+    # nobody is waiting for this result any more; retrieve its exception (if
+    # any) when it finishes so that it isn't logged as never retrieved
+    future.add_done_callback(lambda f: f.exception())
+
+
+def response_code(code):
+    if code in tornado.httputil.responses:
+        return code
+    else:
+        return 503
+
+
+class Timing(object):
+    """How long one checker (or, with no `cache' state, some other step) took,
+    and whether it was answered from the cache: `hit', `miss', or `coalesced'
+    (waiting on a probe some other request started)"""
+    __slots__ = ('name', 'cache', 'start', 'duration')
+
+    def __init__(self, name, cache=None):
+        self.name = name
+        self.cache = cache
+        self.start = monotonic()
+        self.duration = None
+
+    def finish(self, future=None):
+        self.duration = monotonic() - self.start
+
+
+def server_timing(timings):
+    """A Server-Timing header value for `timings' (durations in milliseconds);
+    any step that hasn't finished, such as a checker abandoned after an earlier
+    one failed, has no duration"""
+    entries = []
+    for timing in timings:
+        entry = timing.name
+        if timing.cache is not None:
+            entry += ';desc=' + timing.cache
+        if timing.duration is not None:
+            entry += ';dur=%.2f' % (1000.0 * timing.duration)
+        entries.append(entry)
+    return ', '.join(entries)
+
+
+def _checker_name(checker):
+    name = getattr(checker, '__name__', type(checker).__name__)
+    if name.startswith('check_'):
+        name = name[len('check_'):]
+    return name
+
+
+@tornado.gen.coroutine
+def run_checkers(checkers, service_name, port, query, query_params, headers, remote_ip, bust_cache=False,
+                 timings=None):
+    """Run a checker chain for one service and record the outcome
+
+    Every checker in the chain is started at once; results are still taken in
+    chain order, so the first failure in the chain is the one reported. If the
+    outcome was decided by checkers which probed the backend (missed the cache)
+    rather than by the spool, it is added to the service's history; a service
+    which flaps may then be held down (see flapping), and the results of its
+    probes are cached for longer.
+
+    :param timings: if a list, a Timing for each checker is appended to it
+    :returns: Future of (code, message)
+    """
+    accounting.record_request(service_name, remote_ip)
+    start = monotonic()
+    pending = []
+    # the indexes in `pending' of the checkers which probed the backend
+    probed = set()
+    factor = flapping.cache_factor(accounting.results(service_name))
+    with cache.maybe_bust(bust_cache):
+        for this_checker in checkers:
+            if timings is not None:
+                timing = Timing(_checker_name(this_checker))
+            hits = cache.stats['hits']
+            misses = cache.stats['misses']
+            future = this_checker(
+                service_name,
+                port,
+                query,
+                io_loop=tornado.ioloop.IOLoop.current(),
+                query_params=query_params,
+                headers=headers,
+            )
+            # only a cache miss means that the checker really probed anything
+            if cache.stats['misses'] != misses:
+                probed.add(len(pending))
+                metrics.record_probe(this_checker.__name__, service_name, future)
+                if factor != 1:
+                    cache.lengthen(this_checker, (service_name, port, query), factor)
+            if timings is not None:
+                if cache.stats['misses'] != misses:
+                    timing.cache = 'miss'
+                elif cache.stats['hits'] != hits:
+                    timing.cache = 'hit' if future.done() else 'coalesced'
+                timings.append(timing)
+                future.add_done_callback(timing.finish)
+            pending.append(future)
+    code, message = 200, ""
+    failed = None
+    for i, future in enumerate(pending):
+        code, message = yield future
+        if code > 200:
+            failed = i
+            for abandoned in pending[i + 1:]:
+                _abandon(abandoned)
+            break
+    else:
+        code = 200
+    now = time.time()
+    if probed and (failed is None or failed in probed):
+        accounting.record_result(service_name, code, monotonic() - start, now)
+    code, message = flapping.damp(accounting.results(service_name), code, message)
+    previous = accounting.record_status(service_name, code, remote_ip, now)
+    if previous is None or previous.code != code:
+        events.publish(service_name, previous.code if previous is not None else None, code, remote_ip, now)
+    raise tornado.gen.Return((code, message))
 
 
 class BaseServiceHandler(tornado.web.RequestHandler):
-    CHECKERS = []
+    # the protocol whose chain of checkers (see registry) this handler runs,
+    # unless CHECKERS is set
+    PROTOCOL = None
+    CHECKERS = None
+    # what the checkers are given as the `port' part of the URL
+    PORT_TYPE = int
+
+    @classmethod
+    def checkers(cls):
+        if cls.CHECKERS is not None:
+            return cls.CHECKERS
+        return registry.chain(cls.PROTOCOL)
+
+    # the Server-Timing header sent, if server_timing is configured
+    server_timing = None
 
     @tornado.web.asynchronous
     @tornado.gen.coroutine
     def get(self, service_name, port, query):
-        seen_services[service_name] = time.time()
-        service_count[service_name][self.request.remote_ip] += 1
-        with cache.maybe_bust(self.request.headers.get('Pragma', '') == 'no-cache'):
-            port = int(port)
-            last_message = ""
-            querystr = self.request.query
-            for this_checker in self.CHECKERS:
-                code, message = yield this_checker(
-                    service_name,
-                    port,
-                    query,
-                    io_loop=tornado.ioloop.IOLoop.current(),
-                    query_params=querystr,
-                    headers=self.request.headers,
-                )
-                last_message = message
-                if code > 200:
-                    last_statuses[service_name] = StatusResponse(code, self.request.remote_ip, time.time())
-                    if code in tornado.httputil.responses:
-                        self.set_status(code)
-                    else:
-                        self.set_status(503)
-                    self.write(message)
-                    self.finish()
-                    break
-            else:
-                last_statuses[service_name] = StatusResponse(200, self.request.remote_ip, time.time())
-                self.set_status(200)
-                self.write(last_message)
-                self.finish()
+        yield self.run(self.checkers(), service_name, self.PORT_TYPE(port), query)
+
+    @tornado.gen.coroutine
+    def run(self, checkers, service_name, port, query):
+        timings = None
+        if config.config['server_timing']:
+            total = Timing('total')
+            timings = []
+        code, message = yield run_checkers(
+            checkers,
+            service_name,
+            port,
+            query,
+            query_params=self.request.query,
+            headers=self.request.headers,
+            remote_ip=self.request.remote_ip,
+            bust_cache=self.request.headers.get('Pragma', '') == 'no-cache',
+            timings=timings,
+        )
+        if timings is not None:
+            total.finish()
+            timings.append(total)
+            self.server_timing = server_timing(timings)
+            self.set_header('Server-Timing', self.server_timing)
+        self.set_status(response_code(code))
+        self.write(message)
+        self.finish()
+        metrics.record_request(service_name, self.get_status(), self.request.request_time())
 
 
 class SpoolServiceHandler(BaseServiceHandler):
-    CHECKERS = [checker.check_spool]
+    PROTOCOL = 'spool'
 
 
 class HTTPServiceHandler(BaseServiceHandler):
-    CHECKERS = [checker.check_spool, checker.check_http]
+    PROTOCOL = 'http'
+
+
+class HTTPSServiceHandler(BaseServiceHandler):
+    PROTOCOL = 'https'
+
+
+class HTTPUnixServiceHandler(BaseServiceHandler):
+    PROTOCOL = 'http-unix'
+    # the name of a socket in http_unix_socket_dir
+    PORT_TYPE = str
+
+
+class ExecServiceHandler(BaseServiceHandler):
+    PROTOCOL = 'exec'
 
 
 class HaproxyServiceHandler(BaseServiceHandler):
-    CHECKERS = [checker.check_spool, checker.check_haproxy]
+    PROTOCOL = 'haproxy'
+
+
+class HaproxySocketServiceHandler(BaseServiceHandler):
+    PROTOCOL = 'haproxy-socket'
 
 
 class TCPServiceHandler(BaseServiceHandler):
-    CHECKERS = [checker.check_spool, checker.check_tcp]
+    PROTOCOL = 'tcp'
+
+
+class ListenServiceHandler(BaseServiceHandler):
+    PROTOCOL = 'listen'
+
+
+class MemcachedServiceHandler(BaseServiceHandler):
+    PROTOCOL = 'memcached'
 
 
 class MySQLServiceHandler(BaseServiceHandler):
-    CHECKERS = [checker.check_spool, checker.check_mysql]
+    PROTOCOL = 'mysql'
+
+
+class MySQLReplicaServiceHandler(BaseServiceHandler):
+    PROTOCOL = 'mysql-replica'
+
+
+class PostgresServiceHandler(BaseServiceHandler):
+    PROTOCOL = 'postgres'
 
 
 class RedisSentinelServiceHandler(BaseServiceHandler):
-    CHECKERS = [checker.check_spool, checker.check_redis_sentinel]
+    PROTOCOL = 'redis'
+
+
+class SentinelServiceHandler(BaseServiceHandler):
+    PROTOCOL = 'sentinel'
 
 
 class RedisInfoServiceHandler(BaseServiceHandler):
-    CHECKERS = [checker.check_spool, checker.check_redis_info]
+    PROTOCOL = 'redis-info'
 
 
 class SentinelInfoServiceHandler(BaseServiceHandler):
-    CHECKERS = [checker.check_spool, checker.check_sentinel_info]
+    PROTOCOL = 'sentinel-info'
+
+
+class ProtocolServiceHandler(BaseServiceHandler):
+    """Runs the chain of any protocol without a handler of its own, such as
+    those added by plugins or the config file"""
+
+    @tornado.web.asynchronous
+    @tornado.gen.coroutine
+    def get(self, protocol, service_name, port, query):
+        try:
+            checkers = registry.chain(protocol)
+        except KeyError:
+            raise tornado.web.HTTPError(404)
+        yield self.run(checkers, service_name, int(port), query)
+
+
+# the handlers of the protocols with URLs of their own, by the protocol part of
+# those URLs; /batch and agent checks run the same chains
+PROTOCOLS = {
+    'spool': SpoolServiceHandler,
+    'http': HTTPServiceHandler,
+    'https': HTTPSServiceHandler,
+    'http-unix': HTTPUnixServiceHandler,
+    'exec': ExecServiceHandler,
+    'haproxy': HaproxyServiceHandler,
+    'haproxy-socket': HaproxySocketServiceHandler,
+    'tcp': TCPServiceHandler,
+    'listen': ListenServiceHandler,
+    'memcached': MemcachedServiceHandler,
+    'mysql': MySQLServiceHandler,
+    'mysql-replica': MySQLReplicaServiceHandler,
+    'postgres': PostgresServiceHandler,
+    'redis': RedisSentinelServiceHandler,
+    'sentinel': SentinelServiceHandler,
+    'redis-info': RedisInfoServiceHandler,
+    'sentinel-info': SentinelInfoServiceHandler,
+}
+
+CHECK_SPEC = re.compile(r'^/?([a-z-]+)/([a-zA-Z0-9_-]+)/([a-zA-Z0-9_.-]+)/?([^?]*)(?:\?(.*))?$')
+
+
+def parse_check(check):
+    """Parse a check written like the path of a single check (`tcp/foo/8080',
+    `redis-info/bar/6379/match?role=master', ...)
+
+    :returns: (checkers, service_name, port, query, query_params), or None if
+              `check' isn't a check of a known protocol
+    """
+    match = None
+    if isinstance(check, tornado.util.basestring_type):
+        match = CHECK_SPEC.match(check)
+    if match is None:
+        return None
+    protocol, service_name, port, query, query_params = match.groups()
+    handler = PROTOCOLS.get(protocol, BaseServiceHandler)
+    try:
+        port = handler.PORT_TYPE(port)
+        if protocol in PROTOCOLS:
+            checkers = handler.checkers()
+        else:
+            checkers = registry.chain(protocol)
+    except (KeyError, ValueError):
+        return None
+    return checkers, service_name, port, query, query_params or ''
+
+
+class BatchHandler(tornado.web.RequestHandler):
+    """Run many checks in one request
+
+    Checks are given in the same form as the path (and query string) of a single
+    check, e.g. `tcp/foo/8080' or `redis-info/bar/6379/match?role=master': as a
+    JSON list in the body of a POST, or as repeated `check' arguments to a GET.
+    They run concurrently, at most `batch_concurrency' at a time, through the
+    same checker chains and cache as single checks. A batch of more than
+    `batch_max_checks' checks is refused.
+
+    The response is one JSON document with a result per check, in the order the
+    checks were given; with `format=jsonl', results are instead streamed one JSON
+    object per line as they complete.
+    """
+
+    def checks(self):
+        if self.request.method == 'POST':
+            try:
+                checks = json.loads(self.request.body.decode('utf-8'))
+            except ValueError:
+                raise tornado.web.HTTPError(400, 'Body is not JSON')
+            if not isinstance(checks, list):
+                raise tornado.web.HTTPError(400, 'Body is not a JSON list')
+            return checks
+        return self.get_arguments('check')
+
+    @tornado.gen.coroutine
+    def run_check(self, check):
+        parsed = parse_check(check)
+        if parsed is None:
+            raise tornado.gen.Return((400, 'Unknown check %r' % (check,)))
+        checkers, service_name, port, query, query_params = parsed
+        start = monotonic()
+        try:
+            code, message = yield run_checkers(
+                checkers,
+                service_name,
+                port,
+                query,
+                query_params=query_params,
+                headers=self.request.headers,
+                remote_ip=self.request.remote_ip,
+                bust_cache=self.request.headers.get('Pragma', '') == 'no-cache',
+            )
+        except Exception as e:
+            # one broken check shouldn't take the rest of the batch with it
+            log.exception('Unhandled exception running %s', check)
+            code, message = 500, 'Unhandled exception %s' % e
+        code = response_code(code)
+        metrics.record_request(service_name, code, monotonic() - start)
+        raise tornado.gen.Return((code, message))
+
+    @tornado.web.asynchronous
+    @tornado.gen.coroutine
+    def get(self):
+        checks = self.checks()
+        if len(checks) > config.config['batch_max_checks']:
+            raise tornado.web.HTTPError(400, 'More than %d checks in the batch' % config.config['batch_max_checks'])
+        streaming = self.get_argument('format', 'json') == 'jsonl'
+        results = [None] * len(checks)
+        remaining = iter(enumerate(checks))
+
+        @tornado.gen.coroutine
+        def worker():
+            for i, check in remaining:
+                code, message = yield self.run_check(check)
+                if isinstance(message, bytes):
+                    message = message.decode('utf-8', 'replace')
+                results[i] = {'check': check, 'code': code, 'message': message}
+                if streaming:
+                    self.write(json.dumps(results[i]) + '\n')
+                    self.flush()
+
+        if streaming:
+            self.set_header('Content-Type', 'application/x-ndjson')
+        yield [worker() for _ in range(min(config.config['batch_concurrency'], len(checks)))]
+        if not streaming:
+            self.write({'results': results})
+        self.finish()
+
+    post = get
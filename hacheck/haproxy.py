@@ -0,0 +1,151 @@
+"""HAProxy CSV stats, parsed into a table indexed by (pxname, svname), over HTTP or the stats socket"""
+
+import copy
+import csv
+import socket
+import time
+try:
+    from collections import Counter
+except:
+    from .compat import Counter
+
+import tornado.gen
+
+from . import connection
+
+# column offsets used when the stats don't start with a `# pxname,...' header
+PXNAME = 0
+SVNAME = 1
+STATUS = 17
+
+UP_STATUSES = ('UP', 'OPEN', 'no check')
+
+default_stats = Counter({
+    'parses': 0,
+    'rows': 0,
+    'parse_time': 0.0,
+})
+
+stats = Counter()
+stats.update(default_stats)
+
+
+def reset_stats():
+    stats.clear()
+    stats.update(default_stats)
+
+
+def get_stats():
+    return copy.copy(stats)
+
+
+def is_up(status):
+    """Whether a stats `status' column means the proxy or server should take traffic.
+    Servers which are in transition (e.g., `UP 1/3') are still up."""
+    return status in UP_STATUSES or status.startswith('UP ')
+
+
+class StatsParser(object):
+    """Incrementally parse CSV stats lines (from `show stat' or `/;csv') into a dict
+    mapping (pxname, svname) to the status column"""
+
+    def __init__(self):
+        self.status_column = STATUS
+        self.table = {}
+        self.parse_time = 0.0
+
+    def feed(self, lines):
+        start = time.time()
+        for row in csv.reader(lines):
+            if not row:
+                continue
+            if row[0].startswith('#'):
+                header = [column.strip('# ') for column in row]
+                if 'status' in header:
+                    self.status_column = header.index('status')
+                continue
+            if len(row) <= self.status_column:
+                continue
+            self.table[(row[PXNAME], row[SVNAME])] = row[self.status_column]
+        self.parse_time += time.time() - start
+
+    def finish(self):
+        stats['parses'] += 1
+        stats['rows'] = len(self.table)
+        stats['parse_time'] += self.parse_time
+        return self.table
+
+
+def parse_stats(body):
+    """Parse an entire CSV stats document
+
+    :returns: dict mapping (pxname, svname) to status
+    """
+    parser = StatsParser()
+    parser.feed(body.split('\n'))
+    return parser.finish()
+
+
+class StatsSocket(connection.PersistentConnection):
+    """Persistent connection to the HAProxy runtime API on a UNIX socket, kept in
+    interactive (`prompt') mode so that it survives between commands"""
+
+    PROMPT = b'> '
+    CHUNK_SIZE = 65536
+
+    def __init__(self, path, timeout=10, io_loop=None):
+        super(StatsSocket, self).__init__(path, family=socket.AF_UNIX, timeout=timeout, io_loop=io_loop)
+        self._in_flight = None
+
+    @tornado.gen.coroutine
+    def handshake(self):
+        yield self.stream.write(b'prompt\n')
+        yield self.stream.read_until(self.PROMPT)
+
+    @tornado.gen.coroutine
+    def _show_stat(self):
+        yield self.stream.write(b'show stat\n')
+        parser = StatsParser()
+        # the output ends with an empty line followed by the prompt; parse
+        # complete lines as they arrive rather than buffering the whole thing
+        pending = b''
+        previous_blank = False
+        while True:
+            chunk = yield self.stream.read_bytes(self.CHUNK_SIZE, partial=True)
+            lines = (pending + chunk).split(b'\n')
+            pending = lines.pop()
+            if lines:
+                previous_blank = lines[-1] == b''
+                parser.feed(line.decode('utf-8') for line in lines)
+            if previous_blank and pending == self.PROMPT:
+                break
+        raise tornado.gen.Return(parser.finish())
+
+    def show_stat(self):
+        """Fetch and parse `show stat'. Concurrent callers share a single request.
+
+        :returns: Future of a dict mapping (pxname, svname) to status
+        """
+        if self._in_flight is None or self._in_flight.done():
+            self._in_flight = self.call(self._show_stat)
+        return self._in_flight
+
+
+_stats_sockets = {}
+
+
+def stats_socket(path, timeout=10, io_loop=None):
+    """Get the (persistent) StatsSocket for `path'"""
+    client = _stats_sockets.get(path)
+    if client is None or (io_loop is not None and client.io_loop is not io_loop):
+        if client is not None:
+            client.close()
+        client = _stats_sockets[path] = StatsSocket(path, timeout=timeout, io_loop=io_loop)
+    client.timeout = timeout
+    return client
+
+
+def close_stats_sockets():
+    for client in _stats_sockets.values():
+        client.close()
+    _stats_sockets.clear()
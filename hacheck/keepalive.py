@@ -0,0 +1,346 @@
+"""persistent HTTP/1.1 and HTTPS connections, pooled per address, for checks tornado's own client can't keep alive"""
+
+import collections
+import copy
+import socket
+import ssl
+import time
+try:
+    from collections import Counter
+except:
+    from .compat import Counter
+
+import tornado.concurrent
+import tornado.gen
+import tornado.httputil
+import tornado.iostream
+
+from . import connection
+
+MAX_HEADER_SIZE = 65536
+MAX_BODY_SIZE = 1024 * 1024
+
+default_stats = Counter({
+    'connects': 0,
+    'connect_time': 0.0,
+    'requests': 0,
+    'request_time': 0.0,
+    'reused': 0,
+    'tls_handshakes': 0,
+    'tls_handshake_time': 0.0,
+    'tls_resumed': 0,
+})
+
+stats = Counter()
+stats.update(default_stats)
+
+
+def reset_stats():
+    stats.clear()
+    stats.update(default_stats)
+
+
+def get_stats():
+    s = copy.copy(stats)
+    s['tls_resumption_rate'] = float(s['tls_resumed']) / s['tls_handshakes'] if s['tls_handshakes'] else None
+    return s
+
+
+class ProtocolError(Exception):
+    pass
+
+
+class _StaleConnection(tornado.iostream.StreamClosedError):
+    """The server closed an idle connection just as a request was sent on it"""
+
+
+Response = collections.namedtuple('Response', ['code', 'reason', 'headers', 'body'])
+
+
+def tls_context(ca_file=None):
+    """A client SSLContext which, if `ca_file' is given, requires the server's
+    certificate to be signed by one of the CAs in it (but, since checks connect
+    to 127.0.0.1, doesn't check the name in it)"""
+    context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+    context.options |= ssl.OP_NO_SSLv2 | ssl.OP_NO_SSLv3
+    context.check_hostname = False
+    if ca_file is not None:
+        context.verify_mode = ssl.CERT_REQUIRED
+        context.load_verify_locations(ca_file)
+    else:
+        context.verify_mode = ssl.CERT_NONE
+    return context
+
+
+class TLSSessions(object):
+    """The SSLContext for one backend, and the most recent session (if the ssl
+    module supports resuming them) it gave us, to resume on the next connection"""
+
+    def __init__(self, ca_file=None):
+        self.ca_file = ca_file
+        self.context = tls_context(ca_file)
+        self.session = None
+
+    def save(self, sock):
+        try:
+            session = getattr(sock, 'session', None)
+        except ValueError:
+            # a TLS 1.3 session isn't usable until its ticket has been read
+            return
+        if session is not None:
+            self.session = session
+
+
+class _SSLIOStream(tornado.iostream.SSLIOStream):
+    """An SSLIOStream which offers to resume `session', and notes when the TCP
+    connection and the TLS handshake each completed"""
+
+    def __init__(self, *args, **kwargs):
+        self._session = kwargs.pop('session', None)
+        self._handshake_future = None
+        self.tcp_connected = None
+        self.handshake_done = None
+        super(_SSLIOStream, self).__init__(*args, **kwargs)
+
+    def connect(self, address, callback=None, server_hostname=None):
+        # tornado 4.1 resolves the Future from connect as soon as the TCP
+        # connection is up; this one waits for the handshake (or its failure)
+        self._handshake_future = tornado.concurrent.TracebackFuture()
+        super(_SSLIOStream, self).connect(address, callback=self._on_handshake, server_hostname=server_hostname)
+        return self._handshake_future
+
+    def _on_handshake(self):
+        self.handshake_done = time.time()
+        if not self._handshake_future.done():
+            self._handshake_future.set_result(self)
+
+    def _maybe_run_close_callback(self):
+        if self.closed() and self._handshake_future is not None and not self._handshake_future.done():
+            self._handshake_future.set_exception(self.error or tornado.iostream.StreamClosedError())
+        super(_SSLIOStream, self)._maybe_run_close_callback()
+
+    def _handle_connect(self):
+        self.tcp_connected = time.time()
+        super(_SSLIOStream, self)._handle_connect()
+        if self._session is not None and not self.closed():
+            # the handshake starts on the next write event, so it isn't too late
+            self.socket.session = self._session
+
+
+def _keep_alive(start_line, headers):
+    connection_header = headers.get('Connection', '').lower()
+    if start_line.version == 'HTTP/1.1':
+        return connection_header != 'close'
+    return connection_header == 'keep-alive'
+
+
+class HTTPConnection(connection.PersistentConnection):
+    """A single keep-alive connection. Requests are sent one at a time; the
+    connection is reopened whenever the server doesn't keep it alive. Given
+    `tls' (a TLSSessions), the connection is HTTPS, resuming TLS sessions
+    where it can."""
+
+    def __init__(self, address, family=socket.AF_INET, host='localhost', tls=None, timeout=10, io_loop=None):
+        super(HTTPConnection, self).__init__(address, family=family, timeout=timeout, io_loop=io_loop)
+        self.host = host
+        self.tls = tls
+        self.pending = 0
+        # requests answered over the current stream
+        self.served = 0
+        self.handshake_time = None
+        self.resumed = None
+
+    def make_stream(self, sock):
+        if self.tls is None:
+            return super(HTTPConnection, self).make_stream(sock)
+        return _SSLIOStream(sock, ssl_options=self.tls.context, session=self.tls.session, io_loop=self.io_loop)
+
+    @tornado.gen.coroutine
+    def _connect(self):
+        self.served = 0
+        yield super(HTTPConnection, self)._connect()
+        stats['connects'] += 1
+        stats['connect_time'] += self.connect_time
+        if self.tls is not None:
+            self.handshake_time = self.stream.handshake_done - self.stream.tcp_connected
+            self.resumed = bool(getattr(self.stream.socket, 'session_reused', False))
+            self.tls.save(self.stream.socket)
+            stats['tls_handshakes'] += 1
+            stats['tls_handshake_time'] += self.handshake_time
+            if self.resumed:
+                stats['tls_resumed'] += 1
+
+    def send(self, data):
+        self.stream.write(data).add_done_callback(lambda f: f.exception())
+
+    @tornado.gen.coroutine
+    def _read_chunked(self):
+        body = []
+        size = 0
+        while True:
+            line = yield self.stream.read_until(b'\r\n', max_bytes=MAX_HEADER_SIZE)
+            length = int(line.split(b';', 1)[0], 16)
+            if length == 0:
+                # skip any trailers
+                while (yield self.stream.read_until(b'\r\n', max_bytes=MAX_HEADER_SIZE)) != b'\r\n':
+                    pass
+                break
+            size += length
+            if size > MAX_BODY_SIZE:
+                raise ProtocolError('Response body is larger than %d bytes' % MAX_BODY_SIZE)
+            chunk = yield self.stream.read_bytes(length + 2)
+            body.append(chunk[:-2])
+        raise tornado.gen.Return(b''.join(body))
+
+    @tornado.gen.coroutine
+    def _do_request(self, path, headers):
+        start = time.time()
+        lines = ['GET %s HTTP/1.1' % path, 'Host: %s' % headers.pop('Host', self.host)]
+        lines.extend('%s: %s' % (name, value) for name, value in headers.items())
+        self.send(('\r\n'.join(lines) + '\r\n\r\n').encode('utf-8'))
+
+        data = yield self.stream.read_until(b'\r\n\r\n', max_bytes=MAX_HEADER_SIZE)
+        data = data.decode('latin-1')
+        first_line, _, header_lines = data.partition('\r\n')
+        try:
+            start_line = tornado.httputil.parse_response_start_line(first_line)
+        except tornado.httputil.HTTPInputError:
+            raise ProtocolError('Malformed status line %r' % first_line)
+        response_headers = tornado.httputil.HTTPHeaders.parse(header_lines)
+        keep_alive = _keep_alive(start_line, response_headers)
+
+        if start_line.code < 200 or start_line.code in (204, 304):
+            body = b''
+        elif response_headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            body = yield self._read_chunked()
+        elif 'Content-Length' in response_headers:
+            length = int(response_headers['Content-Length'])
+            if length > MAX_BODY_SIZE:
+                raise ProtocolError('Response body is larger than %d bytes' % MAX_BODY_SIZE)
+            body = b''
+            if length:
+                body = yield self.stream.read_bytes(length)
+        else:
+            # the body runs until the server hangs up
+            keep_alive = False
+            body = yield self.stream.read_until_close()
+        self.served += 1
+        if self.tls is not None:
+            # TLS 1.3 servers only send session tickets after the handshake
+            self.tls.save(self.stream.socket)
+        if not keep_alive:
+            self.close()
+        stats['requests'] += 1
+        stats['request_time'] += time.time() - start
+        raise tornado.gen.Return(Response(start_line.code, start_line.reason, response_headers, body))
+
+    @tornado.gen.coroutine
+    def _request(self, path, headers):
+        reused = self.served > 0
+        if reused:
+            stats['reused'] += 1
+        try:
+            response = yield self._do_request(path, dict(headers))
+        except tornado.iostream.StreamClosedError:
+            if reused:
+                raise _StaleConnection()
+            raise
+        raise tornado.gen.Return(response)
+
+    @tornado.gen.coroutine
+    def fetch(self, path, headers=None):
+        """GET `path', (re)connecting first if necessary
+
+        :returns: Future of a Response, whatever its status code
+        :raises: ProtocolError if the response can't be parsed
+        """
+        headers = headers or {}
+        self.pending += 1
+        try:
+            try:
+                response = yield self.command(self._request, path, headers)
+            except _StaleConnection:
+                # not the backend's fault, so try again on a new connection,
+                # with a deadline of its own (a request which timed out is
+                # never retried: `call' raises Timeout for it instead)
+                response = yield self.command(self._request, path, headers)
+        finally:
+            self.pending -= 1
+        raise tornado.gen.Return(response)
+
+
+class HTTPPool(object):
+    """Up to `size' connections to a single address. Requests go to an idle
+    connection if there is one, to a new connection if the pool is not yet
+    full, and otherwise queue on the least busy connection."""
+
+    def __init__(self, address, family=socket.AF_INET, host='localhost', tls=None, size=2, timeout=10,
+                 io_loop=None):
+        self.address = address
+        self.family = family
+        self.host = host
+        self.tls = tls
+        self.size = size
+        self.timeout = timeout
+        self.io_loop = io_loop
+        self.connections = []
+
+    def get_connection(self):
+        least_busy = None
+        for conn in self.connections:
+            if conn.pending == 0:
+                return conn
+            if least_busy is None or conn.pending < least_busy.pending:
+                least_busy = conn
+        if len(self.connections) < self.size:
+            conn = HTTPConnection(self.address, family=self.family, host=self.host, tls=self.tls,
+                                  timeout=self.timeout, io_loop=self.io_loop)
+            self.connections.append(conn)
+            return conn
+        return least_busy
+
+    def fetch(self, path, headers=None):
+        conn = self.get_connection()
+        conn.timeout = self.timeout
+        return conn.fetch(path, headers)
+
+    def close(self):
+        for conn in self.connections:
+            conn.close()
+        self.connections = []
+
+
+_pools = {}
+
+
+def pool(address, family=socket.AF_INET, host='localhost', size=2, timeout=10, io_loop=None):
+    """Get the connection pool for `address'"""
+    p = _pools.get((address, False))
+    if p is None or (io_loop is not None and p.io_loop is not io_loop):
+        if p is not None:
+            p.close()
+        p = _pools[address, False] = HTTPPool(address, family=family, host=host, size=size, timeout=timeout,
+                                              io_loop=io_loop)
+    p.size = size
+    p.timeout = timeout
+    return p
+
+
+def tls_pool(address, ca_file=None, host='localhost', size=2, timeout=10, io_loop=None):
+    """Get the HTTPS connection pool for `address', which has an SSLContext
+    (and so a TLS session to resume) of its own"""
+    p = _pools.get((address, True))
+    if p is None or p.tls.ca_file != ca_file or (io_loop is not None and p.io_loop is not io_loop):
+        if p is not None:
+            p.close()
+        p = _pools[address, True] = HTTPPool(address, host=host, tls=TLSSessions(ca_file), size=size,
+                                             timeout=timeout, io_loop=io_loop)
+    p.size = size
+    p.timeout = timeout
+    return p
+
+
+def close_pools():
+    for p in _pools.values():
+        p.close()
+    _pools.clear()
@@ -0,0 +1,119 @@
+"""watch for anything blocking the IOLoop, which stalls every check on the host
+
+A timeout is scheduled every `interval'; how late it runs is the loop's lag,
+recorded in the /metrics histogram and, for percentiles in /status, in a window
+of recent samples. Optionally, a callback which runs for longer than
+`blocking_threshold' is interrupted (by SIGALRM, through tornado's
+set_blocking_signal_threshold) and the stack it was blocked in is kept.
+"""
+
+import collections
+import copy
+import logging
+import time
+import traceback
+try:
+    from collections import Counter
+except:
+    from .compat import Counter
+
+import tornado.ioloop
+
+from . import metrics
+
+log = logging.getLogger('hacheck')
+
+# lag samples kept for percentiles
+WINDOW = 600
+# stacks of blocking callbacks kept
+MAX_STACKS = 10
+
+default_stats = Counter({
+    'samples': 0,
+    'blocked': 0,
+})
+
+stats = Counter()
+stats.update(default_stats)
+
+recent_lags = collections.deque(maxlen=WINDOW)
+blocked_stacks = collections.deque(maxlen=MAX_STACKS)
+
+
+def reset_stats():
+    stats.clear()
+    stats.update(default_stats)
+    recent_lags.clear()
+    blocked_stacks.clear()
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def get_stats():
+    """Counts, percentiles of the recent lag samples (in milliseconds), and the
+    most recent stacks callbacks were found blocking in"""
+    s = copy.copy(stats)
+    lags = sorted(recent_lags)
+    for name, p in (('lag_p50_ms', 0.5), ('lag_p99_ms', 0.99), ('lag_max_ms', 1.0)):
+        s[name] = 1000.0 * percentile(lags, p) if lags else None
+    s['blocked_stacks'] = list(blocked_stacks)
+    return s
+
+
+class LagMonitor(object):
+    def __init__(self, interval=0.1, blocking_threshold=None, io_loop=None):
+        self.interval = interval
+        self.blocking_threshold = blocking_threshold
+        self.io_loop = io_loop or tornado.ioloop.IOLoop.current()
+        self.deadline = None
+        self.handle = None
+
+    def _schedule(self):
+        self.deadline = self.io_loop.time() + self.interval
+        self.handle = self.io_loop.add_timeout(self.deadline, self._sample)
+
+    def _sample(self):
+        lag = max(0.0, self.io_loop.time() - self.deadline)
+        stats['samples'] += 1
+        recent_lags.append(lag)
+        metrics.loop_lag.observe(lag)
+        self._schedule()
+
+    def on_blocked(self, signum, frame):
+        stats['blocked'] += 1
+        stack = ''.join(traceback.format_stack(frame))
+        blocked_stacks.append({'ts': time.time(), 'stack': stack})
+        log.warning('IOLoop blocked for more than %.2fs in\n%s', self.blocking_threshold, stack)
+
+    def start(self):
+        self._schedule()
+        if self.blocking_threshold is not None:
+            self.io_loop.set_blocking_signal_threshold(self.blocking_threshold, self.on_blocked)
+
+    def stop(self):
+        if self.handle is not None:
+            self.io_loop.remove_timeout(self.handle)
+            self.handle = None
+        if self.blocking_threshold is not None:
+            self.io_loop.set_blocking_signal_threshold(None, None)
+
+
+# the running monitor, if any
+monitor = None
+
+
+def start(interval=0.1, blocking_threshold=None, io_loop=None):
+    global monitor
+    stop()
+    monitor = LagMonitor(interval=interval, blocking_threshold=blocking_threshold, io_loop=io_loop)
+    monitor.start()
+    return monitor
+
+
+def stop():
+    global monitor
+    if monitor is not None:
+        monitor.stop()
+    monitor = None
@@ -10,10 +10,19 @@ import tornado.httpserver
 import tornado.web
 from tornado.log import access_log
 
+from . import accounting
+from . import agent
 from . import cache
+from . import checker
 from . import config
+from . import events
+from . import flapping
 from . import handlers
+from . import looplag
+from . import procnet
+from . import registry
 from . import spool
+from . import statsd
 
 try:
     from mutornadomon.config import initialize_mutornadomon
@@ -24,21 +33,39 @@ except ImportError:
 def log_request(handler):
     # log requests at INFO instead of WARNING for all status codes
     request_time = 1000.0 * handler.request.request_time()
-    access_log.debug("%d %s %.2fms", handler.get_status(),
-                     handler._request_summary(), request_time)
+    server_timing = getattr(handler, 'server_timing', None)
+    if server_timing is not None:
+        access_log.debug("%d %s %.2fms (%s)", handler.get_status(),
+                         handler._request_summary(), request_time, server_timing)
+    else:
+        access_log.debug("%d %s %.2fms", handler.get_status(),
+                         handler._request_summary(), request_time)
 
 
 def get_app():
     return tornado.web.Application([
         (r'/http/([a-zA-Z0-9_-]+)/([0-9]+)/(.*)', handlers.HTTPServiceHandler),
+        (r'/https/([a-zA-Z0-9_-]+)/([0-9]+)/(.*)', handlers.HTTPSServiceHandler),
+        (r'/http-unix/([a-zA-Z0-9_-]+)/([a-zA-Z0-9_.-]+)/(.*)', handlers.HTTPUnixServiceHandler),
         (r'/tcp/([a-zA-Z0-9_-]+)/([0-9]+)/?(.*)', handlers.TCPServiceHandler),
+        (r'/exec/([a-zA-Z0-9_-]+)/([0-9]+)/(.*)', handlers.ExecServiceHandler),
+        (r'/listen/([a-zA-Z0-9_-]+)/([0-9]+)/?(.*)', handlers.ListenServiceHandler),
+        (r'/memcached/([a-zA-Z0-9_-]+)/([0-9]+)/?(.*)', handlers.MemcachedServiceHandler),
         (r'/mysql/([a-zA-Z0-9_-]+)/([0-9]+)/?(.*)', handlers.MySQLServiceHandler),
+        (r'/mysql-replica/([a-zA-Z0-9_-]+)/([0-9]+)/?(.*)', handlers.MySQLReplicaServiceHandler),
+        (r'/postgres/([a-zA-Z0-9_-]+)/([0-9]+)/?(.*)', handlers.PostgresServiceHandler),
         (r'/redis/([a-zA-Z0-9_-]+)/([0-9]+)/?(.*)', handlers.RedisSentinelServiceHandler),
         (r'/redis-info/([a-zA-Z0-9_-]+)/([0-9]+)/?(.*)', handlers.RedisInfoServiceHandler),
-        (r'/sentinel/([a-zA-Z0-9_-]+)/([0-9]+)/?(.*)', handlers.RedisSentinelServiceHandler),
+        (r'/sentinel/([a-zA-Z0-9_-]+)/([0-9]+)/?(.*)', handlers.SentinelServiceHandler),
         (r'/sentinel-info/([a-zA-Z0-9_-]+)/([0-9]+)/?(.*)', handlers.SentinelInfoServiceHandler),
         (r'/spool/([a-zA-Z0-9_-]+)/([0-9]+)/?(.*)', handlers.SpoolServiceHandler),
         (r'/haproxy/([a-zA-Z0-9_-]+)/([0-9]+)/?(.*)', handlers.HaproxyServiceHandler),
+        (r'/haproxy-socket/([a-zA-Z0-9_-]+)/([0-9]+)/?(.*)', handlers.HaproxySocketServiceHandler),
+        (r'/([a-z][a-z0-9-]*)/([a-zA-Z0-9_-]+)/([0-9]+)/?(.*)', handlers.ProtocolServiceHandler),
+        (r'/batch', handlers.BatchHandler),
+        (r'/events', handlers.EventsHandler),
+        (r'/history/([a-zA-Z0-9_-]+)', handlers.HistoryHandler),
+        (r'/metrics', handlers.MetricsHandler),
         (r'/recent', handlers.ListRecentHandler),
         (r'/status/count', handlers.ServiceCountHandler),
         (r'/status', handlers.StatusHandler),
@@ -114,7 +141,22 @@ def main():
 
     # application stuff
     cache.configure(cache_time=config.config['cache_time'])
+    events.configure(replay=config.config['events_replay'], buffer_size=config.config['events_buffer'])
+    accounting.configure(
+        window=config.config['accounting_window'],
+        buckets=config.config['accounting_buckets'],
+        top_sources=config.config['accounting_top_sources'],
+        max_services=config.config['accounting_max_services'],
+        history=config.config['history_size'],
+    )
+    flapping.configure(
+        threshold=config.config['flap_threshold'],
+        stable_probes=config.config['flap_stable_probes'],
+        cache_factor=config.config['flap_cache_factor'],
+    )
     spool.configure(spool_root=opts.spool_root)
+    procnet.configure(refresh_interval=config.config['listen_refresh_ms'] / 1000.0)
+    registry.configure(config.config['checkers'], config.config['protocols'])
     application = get_app()
     ioloop = tornado.ioloop.IOLoop.instance()
     server = tornado.httpserver.HTTPServer(application, io_loop=ioloop)
@@ -124,13 +166,61 @@ def main():
     else:
         mutornadomon_collector = None
 
+    if config.config['statsd_address'] is not None:
+        statsd.configure(
+            config.config['statsd_address'],
+            prefix=config.config['statsd_prefix'],
+            flush_interval=config.config['statsd_flush_ms'] / 1000.0,
+            max_packet_size=config.config['statsd_packet_size'],
+            io_loop=ioloop,
+        )
+
+    if config.config['loop_lag_interval_ms']:
+        blocking_threshold = config.config['blocking_threshold_ms']
+        looplag.start(
+            interval=config.config['loop_lag_interval_ms'] / 1000.0,
+            blocking_threshold=blocking_threshold / 1000.0 if blocking_threshold is not None else None,
+            io_loop=ioloop,
+        )
+
     def stop(*args):
+        looplag.stop()
+        statsd.stop()
+        redis = sys.modules.get('hacheck.redis')
+        if redis is not None:
+            redis.stop_sentinel_monitors()
         if mutornadomon_collector is not None:
             mutornadomon_collector.stop()
         ioloop.stop()
 
+    if config.config['sentinel_ports']:
+        # the Redis client is otherwise only imported by the first Redis check
+        from . import redis
+    for port in config.config['sentinel_ports']:
+        redis.monitor_sentinel(
+            port,
+            password=config.config['redis_password'],
+            timeout=checker.TIMEOUT,
+            io_loop=ioloop,
+        )
+
     for port in opts.port:
         server.listen(port, opts.bind_address)
+
+    agent_ports = list(config.config['agent_checks'])
+    if config.config['agent_port'] is not None:
+        agent_ports.append(config.config['agent_port'])
+    if agent_ports:
+        latency_target = config.config['agent_latency_target_ms']
+        agent_server = agent.AgentServer(
+            checks=config.config['agent_checks'],
+            latency_target=latency_target / 1000.0 if latency_target is not None else None,
+            min_weight=config.config['agent_min_weight'],
+            timeout=checker.TIMEOUT,
+            io_loop=ioloop,
+        )
+        for port in agent_ports:
+            agent_server.listen(port, opts.bind_address)
     for sig in (signal.SIGTERM, signal.SIGQUIT, signal.SIGINT):
         signal.signal(sig, stop)
     ioloop.start()
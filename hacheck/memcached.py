@@ -0,0 +1,165 @@
+"""persistent memcached connections speaking just enough of the text protocol for `version' and `stats'"""
+
+import copy
+import time
+try:
+    from collections import Counter
+except:
+    from .compat import Counter
+
+import tornado.gen
+
+from . import connection
+
+# the end of a `stats' reply, or an error instead of one
+END_OF_STATS = br'(?m)^(?:END|(?:CLIENT_|SERVER_)?ERROR[^\r\n]*)\r\n'
+
+default_stats = Counter({
+    'connects': 0,
+    'connect_time': 0.0,
+    'requests': 0,
+    'request_time': 0.0,
+})
+
+stats = Counter()
+stats.update(default_stats)
+
+
+def reset_stats():
+    stats.clear()
+    stats.update(default_stats)
+
+
+def get_stats():
+    return copy.copy(stats)
+
+
+class MemcachedError(Exception):
+    pass
+
+
+def _check_error(line):
+    if line.startswith(b'ERROR') or line.startswith(b'CLIENT_ERROR') or line.startswith(b'SERVER_ERROR'):
+        raise MemcachedError(line.decode('utf-8', 'replace'))
+
+
+def parse_stats(data):
+    """Parse the reply to `stats' into a dict of name to (text) value"""
+    values = {}
+    for line in data.split(b'\r\n'):
+        if line.startswith(b'STAT '):
+            _, name, value = line.split(b' ', 2)
+            values[name.decode('utf-8')] = value.decode('utf-8')
+        elif line and line != b'END':
+            _check_error(line)
+    return values
+
+
+class Stats(object):
+    """One `stats' reply, and the (values, time) of the one fetched before it (if
+    any) so that counters can be turned into rates"""
+
+    def __init__(self, values, when, previous=None):
+        self.values = values
+        self.time = when
+        self.previous = previous
+
+    def _number(self, values, name):
+        try:
+            return float(values[name])
+        except (KeyError, ValueError):
+            return None
+
+    def rate(self, name):
+        """Per-second rate of the counter `name' since the previous sample, or
+        None if there isn't one (or memcached has restarted since)"""
+        if self.previous is None:
+            return None
+        previous_values, previous_time = self.previous
+        current = self._number(self.values, name)
+        previous = self._number(previous_values, name)
+        elapsed = self.time - previous_time
+        if current is None or previous is None or current < previous or elapsed <= 0:
+            return None
+        return (current - previous) / elapsed
+
+    def get(self, name):
+        """The numeric value of `name'; `<counter>_rate' gives the rate of a counter
+
+        :raises: KeyError if there is no such stat
+        """
+        if name.endswith('_rate') and name[:-len('_rate')] in self.values:
+            return self.rate(name[:-len('_rate')])
+        if name not in self.values:
+            raise KeyError(name)
+        return self._number(self.values, name)
+
+
+class MemcachedConnection(connection.PersistentConnection):
+    def __init__(self, port, host='127.0.0.1', timeout=10, io_loop=None):
+        super(MemcachedConnection, self).__init__((host, port), timeout=timeout, io_loop=io_loop)
+        self.last_stats = None
+
+    @tornado.gen.coroutine
+    def _connect(self):
+        yield super(MemcachedConnection, self)._connect()
+        stats['connects'] += 1
+        stats['connect_time'] += self.connect_time
+
+    def send(self, data):
+        self.stream.write(data).add_done_callback(lambda f: f.exception())
+
+    @tornado.gen.coroutine
+    def _do_version(self):
+        start = time.time()
+        self.send(b'version\r\n')
+        line = yield self.stream.read_until(b'\r\n')
+        line = line[:-2]
+        _check_error(line)
+        if not line.startswith(b'VERSION '):
+            raise MemcachedError('Unexpected reply to version: %r' % line)
+        stats['requests'] += 1
+        stats['request_time'] += time.time() - start
+        raise tornado.gen.Return(line[len(b'VERSION '):].decode('utf-8'))
+
+    @tornado.gen.coroutine
+    def _do_stats(self):
+        start = time.time()
+        self.send(b'stats\r\n')
+        data = yield self.stream.read_until_regex(END_OF_STATS)
+        previous = None
+        if self.last_stats is not None:
+            previous = (self.last_stats.values, self.last_stats.time)
+        self.last_stats = Stats(parse_stats(data), time.time(), previous)
+        stats['requests'] += 1
+        stats['request_time'] += time.time() - start
+        raise tornado.gen.Return(self.last_stats)
+
+    def version(self):
+        """:returns: Future of the server's version string"""
+        return self.command(self._do_version)
+
+    def fetch_stats(self):
+        """:returns: Future of a Stats, which remembers the previous sample taken
+        over this connection"""
+        return self.command(self._do_stats)
+
+
+_connections = {}
+
+
+def persistent_connection(port, timeout=10, io_loop=None):
+    """Get the MemcachedConnection to `port'"""
+    conn = _connections.get(port)
+    if conn is None or (io_loop is not None and conn.io_loop is not io_loop):
+        if conn is not None:
+            conn.close()
+        conn = _connections[port] = MemcachedConnection(port, timeout=timeout, io_loop=io_loop)
+    conn.timeout = timeout
+    return conn
+
+
+def close_connections():
+    for conn in _connections.values():
+        conn.close()
+    _connections.clear()
@@ -0,0 +1,190 @@
+"""latency histograms and counters, exported in Prometheus' text format at /metrics
+(and passed on to statsd, if it is configured)
+
+Recording is cheap enough to do on every check: each histogram is a fixed list
+of bucket counts, allocated the first time its labels are seen, and observing a
+value is a bisect into a handful of bucket bounds and an increment. Buckets are
+only made cumulative when /metrics is read. Series labelled with a service are
+dropped when accounting forgets the service, so there are never more of them
+than accounting_max_services allows.
+"""
+
+import bisect
+import os
+import sys
+import time
+try:
+    from collections import Counter
+except:
+    from .compat import Counter
+
+from . import accounting
+from . import cache
+from . import statsd
+
+# upper bounds, in seconds, of the latency buckets (besides +Inf)
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Histogram(object):
+    __slots__ = ('counts', 'sum')
+
+    def __init__(self):
+        # counts[i] is the number of observations in (BUCKETS[i - 1], BUCKETS[i]];
+        # the last is those larger than every bound
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+
+    def clear(self):
+        self.counts[:] = [0] * len(self.counts)
+        self.sum = 0.0
+
+
+# (checker, service) to a Histogram of the time real probes (not cache hits) took
+probe_durations = {}
+# service to a Histogram of the time whole check requests took
+request_durations = {}
+# (service, code) to the number of check requests answered with that code
+responses = Counter()
+# checker to the number of probes running right now
+in_progress = Counter()
+# how late the IOLoop ran the lag monitor's (see looplag) timeouts
+loop_lag = Histogram()
+
+
+def reset_stats():
+    probe_durations.clear()
+    request_durations.clear()
+    responses.clear()
+    in_progress.clear()
+    loop_lag.clear()
+
+
+def forget(service_names):
+    """Drop the series of services which accounting has forgotten"""
+    for checker, service_name in list(probe_durations):
+        if service_name in service_names:
+            del probe_durations[checker, service_name]
+    for service_name in list(request_durations):
+        if service_name in service_names:
+            del request_durations[service_name]
+    for service_name, code in list(responses):
+        if service_name in service_names:
+            del responses[service_name, code]
+
+
+accounting.forget_callbacks.append(forget)
+
+
+def _histogram(histograms, key):
+    histogram = histograms.get(key)
+    if histogram is None:
+        histogram = histograms[key] = Histogram()
+    return histogram
+
+
+def record_probe(checker, service_name, future):
+    """Count the probe `future' (just started by `checker') as in progress until
+    it finishes, then record how long it took"""
+    start = time.time()
+    in_progress[checker] += 1
+
+    def done(f):
+        in_progress[checker] -= 1
+        duration = time.time() - start
+        _histogram(probe_durations, (checker, service_name)).observe(duration)
+        if statsd.client is not None:
+            statsd.client.timing('probe_time.%s.%s' % (checker, service_name), 1000.0 * duration)
+
+    future.add_done_callback(done)
+
+
+def record_request(service_name, code, duration):
+    _histogram(request_durations, service_name).observe(duration)
+    responses[service_name, code] += 1
+    if statsd.client is not None:
+        statsd.client.incr('requests.%s.%d' % (service_name, code))
+        statsd.client.timing('request_time.%s' % service_name, 1000.0 * duration)
+
+
+def open_fds():
+    try:
+        return len(os.listdir('/proc/self/fd'))
+    except OSError:
+        return None
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _labels(names, values):
+    return ','.join('%s="%s"' % (name, _escape(value)) for name, value in zip(names, values))
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def _render_histograms(lines, name, help_text, label_names, histograms):
+    lines.append('# HELP %s %s' % (name, help_text))
+    lines.append('# TYPE %s histogram' % name)
+    for key, histogram in sorted(histograms.items()):
+        if not isinstance(key, tuple):
+            key = (key,)
+        labels = _labels(label_names, key)
+        bucket_labels = labels + ',' if labels else ''
+        labels = '{%s}' % labels if labels else ''
+        total = 0
+        for bound, count in zip(BUCKETS, histogram.counts):
+            total += count
+            lines.append('%s_bucket{%sle="%s"} %d' % (name, bucket_labels, bound, total))
+        total += histogram.counts[-1]
+        lines.append('%s_bucket{%sle="+Inf"} %d' % (name, bucket_labels, total))
+        lines.append('%s_sum%s %s' % (name, labels, _format_value(histogram.sum)))
+        lines.append('%s_count%s %d' % (name, labels, total))
+
+
+def _render_samples(lines, name, metric_type, help_text, samples):
+    lines.append('# HELP %s %s' % (name, help_text))
+    lines.append('# TYPE %s %s' % (name, metric_type))
+    for labels, value in samples:
+        lines.append('%s%s %s' % (name, '{%s}' % labels if labels else '', _format_value(value)))
+
+
+def render(start_time):
+    """All metrics, in Prometheus' text exposition format"""
+    lines = []
+    _render_histograms(lines, 'hacheck_probe_duration_seconds', 'Time taken by probes that missed the cache.',
+                       ('checker', 'service'), probe_durations)
+    _render_histograms(lines, 'hacheck_request_duration_seconds', 'Time taken to answer check requests.',
+                       ('service',), request_durations)
+    _render_samples(lines, 'hacheck_responses_total', 'counter', 'Check requests answered, by status code.',
+                    [(_labels(('service', 'code'), key), value) for key, value in sorted(responses.items())])
+    _render_samples(lines, 'hacheck_probes_in_progress', 'gauge', 'Probes running right now.',
+                    [(_labels(('checker',), (checker,)), value) for checker, value in sorted(in_progress.items())])
+    _render_histograms(lines, 'hacheck_ioloop_lag_seconds', 'How late the IOLoop ran timeouts.', (),
+                       {(): loop_lag})
+    looplag = sys.modules.get('hacheck.looplag')
+    if looplag is not None:
+        _render_samples(lines, 'hacheck_ioloop_blocked_total', 'counter',
+                        'Callbacks which blocked the IOLoop for longer than blocking_threshold_ms.',
+                        [('', looplag.stats['blocked'])])
+    cache_stats = cache.get_stats()
+    for stat in ('gets', 'hits', 'misses', 'expirations', 'sets'):
+        _render_samples(lines, 'hacheck_cache_%s_total' % stat, 'counter', 'Cache %s.' % stat,
+                        [('', cache_stats[stat])])
+    fds = open_fds()
+    if fds is not None:
+        _render_samples(lines, 'process_open_fds', 'gauge', 'Number of open file descriptors.', [('', fds)])
+    _render_samples(lines, 'process_start_time_seconds', 'gauge', 'Start time of the process since the epoch.',
+                    [('', float(start_time))])
+    return '\n'.join(lines) + '\n'
@@ -1,53 +1,169 @@
-"""clean-room implementation of a mysql client supporting both *connect* and *quit* operations"""
+"""clean-room implementation of a mysql client supporting *connect*, *ping*, *query* and *quit* operations"""
 
+import copy
 import datetime
 import socket
 import struct
-import sys
 import time
 from hashlib import sha1
-
-from . import compat
+try:
+    from collections import Counter
+except:
+    from .compat import Counter
 
 import tornado.gen
 import tornado.iostream
 
+from . import connection
+
+COM_QUIT = 0x01
+COM_QUERY = 0x03
+COM_PING = 0x0e
+
+CAPABILITIES = 0x200 | 0x400 | 0x8000 | 0x80000  # protocol 4.1, transactions, secure auth, plugin auth
+
+default_stats = Counter({
+    'connects': 0,
+    'connect_time': 0.0,
+    'pings': 0,
+    'ping_time': 0.0,
+    'queries': 0,
+    'query_time': 0.0,
+})
+
+stats = Counter()
+stats.update(default_stats)
+
+
+def reset_stats():
+    stats.clear()
+    stats.update(default_stats)
+
+
+def get_stats():
+    return copy.copy(stats)
+
+
+class MySQLError(Exception):
+    def __init__(self, response):
+        super(MySQLError, self).__init__(repr(response))
+        self.response = response
+
+
+def _to_bytes(s):
+    if isinstance(s, bytes):
+        return s
+    return s.encode('utf-8')
+
 
 def _sxor(lhs, rhs):
-    if sys.version_info > (3, 0):
-        return b''.join(compat.bchr(a ^ b) for a, b in zip(lhs, rhs))
-    else:
-        return b''.join(compat.bchr(ord(a) ^ ord(b)) for a, b in zip(lhs, rhs))
+    return bytes(bytearray(a ^ b for a, b in zip(bytearray(lhs), bytearray(rhs))))
+
+
+# SHA1(password) and SHA1(SHA1(password)) don't depend on the salt, so only
+# the last SHA1 has to be computed per login
+_password_stages = {}
+
+
+def _hash_password_stages(password):
+    stages = _password_stages.get(password)
+    if stages is None:
+        stage1 = sha1(_to_bytes(password)).digest()
+        stages = _password_stages[password] = (stage1, sha1(stage1).digest())
+    return stages
 
 
 def _stupid_hash_password(salt, password):
-    password = password.encode('utf-8')
-    salt = salt.encode('utf-8')
-    return _sxor(
-        sha1(password).digest(),
-        sha1(
-            salt + sha1(sha1(password).digest()).digest()
-        ).digest()
+    stage1, stage2 = _hash_password_stages(password)
+    return _sxor(stage1, sha1(_to_bytes(salt) + stage2).digest())
+
+
+def _handshake_response(username, password, salt):
+    packet = struct.pack(
+        '<IIB23x',
+        CAPABILITIES,  # connection flags
+        1024,  # max packet size
+        0x21,  # char set == utf8
     )
+    packet += _to_bytes(username) + b'\0'
+    auth_response = _stupid_hash_password(password=password, salt=salt)
+    packet += struct.pack('B', len(auth_response))
+    packet += auth_response
+    packet += b'mysql_native_password\0'
+    return packet
 
 
+def _pack_packet(contents, sequence):
+    return struct.pack('<I', len(contents))[:3] + struct.pack('B', sequence) + contents
+
+
+# Length-encoded integers and strings are read with struct.unpack_from at an
+# offset into the packet, so that walking a row doesn't copy what's left of it
+# at every field
 def _read_lenc(buf, offset=0):
-    first = struct.unpack('B', buf[offset:offset + 1])[0]
+    first = struct.unpack_from('B', buf, offset)[0]
     if first < 0xfb:
         return first, offset + 1
+    elif first == 0xfb:
+        return None, offset + 1
     elif first == 0xfc:
-        return struct.unpack('<H', buf[offset + 1:offset + 3])[0], offset + 3
+        return struct.unpack_from('<H', buf, offset + 1)[0], offset + 3
     elif first == 0xfd:
-        return struct.unpack('<I', buf[offset + 1:offset + 4] + b'\0')[0], offset + 4
+        low, high = struct.unpack_from('<HB', buf, offset + 1)
+        return low | (high << 16), offset + 4
     elif first == 0xfe:
-        return struct.unpack('<Q', buf[offset + 1:offset + 9])[0], offset + 9
+        return struct.unpack_from('<Q', buf, offset + 1)[0], offset + 9
+
+
+def _read_lenc_string(buf, offset=0):
+    length, offset = _read_lenc(buf, offset)
+    if length is None:
+        return None, offset
+    return buf[offset:offset + length], offset + length
+
+
+def _parse_row(payload, column_count):
+    """Parse a text-protocol resultset row into a tuple of bytes (or None for NULL)"""
+    row = []
+    offset = 0
+    for _ in range(column_count):
+        value, offset = _read_lenc_string(payload, offset)
+        row.append(value)
+    return tuple(row)
+
+
+def _column_name(payload):
+    """The `name' of a ColumnDefinition41 packet, which follows the catalog,
+    schema, table and org_table strings"""
+    offset = 0
+    for _ in range(4):
+        length, offset = _read_lenc(payload, offset)
+        offset += length
+    name, _ = _read_lenc_string(payload, offset)
+    return name.decode('utf-8')
+
+
+def _is_eof(payload):
+    return payload[:1] == b'\xfe' and len(payload) < 9
+
+
+class ResultSet(object):
+    """The columns and rows returned by a COM_QUERY; values are bytes, or None
+    for NULL"""
+
+    def __init__(self, columns, rows):
+        self.columns = columns
+        self.rows = rows
+
+    def dicts(self):
+        return [dict(zip(self.columns, row)) for row in self.rows]
 
 
 class MySQLResponse(object):
     def __init__(self, packet_contents):
         self.packet = packet_contents
-        self.header = struct.unpack('B', packet_contents[0])[0]
-        self.message = ''
+        self.header = struct.unpack('B', packet_contents[0:1])[0]
+        self.message = b''
 
         # per-type response parsing
         if self.header == 0x00:
@@ -59,19 +175,18 @@ class MySQLResponse(object):
             self.message = packet_contents[offset + 4:]
         elif self.header == 0x0a:
             self.response_type = 'CONN 10'
-            sve = packet_contents.index('\0')
+            sve = packet_contents.index(b'\0')
             self.server_version = packet_contents[1:sve]
             sve += 1
             self.connection_id, pd_low, cf_low = struct.unpack(
                 '<I8sx2s',
                 packet_contents[sve:sve + 15]
             )
-            self.character_set, self.status_flags, cf_high = struct.unpack(
-                'BH2s',
+            self.character_set, self.status_flags, cf_high, pd_len = struct.unpack(
+                '<BH2sB',
                 packet_contents[sve + 15:sve + 21]
             )
             self.capability_flags = struct.unpack('<I', cf_low + cf_high)[0]
-            pd_len = struct.unpack('B', packet_contents[sve + 20:sve + 21])[0]
             # skip 10 bytes for REASONS
             pd_end = sve + 31 + max(13, pd_len - 8)
             pd_high = packet_contents[sve + 31:pd_end - 1]
@@ -82,7 +197,7 @@ class MySQLResponse(object):
         elif self.header == 0xff:
             self.response_type = 'ERR'
             self.error_code, _, self.sql_state = struct.unpack(
-                'Hc5s',
+                '<Hc5s',
                 packet_contents[1:9]
             )
             self.message = packet_contents[9:]
@@ -138,27 +253,14 @@ class MySQLClient(object):
         yield self._connect_socket()
         connection_response = yield self.read_response()
         assert connection_response.header == 0x0a
-        connection_packet = struct.pack(
-            '<IIB23x',
-            0x200 | 0x400 | 0x8000 | 0x80000,  # connection flags
-            1024,  # max packet size
-            0x21,  # char set == utf8
-        )
-        connection_packet += username.encode('utf8') + '\0'
-        auth_response = _stupid_hash_password(password=password, salt=connection_response.plugin_data)
-        connection_packet += struct.pack('B', len(auth_response))
-        connection_packet += auth_response
-        connection_packet += 'mysql_native_password\0'
+        connection_packet = _handshake_response(username, password, connection_response.plugin_data)
         yield self.write(self._pack_packet(connection_packet))
         resp = yield self.read_response()
         raise tornado.gen.Return(resp)
 
     def _pack_packet(self, contents):
-        size = len(contents)
-        packet_size = struct.pack('<i', size)[:3]
-        sequence_number = struct.pack('B', self.sequence)
+        packet = _pack_packet(contents, self.sequence)
         self.sequence += 1
-        packet = packet_size + sequence_number + contents
         return packet
 
     def write(self, bytez):
@@ -170,7 +272,7 @@ class MySQLClient(object):
     @tornado.gen.coroutine
     def quit(self):
         assert self.connected
-        packet_contents = struct.pack('B', 0x01)
+        packet_contents = struct.pack('B', COM_QUIT)
         self.sequence = 0
         yield self.write(self._pack_packet(packet_contents))
         try:
@@ -186,3 +288,129 @@ class MySQLClient(object):
         sequence_number = struct.unpack('B', sequence_number)[0]
         packet = yield self.read_bytes(packet_length)
         raise tornado.gen.Return(MySQLResponse(packet))
+
+
+class MySQLConnection(connection.PersistentConnection):
+    """An authenticated connection to a MySQL server which is kept open between
+    checks and probed with COM_PING, instead of logging in and out every time"""
+
+    def __init__(self, port, username, password, host='127.0.0.1', timeout=10, io_loop=None):
+        super(MySQLConnection, self).__init__((host, port), timeout=timeout, io_loop=io_loop)
+        self.username = username
+        self.password = password
+        self.ping_time = None
+        self._ping = None
+
+    @tornado.gen.coroutine
+    def read_packet(self):
+        header = yield self.stream.read_bytes(4)
+        length, sequence = struct.unpack('<IB', header[:3] + b'\0' + header[3:])
+        payload = yield self.stream.read_bytes(length)
+        raise tornado.gen.Return((sequence, payload))
+
+    @tornado.gen.coroutine
+    def read_response(self):
+        sequence, payload = yield self.read_packet()
+        raise tornado.gen.Return(MySQLResponse(payload))
+
+    def send(self, contents, sequence=0):
+        self.stream.write(_pack_packet(contents, sequence)).add_done_callback(lambda f: f.exception())
+
+    @tornado.gen.coroutine
+    def _connect(self):
+        yield super(MySQLConnection, self)._connect()
+        stats['connects'] += 1
+        stats['connect_time'] += self.connect_time
+
+    @tornado.gen.coroutine
+    def handshake(self):
+        greeting = yield self.read_response()
+        if greeting.header != 0x0a:
+            raise MySQLError(greeting)
+        self.send(_handshake_response(self.username, self.password, greeting.plugin_data), sequence=1)
+        response = yield self.read_response()
+        if not response.OK:
+            raise MySQLError(response)
+
+    @tornado.gen.coroutine
+    def _do_ping(self):
+        start = time.time()
+        self.send(struct.pack('B', COM_PING))
+        response = yield self.read_response()
+        if not response.OK:
+            raise MySQLError(response)
+        self.ping_time = time.time() - start
+        stats['pings'] += 1
+        stats['ping_time'] += self.ping_time
+        raise tornado.gen.Return(response)
+
+    def ping(self):
+        """Send COM_PING, (re)connecting and logging in first if necessary.
+        Concurrent callers share a single ping.
+
+        :returns: Future of the OK MySQLResponse
+        :raises: MySQLError if logging in or the ping is refused
+        """
+        if self._ping is None or self._ping.done():
+            self._ping = self.command(self._do_ping)
+        return self._ping
+
+    @tornado.gen.coroutine
+    def _do_query(self, sql):
+        start = time.time()
+        self.send(struct.pack('B', COM_QUERY) + _to_bytes(sql))
+        _, payload = yield self.read_packet()
+        if payload[:1] == b'\xff':
+            raise MySQLError(MySQLResponse(payload))
+        if payload[:1] == b'\x00':
+            columns, rows = [], []
+        else:
+            column_count, _ = _read_lenc(payload)
+            columns = []
+            for _ in range(column_count):
+                _, payload = yield self.read_packet()
+                columns.append(_column_name(payload))
+            _, payload = yield self.read_packet()
+            if not _is_eof(payload):
+                raise MySQLError(MySQLResponse(payload))
+            rows = []
+            while True:
+                _, payload = yield self.read_packet()
+                if _is_eof(payload):
+                    break
+                elif payload[:1] == b'\xff':
+                    raise MySQLError(MySQLResponse(payload))
+                rows.append(_parse_row(payload, column_count))
+        stats['queries'] += 1
+        stats['query_time'] += time.time() - start
+        raise tornado.gen.Return(ResultSet(columns, rows))
+
+    def query(self, sql):
+        """Run `sql' with COM_QUERY, (re)connecting and logging in first if necessary
+
+        :returns: Future of a ResultSet
+        :raises: MySQLError if the query fails
+        """
+        return self.command(self._do_query, sql)
+
+
+_connections = {}
+
+
+def persistent_connection(port, username, password, timeout=10, io_loop=None):
+    """Get the MySQLConnection to `port', replacing it if the credentials or
+    the IOLoop have changed"""
+    conn = _connections.get(port)
+    if conn is None or (conn.username, conn.password) != (username, password) or \
+            (io_loop is not None and conn.io_loop is not io_loop):
+        if conn is not None:
+            conn.close()
+        conn = _connections[port] = MySQLConnection(port, username, password, timeout=timeout, io_loop=io_loop)
+    conn.timeout = timeout
+    return conn
+
+
+def close_connections():
+    for conn in _connections.values():
+        conn.close()
+    _connections.clear()
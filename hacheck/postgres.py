@@ -0,0 +1,282 @@
+"""clean-room implementation of a postgresql (protocol 3.0) client supporting *startup*, *query* and *terminate*"""
+
+import base64
+import copy
+import hashlib
+import hmac
+import os
+import struct
+import time
+try:
+    from collections import Counter
+except:
+    from .compat import Counter
+
+import tornado.gen
+
+from . import connection
+from .compat import pbkdf2_hmac
+
+PROTOCOL_VERSION = 196608  # 3.0
+
+AUTH_OK = 0
+AUTH_CLEARTEXT_PASSWORD = 3
+AUTH_MD5_PASSWORD = 5
+AUTH_SASL = 10
+AUTH_SASL_CONTINUE = 11
+AUTH_SASL_FINAL = 12
+
+SCRAM_SHA_256 = b'SCRAM-SHA-256'
+
+default_stats = Counter({
+    'connects': 0,
+    'connect_time': 0.0,
+    'queries': 0,
+    'query_time': 0.0,
+})
+
+stats = Counter()
+stats.update(default_stats)
+
+
+def reset_stats():
+    stats.clear()
+    stats.update(default_stats)
+
+
+def get_stats():
+    return copy.copy(stats)
+
+
+class PostgresError(Exception):
+    """An ErrorResponse from the server (or a login we can't complete); `fields'
+    maps ErrorResponse field codes (`S'everity, `C'ode, `M'essage, ...) to values"""
+
+    def __init__(self, fields):
+        self.fields = fields
+        super(PostgresError, self).__init__('%s %s: %s' % (
+            fields.get('S', 'ERROR'), fields.get('C', '?????'), fields.get('M', '')
+        ))
+
+
+def _to_bytes(s):
+    if isinstance(s, bytes):
+        return s
+    return s.encode('utf-8')
+
+
+def _message(kind, body):
+    return kind + struct.pack('!I', len(body) + 4) + body
+
+
+def _startup_message(user, database):
+    body = struct.pack('!I', PROTOCOL_VERSION)
+    for key, value in (('user', user), ('database', database), ('application_name', 'hacheck')):
+        body += _to_bytes(key) + b'\0' + _to_bytes(value) + b'\0'
+    body += b'\0'
+    return struct.pack('!I', len(body) + 4) + body
+
+
+def _md5_password(user, password, salt):
+    inner = hashlib.md5(_to_bytes(password) + _to_bytes(user)).hexdigest().encode('ascii')
+    return b'md5' + hashlib.md5(inner + salt).hexdigest().encode('ascii')
+
+
+def _hmac(key, message):
+    return hmac.new(key, message, hashlib.sha256).digest()
+
+
+def _scram_attributes(message):
+    return dict(attribute.split(b'=', 1) for attribute in message.split(b','))
+
+
+class ScramSHA256(object):
+    """The client side of a SCRAM-SHA-256 exchange (RFC 5802, RFC 7677). The
+    server takes the user from the startup message, so by default none is sent
+    here; channel binding isn't used."""
+
+    def __init__(self, password, user=b'', nonce=None):
+        self.password = _to_bytes(password)
+        self.nonce = nonce or base64.b64encode(os.urandom(18))
+        self.client_first_bare = b'n=' + _to_bytes(user) + b',r=' + self.nonce
+        self.server_signature = None
+
+    def client_first(self):
+        return b'n,,' + self.client_first_bare
+
+    def client_final(self, server_first):
+        attributes = _scram_attributes(server_first)
+        nonce = attributes[b'r']
+        if not nonce.startswith(self.nonce):
+            raise PostgresError({'S': 'FATAL', 'M': 'SCRAM server nonce does not extend ours'})
+        salted_password = pbkdf2_hmac('sha256', self.password, base64.b64decode(attributes[b's']),
+                                      int(attributes[b'i']))
+        client_key = _hmac(salted_password, b'Client Key')
+        without_proof = b'c=' + base64.b64encode(b'n,,') + b',r=' + nonce
+        auth_message = self.client_first_bare + b',' + server_first + b',' + without_proof
+        client_signature = _hmac(hashlib.sha256(client_key).digest(), auth_message)
+        proof = bytes(bytearray(a ^ b for a, b in zip(bytearray(client_key), bytearray(client_signature))))
+        self.server_signature = _hmac(_hmac(salted_password, b'Server Key'), auth_message)
+        return without_proof + b',p=' + base64.b64encode(proof)
+
+    def verify(self, server_final):
+        attributes = _scram_attributes(server_final)
+        if b'e' in attributes:
+            raise PostgresError({'S': 'FATAL', 'M': 'SCRAM authentication failed: %s' %
+                                 attributes[b'e'].decode('utf-8', 'replace')})
+        if base64.b64decode(attributes.get(b'v', b'')) != self.server_signature:
+            raise PostgresError({'S': 'FATAL', 'M': 'SCRAM server signature does not match'})
+
+
+def _parse_error(body):
+    fields = {}
+    for field in body.split(b'\0'):
+        if field:
+            fields[field[:1].decode('ascii')] = field[1:].decode('utf-8', 'replace')
+    return fields
+
+
+def _parse_data_row(body):
+    """Parse a DataRow into a tuple of bytes (or None for NULL)"""
+    count = struct.unpack_from('!H', body)[0]
+    offset = 2
+    row = []
+    for _ in range(count):
+        length = struct.unpack_from('!i', body, offset)[0]
+        offset += 4
+        if length < 0:
+            row.append(None)
+        else:
+            row.append(body[offset:offset + length])
+            offset += length
+    return tuple(row)
+
+
+class PostgresConnection(connection.PersistentConnection):
+    """A connection to a PostgreSQL server which is logged in (that is, has seen
+    ReadyForQuery) by the time `call' runs anything on it"""
+
+    def __init__(self, port, user, password=None, database=None, host='127.0.0.1', timeout=10, io_loop=None):
+        super(PostgresConnection, self).__init__((host, port), timeout=timeout, io_loop=io_loop)
+        self.user = user
+        self.password = password
+        self.database = database or user
+        self.query_time = None
+
+    @tornado.gen.coroutine
+    def read_message(self):
+        header = yield self.stream.read_bytes(5)
+        kind, length = struct.unpack('!cI', header)
+        body = b''
+        if length > 4:
+            body = yield self.stream.read_bytes(length - 4)
+        raise tornado.gen.Return((kind, body))
+
+    def send(self, data):
+        self.stream.write(data).add_done_callback(lambda f: f.exception())
+
+    @tornado.gen.coroutine
+    def _connect(self):
+        yield super(PostgresConnection, self)._connect()
+        stats['connects'] += 1
+        stats['connect_time'] += self.connect_time
+
+    @tornado.gen.coroutine
+    def handshake(self):
+        self.send(_startup_message(self.user, self.database))
+        scram = None
+        while True:
+            kind, body = yield self.read_message()
+            if kind == b'R':
+                method = struct.unpack_from('!I', body)[0]
+                if method == AUTH_OK:
+                    continue
+                if self.password is None:
+                    raise PostgresError({'S': 'FATAL', 'M': 'server asked for a password and none is configured'})
+                if method == AUTH_CLEARTEXT_PASSWORD:
+                    self.send(_message(b'p', _to_bytes(self.password) + b'\0'))
+                elif method == AUTH_MD5_PASSWORD:
+                    self.send(_message(b'p', _md5_password(self.user, self.password, body[4:8]) + b'\0'))
+                elif method == AUTH_SASL:
+                    if SCRAM_SHA_256 not in body[4:].split(b'\0'):
+                        raise PostgresError({'S': 'FATAL', 'M': 'no supported SASL mechanism in %r' % body[4:]})
+                    scram = ScramSHA256(self.password)
+                    first = scram.client_first()
+                    self.send(_message(b'p', SCRAM_SHA_256 + b'\0' + struct.pack('!I', len(first)) + first))
+                elif method == AUTH_SASL_CONTINUE and scram is not None:
+                    self.send(_message(b'p', scram.client_final(body[4:])))
+                elif method == AUTH_SASL_FINAL and scram is not None:
+                    scram.verify(body[4:])
+                else:
+                    raise PostgresError({'S': 'FATAL', 'M': 'unsupported authentication method %d' % method})
+            elif kind == b'E':
+                raise PostgresError(_parse_error(body))
+            elif kind == b'Z':
+                return
+
+    @tornado.gen.coroutine
+    def _nothing(self):
+        pass
+
+    def startup(self):
+        """Connect and log in (if not already connected)"""
+        return self.command(self._nothing)
+
+    @tornado.gen.coroutine
+    def _do_query(self, sql):
+        start = time.time()
+        self.send(_message(b'Q', _to_bytes(sql) + b'\0'))
+        rows = []
+        error = None
+        # an error still ends with ReadyForQuery; read up to it so that the
+        # connection can be used again
+        while True:
+            kind, body = yield self.read_message()
+            if kind == b'D':
+                rows.append(_parse_data_row(body))
+            elif kind == b'E':
+                error = PostgresError(_parse_error(body))
+            elif kind == b'Z':
+                break
+        if error is not None:
+            raise error
+        self.query_time = time.time() - start
+        stats['queries'] += 1
+        stats['query_time'] += self.query_time
+        raise tornado.gen.Return(rows)
+
+    def query(self, sql):
+        """Run `sql' with the simple query protocol, (re)connecting first if necessary
+
+        :returns: Future of a list of rows, each a tuple of bytes (or None for NULL)
+        :raises: PostgresError if the query fails
+        """
+        return self.command(self._do_query, sql)
+
+    def terminate(self):
+        if not self.closed():
+            self.send(_message(b'X', b''))
+        self.close()
+
+
+_connections = {}
+
+
+def persistent_connection(port, user, password=None, database=None, timeout=10, io_loop=None):
+    """Get the PostgresConnection to `port', replacing it if the login details or
+    the IOLoop have changed"""
+    conn = _connections.get(port)
+    if conn is None or (conn.user, conn.password, conn.database) != (user, password, database or user) or \
+            (io_loop is not None and conn.io_loop is not io_loop):
+        if conn is not None:
+            conn.close()
+        conn = _connections[port] = PostgresConnection(port, user, password, database, timeout=timeout,
+                                                       io_loop=io_loop)
+    conn.timeout = timeout
+    return conn
+
+
+def close_connections():
+    for conn in _connections.values():
+        conn.close()
+    _connections.clear()
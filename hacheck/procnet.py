@@ -0,0 +1,81 @@
+"""snapshot of listening TCP sockets, parsed from /proc/net/tcp and /proc/net/tcp6"""
+
+import socket
+import struct
+import time
+
+# the `st' column of /proc/net/tcp; see include/net/tcp_states.h
+TCP_LISTEN = '0A'
+
+config = {
+    'refresh_interval': 1.0,
+    'paths': ('/proc/net/tcp', '/proc/net/tcp6'),
+}
+
+_snapshot = {
+    'loaded_at': None,
+    'ports': {},
+}
+
+
+def configure(refresh_interval=config['refresh_interval']):
+    """Configure the refresh interval (in seconds) and drop the current snapshot"""
+    config['refresh_interval'] = refresh_interval
+    _snapshot['loaded_at'] = None
+    _snapshot['ports'] = {}
+
+
+def parse(lines, ports=None):
+    """Parse the lines of a /proc/net/tcp{,6} file
+
+    :returns: dict of port number to set of hex-encoded local addresses in the LISTEN state
+    """
+    if ports is None:
+        ports = {}
+    for line in lines:
+        fields = line.split()
+        if len(fields) < 4 or fields[3] != TCP_LISTEN:
+            continue
+        address, _, port = fields[1].rpartition(':')
+        ports.setdefault(int(port, 16), set()).add(address)
+    return ports
+
+
+def format_address(address):
+    """Turn a hex-encoded /proc/net/tcp address into something human-readable"""
+    if len(address) == 8:
+        return socket.inet_ntoa(struct.pack('<I', int(address, 16)))
+    words = [int(address[i:i + 8], 16) for i in range(0, 32, 8)]
+    return '[%s]' % socket.inet_ntop(socket.AF_INET6, struct.pack('<4I', *words))
+
+
+def refresh(now=None):
+    ports = {}
+    read_any = False
+    last_error = None
+    for path in config['paths']:
+        try:
+            with open(path, 'r') as f:
+                parse(f, ports)
+            read_any = True
+        except EnvironmentError as e:
+            last_error = e
+    if not read_any:
+        raise last_error
+    _snapshot['ports'] = ports
+    _snapshot['loaded_at'] = time.time() if now is None else now
+
+
+def listening_addresses(port, now=None):
+    """Look up the local addresses listening on `port', refreshing the snapshot
+    if it is older than the configured refresh interval
+
+    :raises: EnvironmentError if none of the /proc files could be read
+    :returns: set of hex-encoded addresses (empty if nothing is listening)
+    """
+    if now is None:
+        now = time.time()
+    loaded_at = _snapshot['loaded_at']
+    if loaded_at is None or now - loaded_at >= config['refresh_interval']:
+        refresh(now)
+    return _snapshot['ports'].get(port, set())
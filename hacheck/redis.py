@@ -0,0 +1,440 @@
+"""clean-room implementation of just enough of the redis protocol (RESP) to health-check redis and sentinel,
+over pooled, persistent and pipelined connections"""
+
+import copy
+import datetime
+import json
+import logging
+import re
+import socket
+import time
+
+import tornado.gen
+import tornado.ioloop
+import tornado.iostream
+
+from . import connection
+
+log = logging.getLogger('hacheck')
+
+
+class RedisError(Exception):
+    """An error reply from the server"""
+    pass
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def encode_command(*args):
+    parts = [b'*' + str(len(args)).encode('ascii') + b'\r\n']
+    for arg in args:
+        if not isinstance(arg, bytes):
+            arg = str(arg).encode('utf-8')
+        parts.append(b'$' + str(len(arg)).encode('ascii') + b'\r\n' + arg + b'\r\n')
+    return b''.join(parts)
+
+
+# the order in which Sentinel lists the properties of each master in INFO
+MASTER_KEYS = ('name', 'status', 'address', 'slaves', 'sentinels')
+
+
+class InfoSnapshot(object):
+    """A parsed INFO reply
+
+    `fields' maps every field to its value, and `sections' maps each
+    (lower-cased) section name to a dict of just its fields. Values are kept as
+    strings, and may themselves contain colons. Sentinel's `masterN' lines are
+    also broken out into `masters', and the address of the last one listed is
+    exposed as the `redis_master' field.
+    """
+
+    # one match per `field:value' line; `# Section' headers have no colon
+    FIELD = re.compile(r'^([^:\r\n]+):([^\r\n]*)', re.M)
+
+    def __init__(self, payload):
+        self._text = payload.decode('utf-8', 'replace')
+        self._sections = None
+        self._json = None
+        self.fields = dict(self.FIELD.findall(self._text))
+        self.masters = []
+        if 'sentinel_masters' in self.fields:
+            numbered = []
+            for key, value in self.fields.items():
+                if key.startswith('master') and key[6:].isdigit():
+                    numbered.append((int(key[6:]), value))
+            for _, value in sorted(numbered):
+                master = dict(item.partition('=')[::2] for item in value.split(','))
+                self.masters.append(master)
+                if 'address' in master:
+                    self.fields['redis_master'] = master['address']
+
+    @property
+    def sections(self):
+        """Fields by section; only worked out if somebody asks"""
+        if self._sections is None:
+            self._sections = {}
+            for i, chunk in enumerate(('\n' + self._text).split('\n#')):
+                if i == 0:
+                    name, body = '', chunk
+                else:
+                    name, _, body = chunk.partition('\n')
+                    name = name.strip().lower()
+                self._sections.setdefault(name, {}).update(self.FIELD.findall(body))
+        return self._sections
+
+    @property
+    def json(self):
+        """The flat fields, JSON-encoded (once)"""
+        if self._json is None:
+            self._json = json.dumps(self.fields)
+        return self._json
+
+    def match(self, wanted):
+        """Find the first field whose value is one of those wanted
+
+        :param wanted: dict of field name to list of acceptable values (e.g. from parse_qs)
+        :returns: (field, value) or None
+        """
+        for key, values in wanted.items():
+            actual = self.fields.get(key)
+            if actual is not None and actual in values:
+                return key, actual
+        return None
+
+    def with_masters(self, masters):
+        """A copy of this snapshot, with Sentinel's view of its masters replaced by `masters'"""
+        snapshot = copy.copy(self)
+        snapshot._json = None
+        snapshot._sections = None
+        snapshot.masters = masters
+        snapshot.fields = dict(self.fields)
+        for i, master in enumerate(masters):
+            keys = [k for k in MASTER_KEYS if k in master] + sorted(set(master) - set(MASTER_KEYS))
+            snapshot.fields['master%d' % i] = ','.join('%s=%s' % (k, master[k]) for k in keys)
+            if 'address' in master:
+                snapshot.fields['redis_master'] = master['address']
+        return snapshot
+
+
+class RedisConnection(connection.PersistentConnection):
+    """A single connection. Commands may be pipelined: they are written as soon
+    as they are issued, and replies are read back in order."""
+
+    def __init__(self, port, host='127.0.0.1', password=None, timeout=10, io_loop=None):
+        super(RedisConnection, self).__init__((host, port), timeout=timeout, io_loop=io_loop)
+        self.password = password
+        self.pending = 0
+        self._last_reply = None
+
+    @tornado.gen.coroutine
+    def handshake(self):
+        self._last_reply = None
+        if self.password is not None:
+            self.send(encode_command(b'AUTH', self.password))
+            reply = yield self.read_reply()
+            if isinstance(reply, RedisError):
+                raise reply
+
+    @tornado.gen.coroutine
+    def read_reply(self):
+        """Read a single (possibly nested) reply. Error replies are returned as
+        RedisError instances rather than raised, so that pipelining continues."""
+        line = yield self.stream.read_until(b'\r\n')
+        prefix, rest = line[:1], line[1:-2]
+        if prefix == b'+':
+            raise tornado.gen.Return(rest)
+        elif prefix == b'-':
+            raise tornado.gen.Return(RedisError(rest.decode('utf-8', 'replace')))
+        elif prefix == b':':
+            raise tornado.gen.Return(int(rest))
+        elif prefix == b'$':
+            length = int(rest)
+            if length < 0:
+                raise tornado.gen.Return(None)
+            data = yield self.stream.read_bytes(length + 2)
+            raise tornado.gen.Return(data[:-2])
+        elif prefix == b'*':
+            length = int(rest)
+            if length < 0:
+                raise tornado.gen.Return(None)
+            items = []
+            for _ in range(length):
+                item = yield self.read_reply()
+                items.append(item)
+            raise tornado.gen.Return(items)
+        raise ProtocolError('Unexpected reply %r' % line)
+
+    @tornado.gen.coroutine
+    def _read_reply_after(self, previous, stream):
+        if previous is not None:
+            try:
+                yield previous
+            except Exception:
+                # the connection was closed, and our reply with it
+                raise tornado.iostream.StreamClosedError()
+        if self.stream is not stream:
+            raise tornado.iostream.StreamClosedError()
+        reply = yield self.read_reply()
+        raise tornado.gen.Return(reply)
+
+    def send(self, data):
+        # the write future is deliberately not waited on: IOStream orphans all
+        # but the latest one, and a failed write shows up as a failed read anyway
+        self.stream.write(data).add_done_callback(lambda f: f.exception())
+
+    def _execute(self, command):
+        self.send(command)
+        self._last_reply = self._read_reply_after(self._last_reply, self.stream)
+        return self._last_reply
+
+    @tornado.gen.coroutine
+    def execute(self, *args):
+        """Send a command and wait for its reply
+
+        :raises: RedisError on an error reply
+        """
+        self.pending += 1
+        try:
+            reply = yield self.call(self._execute, encode_command(*args))
+        finally:
+            self.pending -= 1
+        if isinstance(reply, RedisError):
+            raise reply
+        raise tornado.gen.Return(reply)
+
+
+class RedisPool(object):
+    """Up to `size' connections to a single port. Commands go to an idle
+    connection if there is one, to a new connection if the pool is not yet
+    full, and are otherwise pipelined onto the least busy connection."""
+
+    def __init__(self, port, size=2, password=None, timeout=10, io_loop=None):
+        self.port = port
+        self.size = size
+        self.password = password
+        self.timeout = timeout
+        self.io_loop = io_loop
+        self.connections = []
+
+    def get_connection(self):
+        least_busy = None
+        for conn in self.connections:
+            if conn.pending == 0:
+                return conn
+            if least_busy is None or conn.pending < least_busy.pending:
+                least_busy = conn
+        if len(self.connections) < self.size:
+            conn = RedisConnection(self.port, password=self.password, timeout=self.timeout, io_loop=self.io_loop)
+            self.connections.append(conn)
+            return conn
+        return least_busy
+
+    def execute(self, *args):
+        conn = self.get_connection()
+        conn.timeout = self.timeout
+        return conn.execute(*args)
+
+    def close(self):
+        for conn in self.connections:
+            conn.close()
+        self.connections = []
+
+
+_pools = {}
+
+
+def pool(port, size=2, password=None, timeout=10, io_loop=None):
+    """Get the connection pool for `port'"""
+    p = _pools.get(port)
+    if p is None or p.password != password or (io_loop is not None and p.io_loop is not io_loop):
+        if p is not None:
+            p.close()
+        p = _pools[port] = RedisPool(port, size=size, password=password, timeout=timeout, io_loop=io_loop)
+    p.size = size
+    p.timeout = timeout
+    return p
+
+
+def close_pools():
+    for p in _pools.values():
+        p.close()
+    _pools.clear()
+
+
+class SentinelMonitor(object):
+    """Tracks the masters of one Sentinel by subscribing to its failover and
+    down-state events, so that their state is known as soon as Sentinel knows it
+
+    On (re)connecting, the table is seeded from INFO; if the subscription is
+    lost, it is re-established with exponential backoff. While not subscribed,
+    `snapshot' should not be trusted, and callers should poll instead.
+    """
+
+    CHANNELS = ('+switch-master', '+sdown', '-sdown', '+odown', '-odown')
+
+    def __init__(self, port, password=None, timeout=10, reconnect_interval=1.0, max_reconnect_interval=30.0,
+                 io_loop=None):
+        self.port = port
+        self.password = password
+        self.timeout = timeout
+        self.reconnect_interval = reconnect_interval
+        self.max_reconnect_interval = max_reconnect_interval
+        if io_loop is None:
+            io_loop = tornado.ioloop.IOLoop.current()
+        self.io_loop = io_loop
+        self.conn = None
+        self.subscribed = False
+        self.events = 0
+        self.subscriptions = 0
+        self.updated = None
+        self._seed = None
+        self._masters = []
+        self._flags = {}
+        self._view = None
+        self._stopped = False
+        self.running = None
+
+    def start(self):
+        self.running = self._run()
+        self.io_loop.add_future(self.running, lambda f: f.result())
+
+    def stop(self):
+        self._stopped = True
+        if self.conn is not None:
+            self.conn.close()
+
+    def snapshot(self):
+        """The last INFO seen, updated with every event received since"""
+        if self._view is None:
+            self._view = self._seed.with_masters(self._masters)
+        return self._view
+
+    def _master(self, name):
+        for master in self._masters:
+            if master.get('name') == name:
+                return master
+        master = {'name': name}
+        self._masters.append(master)
+        return master
+
+    def _update_status(self, master):
+        flags = self._flags.setdefault(master['name'], set())
+        if 'odown' in flags:
+            master['status'] = 'odown'
+        elif 'sdown' in flags:
+            master['status'] = 'sdown'
+        else:
+            master['status'] = 'ok'
+
+    def seed(self, snapshot):
+        self._seed = snapshot
+        self._masters = [dict(master) for master in snapshot.masters]
+        self._flags = {}
+        for master in self._masters:
+            if master.get('status') in ('sdown', 'odown'):
+                self._flags[master['name']] = set([master['status']])
+        self._view = None
+        self.updated = time.time()
+
+    def handle_event(self, channel, payload):
+        args = payload.split()
+        if channel == '+switch-master' and len(args) >= 5:
+            master = self._master(args[0])
+            master['address'] = '%s:%s' % (args[3], args[4])
+            self._flags[args[0]] = set()
+            self._update_status(master)
+        elif len(args) >= 4 and args[0] == 'master':
+            master = self._master(args[1])
+            flags = self._flags.setdefault(args[1], set())
+            if channel[0] == '+':
+                flags.add(channel[1:])
+            else:
+                flags.discard(channel[1:])
+            self._update_status(master)
+        else:
+            return
+        self.events += 1
+        self.updated = time.time()
+        self._view = None
+
+    @tornado.gen.coroutine
+    def _subscribe(self):
+        self.conn.stream.socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        self.conn.send(encode_command(b'SUBSCRIBE', *self.CHANNELS))
+        for _ in self.CHANNELS:
+            reply = yield self.conn.read_reply()
+            if not isinstance(reply, list) or reply[0] != b'subscribe':
+                raise ProtocolError('Unexpected reply to SUBSCRIBE: %r' % (reply,))
+
+    @tornado.gen.coroutine
+    def _listen(self):
+        self.conn = RedisConnection(self.port, password=self.password, timeout=self.timeout,
+                                    io_loop=self.io_loop)
+        try:
+            info = yield self.conn.execute('INFO')
+            self.seed(InfoSnapshot(info))
+            yield self.conn.call(self._subscribe)
+            self.subscribed = True
+            self.subscriptions += 1
+            while True:
+                message = yield self.conn.read_reply()
+                if isinstance(message, list) and len(message) == 3 and message[0] == b'message':
+                    self.handle_event(message[1].decode('utf-8'), message[2].decode('utf-8'))
+        finally:
+            self.subscribed = False
+            self.conn.close()
+
+    @tornado.gen.coroutine
+    def _run(self):
+        backoff = self.reconnect_interval
+        while not self._stopped:
+            subscriptions = self.subscriptions
+            try:
+                yield self._listen()
+            except Exception as e:
+                if not self._stopped:
+                    log.warning('Lost subscription to sentinel on port %d: %s', self.port, e)
+            if self._stopped:
+                break
+            if self.subscriptions != subscriptions:
+                backoff = self.reconnect_interval
+            yield tornado.gen.Task(self.io_loop.add_timeout, datetime.timedelta(seconds=backoff))
+            backoff = min(backoff * 2, self.max_reconnect_interval)
+
+    def get_stats(self):
+        return {
+            'subscribed': self.subscribed,
+            'subscriptions': self.subscriptions,
+            'events': self.events,
+            'updated': self.updated,
+        }
+
+
+_monitors = {}
+
+
+def monitor_sentinel(port, password=None, timeout=10, io_loop=None, **kwargs):
+    """Start tracking the sentinel on `port'"""
+    monitor = _monitors.get(port)
+    if monitor is not None:
+        monitor.stop()
+    monitor = _monitors[port] = SentinelMonitor(port, password=password, timeout=timeout, io_loop=io_loop, **kwargs)
+    monitor.start()
+    return monitor
+
+
+def sentinel_monitor(port):
+    """The SentinelMonitor for `port', if there is one"""
+    return _monitors.get(port)
+
+
+def stop_sentinel_monitors():
+    for monitor in _monitors.values():
+        monitor.stop()
+    _monitors.clear()
+
+
+def get_sentinel_stats():
+    return dict((port, monitor.get_stats()) for port, monitor in _monitors.items())
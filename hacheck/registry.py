@@ -0,0 +1,115 @@
+"""which checkers there are, and which chain of them each protocol runs
+
+Checkers are named by `module:attribute' and imported the first time a chain
+using them runs, so that a host only ever asked for /tcp/ never imports the
+MySQL, PostgreSQL or Redis clients. Besides the built-in ones, checkers come
+from the `checkers' section of the config file and from the `hacheck.checkers'
+setuptools entry point group; either way a new checker `foo' also gets a
+protocol `foo' running the chain [spool, foo], unless the `protocols' section
+of the config file says otherwise.
+"""
+
+import logging
+
+log = logging.getLogger('hacheck')
+
+ENTRY_POINT_GROUP = 'hacheck.checkers'
+
+BUILTIN_CHECKERS = {
+    'spool': 'hacheck.checker:check_spool',
+    'http': 'hacheck.checker:check_http',
+    'http-unix': 'hacheck.checkers.http:check_http_unix',
+    'https': 'hacheck.checkers.http:check_https',
+    'tcp': 'hacheck.checker:check_tcp',
+    'listen': 'hacheck.checker:check_listen',
+    'exec': 'hacheck.checkers.scripts:check_exec',
+    'haproxy': 'hacheck.checkers.haproxy:check_haproxy',
+    'haproxy-socket': 'hacheck.checkers.haproxy:check_haproxy_socket',
+    'memcached': 'hacheck.checkers.memcached:check_memcached',
+    'mysql': 'hacheck.checkers.mysql:check_mysql',
+    'mysql-replica': 'hacheck.checkers.mysql:check_mysql_replica',
+    'postgres': 'hacheck.checkers.postgres:check_postgres',
+    'redis': 'hacheck.checkers.redis:check_redis_sentinel',
+    'redis-info': 'hacheck.checkers.redis:check_redis_info',
+    'sentinel-info': 'hacheck.checkers.redis:check_sentinel_info',
+}
+
+BUILTIN_PROTOCOLS = {
+    'spool': ['spool'],
+    'sentinel': ['spool', 'redis'],
+}
+
+checkers = {}
+protocols = {}
+_resolved = {}
+_entry_points = None
+
+
+def configure(extra_checkers=None, extra_protocols=None):
+    """(Re)build the registry from the built-in checkers and protocols plus
+    `extra_checkers' (name to `module:attribute') and `extra_protocols' (name to
+    a list of checker names). Nothing is imported until it is used."""
+    checkers.clear()
+    checkers.update(BUILTIN_CHECKERS)
+    checkers.update(extra_checkers or {})
+    protocols.clear()
+    for name in checkers:
+        if name != 'spool':
+            protocols[name] = ['spool', name]
+    protocols.update(BUILTIN_PROTOCOLS)
+    protocols.update(extra_protocols or {})
+    _resolved.clear()
+
+
+def _load_entry_points():
+    global _entry_points
+    if _entry_points is None:
+        _entry_points = {}
+        # pkg_resources is slow to import, so only go looking for plugins
+        # once something we don't know about has been asked for
+        try:
+            import pkg_resources
+        except ImportError:
+            return _entry_points
+        for entry_point in pkg_resources.iter_entry_points(ENTRY_POINT_GROUP):
+            _entry_points[entry_point.name] = entry_point
+    return _entry_points
+
+
+def _import(reference):
+    module_name, _, attribute = reference.partition(':')
+    return getattr(__import__(module_name, fromlist=[attribute]), attribute)
+
+
+def resolve(name):
+    """Get the checker `name', importing it if need be
+
+    :raises: KeyError if there is no such checker
+    """
+    checker = _resolved.get(name)
+    if checker is None:
+        if name in checkers:
+            checker = _import(checkers[name])
+        elif name in _load_entry_points():
+            checker = _entry_points[name].load()
+        else:
+            raise KeyError(name)
+        log.debug('Loaded checker %s', name)
+        _resolved[name] = checker
+    return checker
+
+
+def chain(protocol):
+    """Get the list of checkers that `protocol' runs
+
+    :raises: KeyError if there is no such protocol (or it uses an unknown checker)
+    """
+    names = protocols.get(protocol)
+    if names is None:
+        if protocol not in _load_entry_points():
+            raise KeyError(protocol)
+        names = ['spool', protocol]
+    return [resolve(name) for name in names]
+
+
+configure()
@@ -0,0 +1,159 @@
+"""run whitelisted check scripts in a bounded pool of child processes"""
+
+import collections
+import copy
+import datetime
+import os
+import time
+try:
+    from collections import Counter
+except:
+    from .compat import Counter
+
+import tornado.concurrent
+import tornado.gen
+import tornado.ioloop
+import tornado.process
+
+default_stats = Counter({
+    'runs': 0,
+    'run_time': 0.0,
+    'timeouts': 0,
+    'queued': 0,
+})
+
+stats = Counter()
+stats.update(default_stats)
+
+
+def reset_stats():
+    stats.clear()
+    stats.update(default_stats)
+
+
+def get_stats():
+    return copy.copy(stats)
+
+
+Result = collections.namedtuple('Result', ['returncode', 'output', 'timed_out', 'duration'])
+
+
+class ProcessPool(object):
+    """Runs at most `size' commands at a time; the rest wait their turn"""
+
+    def __init__(self, size, io_loop=None):
+        self.size = size
+        if io_loop is None:
+            io_loop = tornado.ioloop.IOLoop.current()
+        self.io_loop = io_loop
+        self.running = 0
+        self.waiting = collections.deque()
+        # exit statuses are collected by a SIGCHLD handler on this IOLoop
+        tornado.process.Subprocess.initialize(io_loop=self.io_loop)
+
+    def _acquire(self):
+        future = tornado.concurrent.Future()
+        if self.running < self.size:
+            self.running += 1
+            future.set_result(None)
+        else:
+            stats['queued'] += 1
+            self.waiting.append(future)
+        return future
+
+    def _release(self):
+        if self.waiting:
+            self.waiting.popleft().set_result(None)
+        else:
+            self.running -= 1
+
+    @tornado.gen.coroutine
+    def run(self, argv, env=None, timeout=10, max_output=4096):
+        """Run `argv', killing it if it takes longer than `timeout' seconds
+
+        :returns: Future of a Result; `output' holds at most `max_output' bytes of stdout
+        :raises: OSError if the command can't be started
+        """
+        yield self._acquire()
+        try:
+            result = yield self._run(argv, env, timeout, max_output)
+        finally:
+            self._release()
+        raise tornado.gen.Return(result)
+
+    @tornado.gen.coroutine
+    def _run(self, argv, env, timeout, max_output):
+        start = time.time()
+        with open(os.devnull, 'r+b') as devnull:
+            proc = tornado.process.Subprocess(
+                argv,
+                stdin=devnull,
+                stdout=tornado.process.Subprocess.STREAM,
+                stderr=devnull,
+                env=env,
+                close_fds=True,
+                io_loop=self.io_loop,
+            )
+        exited = tornado.concurrent.Future()
+        proc.set_exit_callback(exited.set_result)
+        timed_out = []
+
+        def kill():
+            timed_out.append(True)
+            try:
+                proc.proc.kill()
+            except OSError:
+                pass
+            # don't wait for any children it left holding stdout open
+            proc.stdout.close()
+
+        handle = self.io_loop.add_timeout(datetime.timedelta(seconds=timeout), kill)
+        output = []
+        size = [0]
+
+        def on_output(data):
+            # keep draining past the cap, so that the script never blocks on a full pipe
+            if size[0] < max_output:
+                output.append(data[:max_output - size[0]])
+                size[0] += len(output[-1])
+
+        try:
+            # tornado 4.1 can't combine a streaming_callback with a Future here
+            yield tornado.gen.Task(proc.stdout.read_until_close, streaming_callback=on_output)
+            returncode = yield exited
+        finally:
+            self.io_loop.remove_timeout(handle)
+        duration = time.time() - start
+        stats['runs'] += 1
+        stats['run_time'] += duration
+        if timed_out:
+            stats['timeouts'] += 1
+        raise tornado.gen.Return(Result(returncode, b''.join(output), bool(timed_out), duration))
+
+
+_pool = None
+
+
+def pool(size, io_loop=None):
+    """Get the (shared) ProcessPool"""
+    global _pool
+    if _pool is None or (io_loop is not None and _pool.io_loop is not io_loop):
+        close_pool()
+        _pool = ProcessPool(size, io_loop=io_loop)
+    _pool.size = size
+    return _pool
+
+
+def close_pool():
+    global _pool
+    if _pool is not None:
+        tornado.process.Subprocess.uninitialize()
+    _pool = None
+
+
+def environment(service_name, port):
+    """The environment scripts run in: ours, plus the service and port checked"""
+    env = dict(os.environ)
+    env['HACHECK_SERVICE'] = service_name
+    env['HACHECK_PORT'] = str(port)
+    return env
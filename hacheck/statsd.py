@@ -0,0 +1,192 @@
+"""an optional statsd client, which aggregates counters and timers in memory and
+sends them every `flush_interval', as many metrics to a UDP packet as fit"""
+
+import copy
+import logging
+import random
+import re
+import socket
+try:
+    from collections import Counter
+except:
+    from .compat import Counter
+
+import tornado.ioloop
+
+from . import cache
+
+log = logging.getLogger('hacheck')
+
+DEFAULT_PORT = 8125
+
+# leaves room for IP and UDP headers (and any tunnelling) in a 1500-byte MTU
+MAX_PACKET_SIZE = 1432
+
+# timer samples kept per timer per flush; beyond this, a random subset is kept
+# and sent with a sample rate
+MAX_TIMER_SAMPLES = 1000
+
+INVALID_NAME_CHARACTERS = re.compile(r'[^a-zA-Z0-9_.-]')
+
+default_stats = Counter({
+    'flushes': 0,
+    'packets': 0,
+    'metrics': 0,
+    'send_errors': 0,
+})
+
+stats = Counter()
+stats.update(default_stats)
+
+
+def reset_stats():
+    stats.clear()
+    stats.update(default_stats)
+
+
+def get_stats():
+    return copy.copy(stats)
+
+
+def parse_address(address):
+    host, _, port = address.rpartition(':')
+    if not host:
+        return address, DEFAULT_PORT
+    return host, int(port)
+
+
+def packets(lines, max_size=MAX_PACKET_SIZE):
+    """Join `lines' with newlines into as few packets of at most `max_size'
+    bytes as they fit in, in order (a line too long for any packet gets one of
+    its own)"""
+    packet = []
+    size = 0
+    for line in lines:
+        if packet and size + 1 + len(line) > max_size:
+            yield b'\n'.join(packet)
+            packet = []
+            size = 0
+        size += len(line) + (1 if packet else 0)
+        packet.append(line)
+    if packet:
+        yield b'\n'.join(packet)
+
+
+class _Timer(object):
+    __slots__ = ('samples', 'seen')
+
+    def __init__(self):
+        self.samples = []
+        self.seen = 0
+
+    def add(self, value):
+        self.seen += 1
+        if len(self.samples) < MAX_TIMER_SAMPLES:
+            self.samples.append(value)
+        else:
+            # reservoir sampling, so every sample is equally likely to be sent
+            i = random.randrange(self.seen)
+            if i < MAX_TIMER_SAMPLES:
+                self.samples[i] = value
+
+
+class StatsdClient(object):
+    """Counters and timers are only added up in memory, which is all that
+    recording one costs; every `flush_interval' seconds they are sent to
+    `address' over UDP, along with how much the cache counters have grown.
+    Sending never blocks, and a packet which can't be sent is dropped."""
+
+    def __init__(self, address, prefix='hacheck', flush_interval=1.0, max_packet_size=MAX_PACKET_SIZE,
+                 io_loop=None):
+        host, port = parse_address(address)
+        # resolved once, up front, so that flushing never waits on DNS
+        family, _, _, _, self.address = socket.getaddrinfo(host, port, 0, socket.SOCK_DGRAM)[0]
+        self.socket = socket.socket(family, socket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+        self.prefix = prefix + '.' if prefix else ''
+        self.flush_interval = flush_interval
+        self.max_packet_size = max_packet_size
+        self.io_loop = io_loop or tornado.ioloop.IOLoop.current()
+        self.counters = Counter()
+        self.timers = {}
+        self.last_cache_stats = cache.get_stats()
+        self.periodic = None
+
+    def incr(self, name, count=1):
+        self.counters[name] += count
+
+    def timing(self, name, milliseconds):
+        timer = self.timers.get(name)
+        if timer is None:
+            timer = self.timers[name] = _Timer()
+        timer.add(milliseconds)
+
+    def _name(self, name):
+        return self.prefix + INVALID_NAME_CHARACTERS.sub('_', name)
+
+    def lines(self):
+        """Take everything recorded since the last call, as statsd lines"""
+        counters, self.counters = self.counters, Counter()
+        timers, self.timers = self.timers, {}
+        cache_stats = cache.get_stats()
+        for stat, value in cache_stats.items():
+            grown = value - self.last_cache_stats.get(stat, 0)
+            if grown > 0:
+                counters['cache.' + stat] += grown
+        self.last_cache_stats = cache_stats
+
+        for name, value in sorted(counters.items()):
+            yield ('%s:%d|c' % (self._name(name), value)).encode('ascii')
+        for name, timer in sorted(timers.items()):
+            name = self._name(name)
+            rate = ''
+            if timer.seen > len(timer.samples):
+                rate = '|@%.4f' % (float(len(timer.samples)) / timer.seen)
+            for value in timer.samples:
+                yield ('%s:%.3f|ms%s' % (name, value, rate)).encode('ascii')
+
+    def flush(self):
+        stats['flushes'] += 1
+        for packet in packets(self.lines(), self.max_packet_size):
+            stats['metrics'] += packet.count(b'\n') + 1
+            try:
+                self.socket.sendto(packet, self.address)
+            except socket.error as e:
+                # e.g. the socket buffer is full; metrics are not worth waiting for
+                stats['send_errors'] += 1
+                log.debug('Dropped statsd packet: %s', e)
+            else:
+                stats['packets'] += 1
+
+    def start(self):
+        self.periodic = tornado.ioloop.PeriodicCallback(self.flush, 1000 * self.flush_interval,
+                                                        io_loop=self.io_loop)
+        self.periodic.start()
+
+    def stop(self):
+        if self.periodic is not None:
+            self.periodic.stop()
+            self.periodic = None
+        self.flush()
+        self.socket.close()
+
+
+# the running client, if statsd_address is configured
+client = None
+
+
+def configure(address, prefix='hacheck', flush_interval=1.0, max_packet_size=MAX_PACKET_SIZE, io_loop=None):
+    global client
+    stop()
+    client = StatsdClient(address, prefix=prefix, flush_interval=flush_interval, max_packet_size=max_packet_size,
+                          io_loop=io_loop)
+    client.start()
+    return client
+
+
+def stop():
+    """Send anything still unsent, and stop"""
+    global client
+    if client is not None:
+        client.stop()
+    client = None
@@ -32,7 +32,7 @@ setup(
     author_email="jbrown@uber.com",
     url="https://github.com/uber/hacheck",
     license="MIT",
-    packages=find_packages(exclude=['tests']),
+    packages=find_packages(exclude=['tests', 'benchmarks']),
     keywords=["monitoring", "load-balancing", "networking"],
     description="HAProxy health-check proxying service",
     install_requires=install_requires,
@@ -0,0 +1,55 @@
+"""A stand-in for the HAProxy stats socket, for tests and benchmarks"""
+
+import tornado.gen
+import tornado.iostream
+import tornado.netutil
+import tornado.tcpserver
+
+HEADER = ('# pxname,svname,qcur,qmax,scur,smax,slim,stot,bin,bout,dreq,dresp,ereq,econ,eresp,wretr,wredis,'
+          'status,weight,act,bck,chkfail,chkdown,lastchg,downtime,qlimit,pid,iid,sid,throttle,lbtot,tracked,'
+          'type,rate,rate_lim,rate_max,check_status,check_code,check_duration,')
+ROW = '%s,%s,0,0,0,0,200,0,4542,293789,0,0,,0,0,0,0,%s,0,0,0,,0,709871,0,,1,2,0,,0,,1,0,,0,,,,'
+
+
+def make_stats(statuses):
+    """Render `show stat' output for a dict of (pxname, svname) -> status"""
+    lines = [HEADER]
+    for (pxname, svname), status in sorted(statuses.items()):
+        lines.append(ROW % (pxname, svname, status))
+    return '\n'.join(lines) + '\n'
+
+
+class FakeStatsSocketServer(tornado.tcpserver.TCPServer):
+    """Answers `prompt' and `show stat' on a UNIX socket like HAProxy does"""
+
+    def __init__(self, path, statuses=None, io_loop=None):
+        super(FakeStatsSocketServer, self).__init__(io_loop=io_loop)
+        self.path = path
+        self.statuses = statuses or {}
+        self.connections = 0
+        self.commands = 0
+
+    def start_listening(self):
+        self.add_socket(tornado.netutil.bind_unix_socket(self.path))
+
+    @tornado.gen.coroutine
+    def handle_stream(self, stream, address):
+        self.connections += 1
+        interactive = False
+        try:
+            while True:
+                command = yield stream.read_until(b'\n')
+                command = command.strip()
+                self.commands += 1
+                if command == b'prompt':
+                    interactive = not interactive
+                elif command == b'show stat':
+                    yield stream.write(make_stats(self.statuses).encode('utf-8') + b'\n')
+                else:
+                    yield stream.write(b'Unknown command.\n\n')
+                if not interactive:
+                    stream.close()
+                    return
+                yield stream.write(b'> ')
+        except tornado.iostream.StreamClosedError:
+            pass
@@ -0,0 +1,43 @@
+"""A stand-in for memcached's text protocol, for tests"""
+
+import tornado.gen
+import tornado.iostream
+import tornado.tcpserver
+
+
+class FakeMemcachedServer(tornado.tcpserver.TCPServer):
+    """Answers `version', and `stats' from the `stats' dict"""
+
+    def __init__(self, stats=None, io_loop=None):
+        super(FakeMemcachedServer, self).__init__(io_loop=io_loop)
+        self.stats = stats or {}
+        self.connections = 0
+        self.commands = []
+        self.streams = []
+
+    @tornado.gen.coroutine
+    def handle_stream(self, stream, address):
+        self.connections += 1
+        self.streams.append(stream)
+        try:
+            while True:
+                command = yield stream.read_until(b'\r\n')
+                command = command.strip()
+                self.commands.append(command)
+                if command == b'version':
+                    reply = b'VERSION 1.4.25\r\n'
+                elif command == b'stats':
+                    reply = b''.join(
+                        b'STAT ' + name.encode('utf-8') + b' ' + str(value).encode('utf-8') + b'\r\n'
+                        for name, value in sorted(self.stats.items())
+                    ) + b'END\r\n'
+                else:
+                    reply = b'ERROR\r\n'
+                yield stream.write(reply)
+        except tornado.iostream.StreamClosedError:
+            pass
+
+    def disconnect_all(self):
+        for stream in self.streams:
+            stream.close()
+        self.streams = []
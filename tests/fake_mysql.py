@@ -0,0 +1,122 @@
+"""A stand-in for a MySQL server speaking just enough of the protocol for tests"""
+
+import struct
+
+import tornado.gen
+import tornado.iostream
+import tornado.tcpserver
+
+from hacheck import mysql
+
+SALT = b'12345678901234567890'
+
+OK = b'\x00\x00\x00\x02\x00\x00\x00'
+EOF = b'\xfe\x00\x00\x02\x00'
+
+
+def error(code, message):
+    return b'\xff' + struct.pack('<H', code) + b'#28000' + message
+
+
+def lenc_string(value):
+    if value is None:
+        return b'\xfb'
+    if len(value) < 0xfb:
+        return struct.pack('B', len(value)) + value
+    return b'\xfc' + struct.pack('<H', len(value)) + value
+
+
+def column_definition(name):
+    return (
+        lenc_string(b'def') + lenc_string(b'') + lenc_string(b'') + lenc_string(b'') +
+        lenc_string(name) + lenc_string(name) + b'\x0c' + struct.pack('<HIBHB', 0x21, 256, 0xfd, 0, 0) + b'\0\0'
+    )
+
+
+def resultset(columns, rows):
+    """The packets of a text-protocol resultset"""
+    packets = [struct.pack('B', len(columns))]
+    packets.extend(column_definition(column) for column in columns)
+    packets.append(EOF)
+    packets.extend(b''.join(lenc_string(value) for value in row) for row in rows)
+    packets.append(EOF)
+    return packets
+
+
+def greeting(connection_id):
+    capabilities = mysql.CAPABILITIES
+    return (
+        b'\x0a' + b'5.6.30-log\0' +
+        struct.pack('<I', connection_id) + SALT[:8] + b'\0' +
+        struct.pack('<H', capabilities & 0xffff) +
+        struct.pack('<BHHB', 0x21, 2, capabilities >> 16, len(SALT) + 1) + b'\0' * 10 +
+        SALT[8:] + b'\0' + b'mysql_native_password\0'
+    )
+
+
+class FakeMySQLServer(tornado.tcpserver.TCPServer):
+    """Accepts logins as `username'/`password', answers COM_PING, and answers
+    COM_QUERY from `queries', a dict of SQL to a list of response packets"""
+
+    def __init__(self, username, password, queries=None, io_loop=None):
+        super(FakeMySQLServer, self).__init__(io_loop=io_loop)
+        self.username = username
+        self.password = password
+        self.queries = queries or {}
+        self.connections = 0
+        self.logins = 0
+        self.commands = []
+        self.streams = []
+
+    @tornado.gen.coroutine
+    def read_packet(self, stream):
+        header = yield stream.read_bytes(4)
+        length, sequence = struct.unpack('<IB', header[:3] + b'\0' + header[3:])
+        payload = yield stream.read_bytes(length)
+        raise tornado.gen.Return((sequence, payload))
+
+    def write_packet(self, stream, payload, sequence):
+        return stream.write(mysql._pack_packet(payload, sequence))
+
+    def check_login(self, payload):
+        end = payload.index(b'\0', 32)
+        username = payload[32:end]
+        auth_length = struct.unpack('B', payload[end + 1:end + 2])[0]
+        auth = payload[end + 2:end + 2 + auth_length]
+        return username == self.username.encode('utf-8') and auth == mysql._stupid_hash_password(SALT, self.password)
+
+    @tornado.gen.coroutine
+    def handle_stream(self, stream, address):
+        self.connections += 1
+        self.streams.append(stream)
+        try:
+            yield self.write_packet(stream, greeting(self.connections), 0)
+            sequence, payload = yield self.read_packet(stream)
+            if not self.check_login(payload):
+                yield self.write_packet(stream, error(1045, b'Access denied'), sequence + 1)
+                stream.close()
+                return
+            self.logins += 1
+            yield self.write_packet(stream, OK, sequence + 1)
+            while True:
+                sequence, payload = yield self.read_packet(stream)
+                command = struct.unpack('B', payload[:1])[0]
+                self.commands.append(command)
+                if command == mysql.COM_QUIT:
+                    stream.close()
+                    return
+                elif command == mysql.COM_PING:
+                    yield self.write_packet(stream, OK, sequence + 1)
+                elif command == mysql.COM_QUERY:
+                    packets = self.queries.get(payload[1:], [error(1064, b'You have an error in your SQL syntax')])
+                    for i, packet in enumerate(packets):
+                        yield self.write_packet(stream, packet, sequence + 1 + i)
+                else:
+                    yield self.write_packet(stream, error(1047, b'Unknown command'), sequence + 1)
+        except tornado.iostream.StreamClosedError:
+            pass
+
+    def disconnect_all(self):
+        for stream in self.streams:
+            stream.close()
+        self.streams = []
@@ -0,0 +1,147 @@
+"""A stand-in for a PostgreSQL server speaking just enough of the protocol for tests"""
+
+import base64
+import hashlib
+import struct
+
+import tornado.gen
+import tornado.iostream
+import tornado.tcpserver
+
+from hacheck import postgres
+
+SALT = b'\x01\x02\x03\x04'
+SCRAM_ITERATIONS = 4096
+
+
+def message(kind, body=b''):
+    return kind + struct.pack('!I', len(body) + 4) + body
+
+
+def error(severity, code, text):
+    return message(b'E', b'S' + severity + b'\0C' + code + b'\0M' + text + b'\0\0')
+
+
+def data_row(*values):
+    body = struct.pack('!H', len(values))
+    for value in values:
+        if value is None:
+            body += struct.pack('!i', -1)
+        else:
+            body += struct.pack('!i', len(value)) + value
+    return message(b'D', body)
+
+
+def single_value(name, value):
+    row_description = message(b'T', struct.pack('!H', 1) + name + b'\0' + struct.pack('!IHIhih', 0, 0, 25, -1, -1, 0))
+    return row_description + data_row(value) + message(b'C', b'SELECT 1\0')
+
+
+def xor(a, b):
+    return bytes(bytearray(x ^ y for x, y in zip(bytearray(a), bytearray(b))))
+
+
+class FakePostgresServer(tornado.tcpserver.TCPServer):
+    """Logs in `user' (with `auth', MD5 or SCRAM-SHA-256 authentication, if
+    there is a `password') and answers SELECT 1 and pg_is_in_recovery()"""
+
+    def __init__(self, user, password=None, in_recovery=False, auth='md5', io_loop=None):
+        super(FakePostgresServer, self).__init__(io_loop=io_loop)
+        self.user = user
+        self.password = password
+        self.auth = auth
+        self.in_recovery = in_recovery
+        self.connections = 0
+        self.logins = 0
+        self.queries = []
+        self.streams = []
+
+    @tornado.gen.coroutine
+    def read_message(self, stream):
+        header = yield stream.read_bytes(5)
+        kind, length = struct.unpack('!cI', header)
+        body = b''
+        if length > 4:
+            body = yield stream.read_bytes(length - 4)
+        raise tornado.gen.Return((kind, body))
+
+    @tornado.gen.coroutine
+    def login(self, stream):
+        length = yield stream.read_bytes(4)
+        body = yield stream.read_bytes(struct.unpack('!I', length)[0] - 4)
+        assert struct.unpack_from('!I', body)[0] == postgres.PROTOCOL_VERSION
+        items = body[4:].split(b'\0')
+        parameters = dict(zip(items[0::2], items[1::2]))
+        if parameters[b'user'] != self.user.encode('utf-8'):
+            raise tornado.gen.Return(error(b'FATAL', b'28000', b'role does not exist'))
+        if self.password is not None and self.auth == 'scram':
+            authenticated = yield self.scram(stream)
+            if not authenticated:
+                raise tornado.gen.Return(error(b'FATAL', b'28P01', b'password authentication failed'))
+        elif self.password is not None:
+            yield stream.write(message(b'R', struct.pack('!I', postgres.AUTH_MD5_PASSWORD) + SALT))
+            kind, body = yield self.read_message(stream)
+            if kind != b'p' or body != postgres._md5_password(self.user, self.password, SALT) + b'\0':
+                raise tornado.gen.Return(error(b'FATAL', b'28P01', b'password authentication failed'))
+        self.logins += 1
+        raise tornado.gen.Return(
+            message(b'R', struct.pack('!I', postgres.AUTH_OK)) +
+            message(b'S', b'server_version\x009.4.5\0') +
+            message(b'K', struct.pack('!II', self.connections, 42)) +
+            message(b'Z', b'I')
+        )
+
+    @tornado.gen.coroutine
+    def scram(self, stream):
+        yield stream.write(message(b'R', struct.pack('!I', postgres.AUTH_SASL) + postgres.SCRAM_SHA_256 + b'\0\0'))
+        kind, body = yield self.read_message(stream)
+        mechanism, rest = body.split(b'\0', 1)
+        assert kind == b'p' and mechanism == postgres.SCRAM_SHA_256
+        client_first_bare = rest[4:][3:]
+        nonce = postgres._scram_attributes(client_first_bare)[b'r'] + b'fake'
+        server_first = b'r=' + nonce + b',s=' + base64.b64encode(SALT * 4) + b',i=%d' % SCRAM_ITERATIONS
+        yield stream.write(message(b'R', struct.pack('!I', postgres.AUTH_SASL_CONTINUE) + server_first))
+        kind, client_final = yield self.read_message(stream)
+        without_proof, proof = client_final.split(b',p=')
+        salted_password = hashlib.pbkdf2_hmac('sha256', self.password.encode('utf-8'), SALT * 4, SCRAM_ITERATIONS)
+        client_key = postgres._hmac(salted_password, b'Client Key')
+        auth_message = client_first_bare + b',' + server_first + b',' + without_proof
+        client_signature = postgres._hmac(hashlib.sha256(client_key).digest(), auth_message)
+        if xor(base64.b64decode(proof), client_signature) != client_key:
+            raise tornado.gen.Return(False)
+        server_signature = postgres._hmac(postgres._hmac(salted_password, b'Server Key'), auth_message)
+        yield stream.write(message(b'R', struct.pack('!I', postgres.AUTH_SASL_FINAL) +
+                                   b'v=' + base64.b64encode(server_signature)))
+        raise tornado.gen.Return(True)
+
+    @tornado.gen.coroutine
+    def handle_stream(self, stream, address):
+        self.connections += 1
+        self.streams.append(stream)
+        try:
+            reply = yield self.login(stream)
+            yield stream.write(reply)
+            if reply.startswith(b'E'):
+                stream.close()
+                return
+            while True:
+                kind, body = yield self.read_message(stream)
+                if kind == b'X':
+                    stream.close()
+                    return
+                sql = body.rstrip(b'\0')
+                self.queries.append(sql)
+                if sql == b'SELECT 1':
+                    reply = single_value(b'?column?', b'1')
+                elif sql == b'SELECT pg_is_in_recovery()':
+                    reply = single_value(b'pg_is_in_recovery', b't' if self.in_recovery else b'f')
+                else:
+                    reply = error(b'ERROR', b'42601', b'syntax error')
+                yield stream.write(reply + message(b'Z', b'I'))
+        except tornado.iostream.StreamClosedError:
+            pass
+
+    def disconnect_all(self):
+        for stream in self.streams:
+            stream.close()
+        self.streams = []
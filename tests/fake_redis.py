@@ -0,0 +1,207 @@
+"""A stand-in for redis and sentinel, for tests and benchmarks"""
+
+import tornado.gen
+import tornado.iostream
+import tornado.tcpserver
+
+# INFO as returned by a redis 3.0 slave and a sentinel watching two masters
+REDIS_INFO = b'''# Server\r
+redis_version:3.0.7\r
+redis_git_sha1:00000000\r
+redis_git_dirty:0\r
+redis_build_id:ba8ae7cb9c5f5cfa\r
+redis_mode:standalone\r
+os:Linux 3.13.0-79-generic x86_64\r
+arch_bits:64\r
+multiplexing_api:epoll\r
+gcc_version:4.8.4\r
+process_id:1834\r
+run_id:0b0c1a7ef3a3b1e8c4a3aa6c2ad42f61e4a3a6c5\r
+tcp_port:6379\r
+uptime_in_seconds:8632981\r
+uptime_in_days:99\r
+hz:10\r
+lru_clock:7718232\r
+config_file:/etc/redis/redis.conf\r
+\r
+# Clients\r
+connected_clients:213\r
+client_longest_output_list:0\r
+client_biggest_input_buf:0\r
+blocked_clients:0\r
+\r
+# Memory\r
+used_memory:1861237840\r
+used_memory_human:1.73G\r
+used_memory_rss:1959829504\r
+used_memory_peak:1892358616\r
+used_memory_peak_human:1.76G\r
+used_memory_lua:36864\r
+mem_fragmentation_ratio:1.05\r
+mem_allocator:jemalloc-3.6.0\r
+\r
+# Persistence\r
+loading:0\r
+rdb_changes_since_last_save:4829\r
+rdb_bgsave_in_progress:0\r
+rdb_last_save_time:1456512391\r
+rdb_last_bgsave_status:ok\r
+rdb_last_bgsave_time_sec:11\r
+rdb_current_bgsave_time_sec:-1\r
+aof_enabled:0\r
+aof_rewrite_in_progress:0\r
+aof_rewrite_scheduled:0\r
+aof_last_rewrite_time_sec:-1\r
+aof_current_rewrite_time_sec:-1\r
+aof_last_bgrewrite_status:ok\r
+aof_last_write_status:ok\r
+\r
+# Stats\r
+total_connections_received:3349027\r
+total_commands_processed:6612846521\r
+instantaneous_ops_per_sec:1043\r
+total_net_input_bytes:513279481349\r
+total_net_output_bytes:1883711064567\r
+instantaneous_input_kbps:71.42\r
+instantaneous_output_kbps:329.64\r
+rejected_connections:0\r
+sync_full:0\r
+sync_partial_ok:0\r
+sync_partial_err:0\r
+expired_keys:6138823\r
+evicted_keys:0\r
+keyspace_hits:2879129372\r
+keyspace_misses:311894471\r
+pubsub_channels:1\r
+pubsub_patterns:0\r
+latest_fork_usec:57513\r
+migrate_cached_sockets:0\r
+\r
+# Replication\r
+role:slave\r
+master_host:10.12.3.4\r
+master_port:6379\r
+master_link_status:up\r
+master_last_io_seconds_ago:0\r
+master_sync_in_progress:0\r
+slave_repl_offset:3478114911257\r
+slave_priority:100\r
+slave_read_only:1\r
+connected_slaves:0\r
+master_repl_offset:0\r
+repl_backlog_active:0\r
+repl_backlog_size:1048576\r
+repl_backlog_first_byte_offset:0\r
+repl_backlog_histlen:0\r
+\r
+# CPU\r
+used_cpu_sys:108533.59\r
+used_cpu_user:61337.40\r
+used_cpu_sys_children:3721.10\r
+used_cpu_user_children:42314.64\r
+\r
+# Cluster\r
+cluster_enabled:0\r
+\r
+# Keyspace\r
+db0:keys=4183020,expires=1261774,avg_ttl=1529893371\r
+db3:keys=12,expires=0,avg_ttl=0\r
+'''
+
+SENTINEL_INFO = b'''# Server\r
+redis_version:3.0.7\r
+redis_git_sha1:00000000\r
+redis_git_dirty:0\r
+redis_build_id:ba8ae7cb9c5f5cfa\r
+redis_mode:sentinel\r
+os:Linux 3.13.0-79-generic x86_64\r
+arch_bits:64\r
+multiplexing_api:epoll\r
+gcc_version:4.8.4\r
+process_id:1790\r
+run_id:6d2f2f3c4b8a1a17c1e1f4e8e5b8f7b8fa1f0e3d\r
+tcp_port:26379\r
+uptime_in_seconds:8633002\r
+uptime_in_days:99\r
+hz:12\r
+lru_clock:7718253\r
+config_file:/etc/redis/sentinel.conf\r
+\r
+# Sentinel\r
+sentinel_masters:2\r
+sentinel_tilt:0\r
+sentinel_running_scripts:0\r
+sentinel_scripts_queue_length:0\r
+master0:name=sessions,status=ok,address=10.12.3.4:6379,slaves=2,sentinels=3\r
+master1:name=cache,status=sdown,address=10.12.3.9:6380,slaves=1,sentinels=3\r
+'''
+
+
+def bulk(data):
+    return b'$' + str(len(data)).encode('ascii') + b'\r\n' + data + b'\r\n'
+
+
+class FakeRedisServer(tornado.tcpserver.TCPServer):
+    """Reads RESP commands and answers them from `replies', a dict of command name
+    to raw RESP reply. Connections are kept open, so commands can be pipelined."""
+
+    def __init__(self, replies=None, password=None, io_loop=None):
+        super(FakeRedisServer, self).__init__(io_loop=io_loop)
+        self.replies = {b'PING': b'+PONG\r\n'}
+        if replies:
+            self.replies.update(replies)
+        self.password = password
+        self.connections = 0
+        self.commands = []
+        self.streams = []
+        self.subscribers = []
+
+    @tornado.gen.coroutine
+    def read_command(self, stream):
+        line = yield stream.read_until(b'\r\n')
+        assert line[:1] == b'*', line
+        args = []
+        for _ in range(int(line[1:-2])):
+            line = yield stream.read_until(b'\r\n')
+            data = yield stream.read_bytes(int(line[1:-2]) + 2)
+            args.append(data[:-2])
+        raise tornado.gen.Return(args)
+
+    @tornado.gen.coroutine
+    def handle_stream(self, stream, address):
+        self.connections += 1
+        self.streams.append(stream)
+        authenticated = self.password is None
+        try:
+            while True:
+                args = yield self.read_command(stream)
+                command = args[0].upper()
+                self.commands.append(command)
+                if command == b'AUTH':
+                    authenticated = args[1] == self.password
+                    reply = b'+OK\r\n' if authenticated else b'-ERR invalid password\r\n'
+                elif not authenticated:
+                    reply = b'-NOAUTH Authentication required.\r\n'
+                elif command == b'SUBSCRIBE':
+                    reply = b''.join(
+                        b'*3\r\n' + bulk(b'subscribe') + bulk(channel) + b':' + str(i + 1).encode('ascii') + b'\r\n'
+                        for i, channel in enumerate(args[1:])
+                    )
+                    self.subscribers.append((stream, set(args[1:])))
+                else:
+                    reply = self.replies.get(command, b'-ERR unknown command\r\n')
+                    if callable(reply):
+                        reply = reply(args)
+                yield stream.write(reply)
+        except tornado.iostream.StreamClosedError:
+            pass
+
+    def disconnect_all(self):
+        for stream in self.streams:
+            stream.close()
+        self.streams = []
+
+    def publish(self, channel, message):
+        for stream, channels in self.subscribers:
+            if channel in channels and not stream.closed():
+                stream.write(b'*3\r\n' + bulk(b'message') + bulk(channel) + bulk(message), callback=lambda: None)
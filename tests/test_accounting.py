@@ -0,0 +1,105 @@
+from unittest import TestCase
+
+from hacheck import accounting
+
+
+class TestSpaceSaving(TestCase):
+    def test_replaces_smallest(self):
+        sketch = accounting.SpaceSaving(2)
+        self.assertEqual(1, sketch.add('a'))
+        self.assertEqual(0, sketch.add('a'))
+        self.assertEqual(1, sketch.add('b'))
+        self.assertEqual(0, sketch.add('c'))
+        # c takes over b's count
+        self.assertEqual({'a': 2, 'c': 2}, sketch.counts)
+
+
+def access_counts(now):
+    epoch = accounting.current_epoch(now)
+    counts = {}
+    for record in accounting.scan():
+        if record.source_counts(epoch):
+            counts[record.name] = dict(record.source_counts(epoch))
+    return counts
+
+
+def names(records):
+    return [record.name for record in records]
+
+
+class TestAccounting(TestCase):
+    def setUp(self):
+        accounting.configure(window=100, buckets=10, top_sources=2, max_services=10)
+
+    def tearDown(self):
+        accounting.configure()
+
+    def test_counts_over_window(self):
+        accounting.record_request('foo', '10.0.0.1', now=1000)
+        accounting.record_request('foo', '10.0.0.1', now=1005)
+        accounting.record_request('foo', '10.0.0.2', now=1050)
+        self.assertEqual({'foo': {'10.0.0.1': 2, '10.0.0.2': 1}}, access_counts(now=1050))
+        # the bucket holding the first two has left the window
+        self.assertEqual({'foo': {'10.0.0.2': 1}}, access_counts(now=1100))
+        self.assertEqual({}, access_counts(now=1150))
+
+    def test_top_sources(self):
+        for i in range(5):
+            accounting.record_request('foo', '10.0.0.1', now=1000)
+        for i in range(3):
+            accounting.record_request('foo', '10.0.0.%d' % (i + 2), now=1000)
+        counts = access_counts(now=1000)['foo']
+        self.assertEqual(5, counts['10.0.0.1'])
+        self.assertEqual(2, len(counts))
+        self.assertEqual(2, accounting.get_stats()['evicted_sources'])
+
+    def test_status(self):
+        self.assertEqual(None, accounting.last_status('foo'))
+        accounting.record_request('foo', '10.0.0.1', now=1000)
+        accounting.record_status('foo', 503, '10.0.0.1', 1000.5)
+        self.assertEqual(accounting.StatusResponse(503, '10.0.0.1', 1000.5), accounting.last_status('foo'))
+        self.assertEqual(1000, accounting.last_seen('foo'))
+
+    def test_results(self):
+        self.assertEqual(None, accounting.results('foo'))
+        accounting.record_request('foo', '10.0.0.1', now=1000)
+        self.assertEqual([], accounting.results('foo'))
+        accounting.configure(history=3)
+        accounting.record_request('foo', '10.0.0.1', now=1000)
+        for i in range(5):
+            accounting.record_result('foo', 200 + i, 0.01, 1000 + i)
+        self.assertEqual([accounting.Result(1002 + i, 202 + i, 0.01) for i in range(3)], accounting.results('foo'))
+        self.assertEqual(3, accounting.get_stats()['results'])
+
+    def test_scan(self):
+        for name in ('foo', 'bar', 'foo-b', 'foo-a', 'baz'):
+            accounting.record_request(name, '10.0.0.1', now=1000)
+        self.assertEqual(['bar', 'baz', 'foo', 'foo-a', 'foo-b'], names(accounting.scan()))
+        self.assertEqual(['foo', 'foo-a', 'foo-b'], names(accounting.scan(prefix='foo')))
+        self.assertEqual(['foo-a', 'foo-b'], names(accounting.scan(prefix='foo', after='foo')))
+        self.assertEqual(['foo', 'foo-a'], names(accounting.scan(prefix='foo', after='bar', limit=2)))
+        self.assertEqual([], names(accounting.scan(prefix='foo', after='zzz')))
+
+    def test_expiry(self):
+        accounting.record_request('foo', '10.0.0.1', now=1000)
+        accounting.record_request('bar', '10.0.0.1', now=1150)
+        self.assertEqual(None, accounting.last_seen('foo'))
+        stats = accounting.get_stats()
+        self.assertEqual(1, stats['expired_services'])
+        self.assertEqual(1, stats['services'])
+        self.assertEqual(1, stats['buckets'])
+        self.assertEqual(1, stats['source_entries'])
+
+    def test_max_services(self):
+        for i in range(11):
+            accounting.record_request('service%d' % i, '10.0.0.1', now=1000 + i)
+        stats = accounting.get_stats()
+        # the oldest two (to make room for one more) are forgotten
+        self.assertEqual(9, stats['services'])
+        self.assertEqual(2, stats['evicted_services'])
+        self.assertEqual(None, accounting.last_seen('service1'))
+        self.assertEqual(1010, accounting.last_seen('service10'))
+        self.assertEqual(['service10'] + ['service%d' % i for i in range(2, 10)],
+                         [record.name for record in accounting.scan()])
+        self.assertEqual(9, stats['source_entries'])
+        self.assertGreater(stats['approx_memory_bytes'], 0)
@@ -0,0 +1,138 @@
+import socket
+
+try:
+    from unittest2 import TestCase
+except ImportError:
+    from unittest import TestCase
+
+import mock
+import tornado.concurrent
+import tornado.iostream
+import tornado.testing
+
+from hacheck import accounting
+from hacheck import agent
+from hacheck import cache
+from hacheck import handlers
+from hacheck import metrics
+from hacheck import spool
+
+
+class TestWeight(TestCase):
+    def test_weight(self):
+        server = agent.AgentServer(latency_target=0.1, min_weight=20)
+        self.assertEqual(100, server.weight('tcp/foo/1'))
+        server.record_latency('tcp/foo/1', 0.05)
+        self.assertEqual(100, server.weight('tcp/foo/1'))
+        server.record_latency('tcp/foo/1', 0.55)
+        # 0.3 * 0.55 + 0.7 * 0.05
+        self.assertEqual(50, server.weight('tcp/foo/1'))
+        server.record_latency('tcp/foo/1', 10)
+        self.assertEqual(20, server.weight('tcp/foo/1'))
+
+    def test_no_target(self):
+        server = agent.AgentServer()
+        server.record_latency('tcp/foo/1', 10)
+        self.assertEqual(100, server.weight('tcp/foo/1'))
+
+
+class TestAgentServer(tornado.testing.AsyncTestCase):
+    def setUp(self):
+        super(TestAgentServer, self).setUp()
+        cache.configure()
+        handlers._reset_stats()
+        metrics.reset_stats()
+        sock, self.port = tornado.testing.bind_unused_port()
+        fixed_sock, self.fixed_port = tornado.testing.bind_unused_port()
+        self.server = agent.AgentServer(checks={self.fixed_port: 'spool/fixed/1'}, io_loop=self.io_loop)
+        self.server.add_sockets([sock, fixed_sock])
+
+    def tearDown(self):
+        self.server.stop()
+        super(TestAgentServer, self).tearDown()
+
+    @tornado.gen.coroutine
+    def ask(self, port, check=None):
+        stream = tornado.iostream.IOStream(socket.socket(), io_loop=self.io_loop)
+        yield stream.connect(('127.0.0.1', port))
+        if check is not None:
+            yield stream.write(check)
+        reply = yield stream.read_until_close()
+        raise tornado.gen.Return(reply)
+
+    @tornado.testing.gen_test
+    def test_agent_send(self):
+        with mock.patch.object(spool, 'is_up', return_value=(True, {})):
+            self.assertEqual(b'up\n', (yield self.ask(self.port, b'spool/foo/1\n')))
+        with mock.patch.object(spool, 'is_up', return_value=(False, {'service': 'foo'})):
+            self.assertEqual(b'down\n', (yield self.ask(self.port, b'spool/foo/1\n')))
+        self.assertEqual(503, accounting.last_status('foo').code)
+        self.assertEqual(1, metrics.responses['foo', 200])
+        self.assertEqual(1, metrics.responses['foo', 503])
+
+    @tornado.testing.gen_test
+    def test_fixed_port(self):
+        with mock.patch.object(spool, 'is_up', return_value=(True, {})):
+            self.assertEqual(b'up\n', (yield self.ask(self.fixed_port)))
+        self.assertIsNotNone(accounting.last_seen('fixed'))
+
+    @tornado.testing.gen_test
+    def test_unknown_check(self):
+        self.assertEqual(b'down\n', (yield self.ask(self.port, b'gopher/foo/1\n')))
+
+    @tornado.testing.gen_test
+    def test_weight_from_probe_latency(self):
+        self.server.latency_target = 0.1
+        probe = tornado.concurrent.Future()
+        probe.set_result((200, 'OK'))
+
+        @cache.cached
+        def slow_probe(service_name, port, query, io_loop, query_params, headers):
+            return probe
+
+        with mock.patch.object(handlers.TCPServiceHandler, 'CHECKERS', [slow_probe]):
+            with mock.patch.object(agent, 'time') as fake_time:
+                fake_time.time.side_effect = [0.0, 0.4]
+                self.assertEqual(b'up 25%\n', (yield self.ask(self.port, b'tcp/foo/1\n')))
+            # served from the cache: no new latency sample
+            self.assertEqual(b'up 25%\n', (yield self.ask(self.port, b'tcp/foo/1\n')))
+        self.assertEqual(0.4, self.server.latencies['tcp/foo/1'])
+
+    @tornado.testing.gen_test
+    def test_weight_recovers(self):
+        self.server.latency_target = 0.1
+        probe = tornado.concurrent.Future()
+        probe.set_result((200, 'OK'))
+
+        @cache.cached
+        def fake_probe(service_name, port, query, io_loop, query_params, headers):
+            return probe
+
+        with mock.patch.object(handlers.TCPServiceHandler, 'CHECKERS', [fake_probe]):
+            with mock.patch.object(agent, 'time') as fake_time:
+                fake_time.time.side_effect = [0.0, 0.4]
+                self.assertEqual(b'up 25%\n', (yield self.ask(self.port, b'tcp/foo/1\n')))
+                # fast probes bring the moving average back under the target
+                for _ in range(4):
+                    cache.configure()
+                    fake_time.time.side_effect = [0.0, 0.0]
+                    reply = yield self.ask(self.port, b'tcp/foo/1\n')
+        self.assertEqual(b'up 100%\n', reply)
+
+    @tornado.testing.gen_test
+    def test_latencies_bounded_by_accounting(self):
+        accounting.configure(max_services=10)
+        self.addCleanup(accounting.configure)
+        probe = tornado.concurrent.Future()
+        probe.set_result((200, 'OK'))
+
+        @cache.cached
+        def fake_probe(service_name, port, query, io_loop, query_params, headers):
+            return probe
+
+        with mock.patch.object(handlers.TCPServiceHandler, 'CHECKERS', [fake_probe]):
+            for i in range(30):
+                yield self.ask(self.port, b'tcp/service%d/1\n' % i)
+        self.assertLessEqual(len(self.server.latencies), 10)
+        self.assertIn('tcp/service29/1', self.server.latencies)
+        self.assertEqual(set(self.server.latencies), set(self.server.check_services))
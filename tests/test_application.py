@@ -1,18 +1,37 @@
 import json
+import re
+import socket
 import tempfile
 import shutil
+import time
 
 from hacheck.compat import nested
 
 import mock
 import tornado.concurrent
+import tornado.gen
+import tornado.httpclient
+import tornado.iostream
 import tornado.testing
 import yaml
 
+from hacheck import accounting
+from hacheck import checker
+from hacheck import config
+from hacheck import events
+from hacheck import flapping
 from hacheck import main
 from hacheck import spool
 from hacheck import cache
 from hacheck import handlers
+from hacheck import metrics
+
+
+@cache.cached
+def fake_probe(service_name, port, query, io_loop, query_params, headers):
+    future = tornado.concurrent.Future()
+    future.set_result((200, b'OK'))
+    return future
 
 
 class ApplicationTestCase(tornado.testing.AsyncHTTPTestCase):
@@ -29,6 +48,7 @@ class ApplicationTestCase(tornado.testing.AsyncHTTPTestCase):
         self.config_file.flush()
         spool.configure(spool_root=self.spool)
         handlers._reset_stats()
+        metrics.reset_stats()
         super(ApplicationTestCase, self).setUp()
 
     def tearDown(self):
@@ -59,6 +79,129 @@ class ApplicationTestCase(tornado.testing.AsyncHTTPTestCase):
         result = json.loads(response.body.decode('utf-8'))
         self.assertEqual(result['service_access_counts'], {'foo': {'127.0.0.1': 1}})
 
+    def test_pages(self):
+        with mock.patch.object(spool, 'is_up', return_value=(True, {"reason": b'YES'})):
+            for name in ('foo', 'bar', 'foo-b', 'foo-a', 'baz'):
+                self.fetch('/spool/%s/1/status' % name)
+        with mock.patch.object(handlers.ServicePageHandler, 'CHUNK_SIZE', 2):
+            result = json.loads(self.fetch('/recent').body.decode('utf-8'))
+            self.assertEqual(['bar', 'baz', 'foo', 'foo-a', 'foo-b'], [s[0] for s in result['seen_services']])
+            self.assertNotIn('next_cursor', result)
+
+            result = json.loads(self.fetch('/recent?prefix=foo&limit=2').body.decode('utf-8'))
+            self.assertEqual(['foo', 'foo-a'], [s[0] for s in result['seen_services']])
+            self.assertEqual('foo-a', result['next_cursor'])
+            self.assertEqual(600, result['threshold_seconds'])
+            result = json.loads(self.fetch('/recent?prefix=foo&limit=2&cursor=foo-a').body.decode('utf-8'))
+            self.assertEqual(['foo-b'], [s[0] for s in result['seen_services']])
+            self.assertNotIn('next_cursor', result)
+
+            result = json.loads(self.fetch('/status/count?limit=3').body.decode('utf-8'))
+            self.assertEqual(
+                {'bar': {'127.0.0.1': 1}, 'baz': {'127.0.0.1': 1}, 'foo': {'127.0.0.1': 1}},
+                result['service_access_counts'],
+            )
+            self.assertEqual('foo', result['next_cursor'])
+            result = json.loads(self.fetch('/status/count?cursor=foo').body.decode('utf-8'))
+            self.assertEqual(['foo-a', 'foo-b'], sorted(result['service_access_counts']))
+            # a page which happens to end with the last service has no next one
+            result = json.loads(self.fetch('/recent?prefix=foo&limit=3').body.decode('utf-8'))
+            self.assertEqual(['foo', 'foo-a', 'foo-b'], [s[0] for s in result['seen_services']])
+            self.assertNotIn('next_cursor', result)
+            result = json.loads(self.fetch('/recent?prefix=foo&limit=1&cursor=foo-a').body.decode('utf-8'))
+            self.assertEqual(['foo-b'], [s[0] for s in result['seen_services']])
+            self.assertNotIn('next_cursor', result)
+        self.assertEqual(400, self.fetch('/recent?limit=0').code)
+        self.assertEqual(400, self.fetch('/status/count?limit=x').code)
+
+    @tornado.testing.gen_test
+    def test_events(self):
+        events.configure()
+        stream = tornado.iostream.IOStream(socket.socket(), io_loop=self.io_loop)
+        yield stream.connect(('127.0.0.1', self.get_http_port()))
+        stream.write(b'GET /events HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        headers = yield stream.read_until(b'\r\n\r\n')
+        self.assertIn(b'Content-Type: text/event-stream', headers)
+        with mock.patch.object(spool, 'is_up', return_value=(True, {"reason": b'YES'})):
+            yield self.http_client.fetch(self.get_url('/spool/foo/1/status'))
+            # not a transition
+            yield self.http_client.fetch(self.get_url('/spool/foo/1/status'))
+        with mock.patch.object(spool, 'is_up', return_value=(False, {"service": "foo", "reason": ""})):
+            with self.assertRaises(tornado.httpclient.HTTPError):
+                yield self.http_client.fetch(self.get_url('/spool/foo/1/status'))
+        body = b''
+        while body.count(b'event: transition') < 2:
+            body += yield stream.read_until(b'\n\n')
+        transitions = [json.loads(data) for data in re.findall(r'data: (.*)', body.decode('utf-8'))]
+        self.assertEqual([(None, 200), (200, 503)], [(t['old_code'], t['new_code']) for t in transitions])
+        self.assertEqual('foo', transitions[0]['service'])
+        self.assertEqual(1, events.get_stats()['subscribers'])
+        stream.close()
+        yield tornado.gen.Task(self.io_loop.add_callback)
+        self.assertEqual(0, events.get_stats()['subscribers'])
+
+    def test_events_bad_replay(self):
+        self.assertEqual(400, self.fetch('/events?replay=x').code)
+
+    def test_history(self):
+        self.assertEqual(404, self.fetch('/history/foo').code)
+        flapping.configure(threshold=2, stable_probes=2, cache_factor=3)
+        self.addCleanup(flapping.configure)
+        backend_codes = []
+
+        @cache.cached
+        def flappy_probe(service_name, port, query, io_loop, query_params, headers):
+            future = tornado.concurrent.Future()
+            future.set_result((backend_codes.pop(0), b''))
+            return future
+
+        codes = []
+        with mock.patch.object(handlers.TCPServiceHandler, 'CHECKERS', [checker.check_spool, flappy_probe]):
+            for spool_up, backend_code in ((True, 200), (True, 503), (True, 200), (False, 200), (True, 200)):
+                backend_codes.append(backend_code)
+                with mock.patch.object(spool, 'is_up', return_value=(spool_up, {"service": "foo", "reason": ""})):
+                    codes.append(self.fetch('/tcp/foo/1', headers={'Pragma': 'no-cache'}).code)
+            # answered from the cache
+            codes.append(self.fetch('/tcp/foo/1').code)
+            backend_codes.append(200)
+            self.fetch('/tcp/bar/1')
+        # held down once up again after going down, until up for two probes;
+        # the spool being down in between doesn't count either way
+        self.assertEqual([200, 503, 503, 503, 200, 200], codes)
+        history = json.loads(self.fetch('/history/foo').body.decode('utf-8'))
+        self.assertEqual([200, 503, 200, 200], [result['code'] for result in history['results']])
+        self.assertTrue(all(result['latency'] >= 0 for result in history['results']))
+        self.assertEqual(2, history['flips'])
+        self.assertTrue(history['flapping'])
+        self.assertEqual(2, history['stable_for'])
+        # only the flapping service's own result is cached for longer
+        now = time.time()
+        self.assertGreater(cache._cache[cache.Key(('flappy_probe', ('foo', 1, '')))].expiry - now, 20)
+        self.assertLess(cache._cache[cache.Key(('flappy_probe', ('bar', 1, '')))].expiry - now, 11)
+
+    def test_history_of_uncached_checks(self):
+        with mock.patch.object(spool, 'is_up', return_value=(True, {})):
+            self.fetch('/spool/foo/1/status')
+        # spool checks aren't probes of the backend
+        self.assertEqual([], json.loads(self.fetch('/history/foo').body.decode('utf-8'))['results'])
+
+    def test_metrics(self):
+        with mock.patch.object(spool, 'is_up', return_value=(False, {"service": "foo", "reason": ""})):
+            self.fetch('/spool/foo/1/status')
+        with mock.patch.object(handlers.TCPServiceHandler, 'CHECKERS', [fake_probe]):
+            self.fetch('/tcp/bar/1')
+            # answered from the cache, so not a probe
+            self.fetch('/tcp/bar/1')
+        response = self.fetch('/metrics')
+        self.assertEqual(200, response.code)
+        self.assertEqual(metrics.CONTENT_TYPE, response.headers['Content-Type'])
+        lines = response.body.decode('utf-8').splitlines()
+        self.assertIn('hacheck_responses_total{service="foo",code="503"} 1', lines)
+        self.assertIn('hacheck_request_duration_seconds_count{service="foo"} 1', lines)
+        self.assertIn('hacheck_request_duration_seconds_count{service="bar"} 2', lines)
+        self.assertIn('hacheck_probe_duration_seconds_count{checker="fake_probe",service="bar"} 1', lines)
+        self.assertIn('hacheck_probes_in_progress{checker="fake_probe"} 0', lines)
+
     def test_routing(self):
         with mock.patch.object(handlers.HTTPServiceHandler, 'get') as m:
             self.fetch('/http/foo/1/status')
@@ -135,6 +278,36 @@ class ApplicationTestCase(tornado.testing.AsyncHTTPTestCase):
             self.assertEqual(404, response.code)
             self.assertEqual(b'NOK2', response.body)
 
+    def test_checkers_run_concurrently(self):
+        rv1 = tornado.concurrent.Future()
+        rv2 = tornado.concurrent.Future()
+        rv2.set_result((200, b'OK2'))
+
+        def start_checker2(*args, **kwargs):
+            # the first checker only finishes once the second has been started
+            rv1.set_result((200, b'OK1'))
+            return rv2
+
+        checker1 = mock.Mock(return_value=rv1)
+        checker2 = mock.Mock(side_effect=start_checker2)
+        with mock.patch.object(handlers.SpoolServiceHandler, 'CHECKERS', [checker1, checker2]):
+            response = self.fetch('/spool/foo/3/status')
+            self.assertEqual(200, response.code)
+            self.assertEqual(b'OK2', response.body)
+
+    def test_first_failure_in_chain_wins(self):
+        rv1 = tornado.concurrent.Future()
+        rv2 = tornado.concurrent.Future()
+        rv2.set_result((404, b'NOK2'))
+        checker1 = mock.Mock(return_value=rv1)
+        checker2 = mock.Mock(return_value=rv2)
+        with mock.patch.object(handlers.SpoolServiceHandler, 'CHECKERS', [checker1, checker2]):
+            self.http_client.fetch(self.get_url('/spool/foo/4/status'), self.stop)
+            self.io_loop.add_callback(lambda: rv1.set_result((503, b'NOK1')))
+            response = self.wait()
+            self.assertEqual(503, response.code)
+            self.assertEqual(b'NOK1', response.body)
+
     def test_weird_code(self):
         # test that unusual HTTP codes are rewritten to 503s
         rv = tornado.concurrent.Future()
@@ -156,8 +329,40 @@ class ApplicationTestCase(tornado.testing.AsyncHTTPTestCase):
             spool_configure.assert_called_once_with(spool_root='foo')
             cache_configure.assert_called_once_with(cache_time=100)
 
+    def test_server_timing(self):
+        with mock.patch.object(handlers.TCPServiceHandler, 'CHECKERS', [fake_probe]):
+            response = self.fetch('/tcp/bar/1')
+            self.assertNotIn('Server-Timing', response.headers)
+            with mock.patch.dict(config.config, {'server_timing': True}):
+                response = self.fetch('/tcp/baz/1')
+                self.assertRegexpMatches(response.headers['Server-Timing'],
+                                         r'^fake_probe;desc=miss;dur=[0-9.]+, total;dur=[0-9.]+$')
+                response = self.fetch('/tcp/baz/1')
+                self.assertRegexpMatches(response.headers['Server-Timing'],
+                                         r'^fake_probe;desc=hit;dur=[0-9.]+, total;dur=[0-9.]+$')
+
+    @tornado.testing.gen_test
+    def test_timings_of_coalesced_probes(self):
+        probe = tornado.concurrent.Future()
+
+        @cache.cached
+        def slow_probe(service_name, port, query, io_loop, query_params, headers):
+            return probe
+
+        timings = [[], []]
+        results = [
+            handlers.run_checkers([slow_probe], 'foo', 1, '', query_params='', headers={}, remote_ip='127.0.0.1',
+                                  timings=t)
+            for t in timings
+        ]
+        probe.set_result((200, b'OK'))
+        for result in results:
+            yield result
+        self.assertEqual(['miss', 'coalesced'], [t[0].cache for t in timings])
+        self.assertEqual('slow_probe', timings[0][0].name)
+        self.assertTrue(all(t[0].duration is not None for t in timings))
+
     def test_show_recent(self):
-        handlers.seen_services.clear()
         response = self.fetch('/spool/foo/1/status')
         self.assertEqual(200, response.code)
         response = self.fetch('/recent')
@@ -176,3 +381,57 @@ class ApplicationTestCase(tornado.testing.AsyncHTTPTestCase):
                 'seen_services': [['foo', {'code': 200, 'ts': mock.ANY, 'remote_ip': '127.0.0.1'}]],
                 'threshold_seconds': 20
             })
+
+    def test_batch(self):
+        rv1 = tornado.concurrent.Future()
+        rv1.set_result((200, b'OK1'))
+        rv2 = tornado.concurrent.Future()
+        rv2.set_result((404, 'NOK2'))
+        checker1 = mock.Mock(return_value=rv1)
+        checker2 = mock.Mock(return_value=rv2)
+        with nested(
+                mock.patch.object(handlers.SpoolServiceHandler, 'CHECKERS', [checker1]),
+                mock.patch.object(handlers.TCPServiceHandler, 'CHECKERS', [checker2])):
+            response = self.fetch('/batch', method='POST', body=json.dumps(
+                ['spool/foo/1/status?x=1', 'tcp/bar/2', 'nonsense/baz/3', 4]
+            ))
+            self.assertEqual(200, response.code)
+            self.assertEqual(
+                {'results': [
+                    {'check': 'spool/foo/1/status?x=1', 'code': 200, 'message': 'OK1'},
+                    {'check': 'tcp/bar/2', 'code': 404, 'message': 'NOK2'},
+                    {'check': 'nonsense/baz/3', 'code': 400, 'message': mock.ANY},
+                    {'check': 4, 'code': 400, 'message': mock.ANY},
+                ]},
+                json.loads(response.body.decode('utf-8'))
+            )
+            checker1.assert_called_once_with('foo', 1, 'status', io_loop=mock.ANY, query_params='x=1', headers=mock.ANY)
+            checker2.assert_called_once_with('bar', 2, '', io_loop=mock.ANY, query_params='', headers=mock.ANY)
+        self.assertEqual(404, accounting.last_status('bar').code)
+        # each check in the batch is counted as a request of its own
+        self.assertEqual(1, metrics.responses['foo', 200])
+        self.assertEqual(1, metrics.responses['bar', 404])
+        self.assertEqual(1, sum(metrics.request_durations['bar'].counts))
+
+    def test_batch_jsonl(self):
+        rv = tornado.concurrent.Future()
+        rv.set_result((200, 'OK'))
+        checker = mock.Mock(return_value=rv)
+        with nested(
+                mock.patch.object(handlers.SpoolServiceHandler, 'CHECKERS', [checker]),
+                mock.patch.dict(config.config, {'batch_concurrency': 2})):
+            response = self.fetch('/batch?format=jsonl&check=spool/foo/1&check=spool/bar/1&check=spool/baz/1')
+            self.assertEqual(200, response.code)
+            self.assertEqual('application/x-ndjson', response.headers['Content-Type'])
+            lines = [json.loads(line) for line in response.body.decode('utf-8').splitlines()]
+            self.assertEqual(['spool/bar/1', 'spool/baz/1', 'spool/foo/1'], sorted(line['check'] for line in lines))
+            self.assertEqual(3, checker.call_count)
+
+    def test_batch_too_big(self):
+        with mock.patch.dict(config.config, {'batch_max_checks': 2}):
+            response = self.fetch('/batch?check=spool/foo/1&check=spool/bar/1&check=spool/baz/1')
+        self.assertEqual(400, response.code)
+
+    def test_batch_bad_body(self):
+        response = self.fetch('/batch', method='POST', body='{"not": "a list"}')
+        self.assertEqual(400, response.code)
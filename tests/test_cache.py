@@ -30,6 +30,21 @@ class CacheTestCase(TestCase):
                 cache.getv(se.key, time.time())
                 m.assert_called_once_with(cache.Record(14, mock.ANY), 1)
 
+    def test_lengthen(self):
+        cache.configure(cache_time=10)
+
+        def probe(*args):
+            pass
+
+        with mock.patch('time.time', return_value=1):
+            cache.setv(('probe', ('foo', 1)), se.value)
+            cache.setv(('probe', ('bar', 1)), se.value)
+        cache.lengthen(probe, ('foo', 1), 3)
+        # nothing cached, nothing to do
+        cache.lengthen(probe, ('baz', 1), 3)
+        self.assertEqual(31, cache._cache[cache.Key(('probe', ('foo', 1)))].expiry)
+        self.assertEqual(11, cache._cache[cache.Key(('probe', ('bar', 1)))].expiry)
+
     def test_stats(self):
         with mock.patch.object(cache, 'has_expired', return_value=False):
             cache.setv(se.key, se.value)
@@ -1,18 +1,46 @@
+import json
 import mock
+import os
+import shutil
 import socket
+import ssl
+import sys
+import tempfile
 
 try:
-    from unittest2 import TestCase
+    from unittest2 import SkipTest, TestCase
 except ImportError:
-    from unittest import TestCase
+    from unittest import SkipTest, TestCase
 
 import tornado.concurrent
+import tornado.httpserver
+import tornado.netutil
 import tornado.web
 import tornado.testing
 
+from hacheck import cache
 from hacheck import checker
 from hacheck import config
+from hacheck import keepalive
+from hacheck import memcached
+from hacheck import mysql
+from hacheck import postgres
+from hacheck import procnet
+from hacheck import redis
+from hacheck import scripts
 from hacheck import spool
+from hacheck.checkers import haproxy as haproxy_checkers
+from hacheck.checkers import http as http_checkers
+from hacheck.checkers import memcached as memcached_checkers
+from hacheck.checkers import mysql as mysql_checkers
+from hacheck.checkers import postgres as postgres_checkers
+from hacheck.checkers import redis as redis_checkers
+from hacheck.checkers import scripts as scripts_checkers
+
+from . import fake_memcached
+from . import fake_mysql
+from . import fake_postgres
+from . import fake_redis
 
 se = mock.sentinel
 
@@ -45,6 +73,19 @@ class EchoParamFoo(tornado.web.RequestHandler):
         self.write(self.get_argument('foo'))
 
 
+class ReturnChunked(tornado.web.RequestHandler):
+    def get(self):
+        self.write(b'TEST ')
+        self.flush()
+        self.write(b'CHUNKED')
+
+
+class ReturnAndClose(tornado.web.RequestHandler):
+    def get(self):
+        self.set_header('Connection', 'close')
+        self.write(b'BYE')
+
+
 class TestChecker(TestCase):
     def test_spool_success(self):
         with mock.patch.object(spool, 'is_up', return_value=(True, {})):
@@ -59,6 +100,21 @@ class TestChecker(TestCase):
             fut = checker.check_spool(se.name, se.port, se.query, None, query_params=None, headers={})
             self.assertEqual(fut.result()[0], 503)
 
+    def test_listen_success(self):
+        with mock.patch.object(procnet, 'listening_addresses', return_value=set(['0100007F'])):
+            fut = checker.check_listen(se.name, 8080, se.query, None, query_params=None, headers={})
+            self.assertEqual((200, 'Listening on 127.0.0.1:8080'), fut.result())
+
+    def test_listen_failure(self):
+        with mock.patch.object(procnet, 'listening_addresses', return_value=set()):
+            fut = checker.check_listen(se.name, 8080, se.query, None, query_params=None, headers={})
+            self.assertEqual(503, fut.result()[0])
+
+    def test_listen_unreadable(self):
+        with mock.patch.object(procnet, 'listening_addresses', side_effect=IOError('nope')):
+            fut = checker.check_listen(se.name, 8080, se.query, None, query_params=None, headers={})
+            self.assertEqual(500, fut.result()[0])
+
 
 class ValidHaproxyResponse(tornado.web.RequestHandler):
     def get(self):
@@ -75,6 +131,14 @@ postgres-soa-slave,localhost,0,0,0,0,,0,0,0,,0,,0,0,0,0,DOWN,10,1,0,2,2,259401,2
 postgres-soa-slave,BACKEND,0,0,0,0,200,0,0,0,0,0,,0,0,0,0,DOWN,0,0,0,,2,259401,259435,,1,22,0,,0,,1,0,,0,,,,,,,,,,,,,,0,0,0,0,0,0,-1,,,0,0,0,0,\n''')
 
 
+class CountingHaproxyResponse(ValidHaproxyResponse):
+    fetches = 0
+
+    def get(self):
+        CountingHaproxyResponse.fetches += 1
+        super(CountingHaproxyResponse, self).get()
+
+
 class InvalidHaproxyResponse(tornado.web.RequestHandler):
     def get(self):
         self.set_status(500)
@@ -90,24 +154,46 @@ class TestHaproxyCheckerValidResponse(tornado.testing.AsyncHTTPTestCase):
 
     def get_app(self):
         return tornado.web.Application([
-            ('/;csv', ValidHaproxyResponse),
+            ('/;csv', CountingHaproxyResponse),
         ])
 
+    def setUp(self):
+        super(TestHaproxyCheckerValidResponse, self).setUp()
+        cache.configure()
+        CountingHaproxyResponse.fetches = 0
+
     @tornado.testing.gen_test
     def test_downbackend(self):
-        response = yield checker.check_haproxy("downbackend", self.get_http_port(), "/", io_loop=self.io_loop, query_params="", headers={})
+        response = yield haproxy_checkers.check_haproxy("downbackend", self.get_http_port(), "/", io_loop=self.io_loop, query_params="", headers={})
         self.assertEqual((500, 'downbackend is DOWN'), response)
 
     @tornado.testing.gen_test
     def test_nonexistentbackend(self):
-        response = yield checker.check_haproxy("nonexistentbackend", self.get_http_port(), "/", io_loop=self.io_loop, query_params="", headers={})
+        response = yield haproxy_checkers.check_haproxy("nonexistentbackend", self.get_http_port(), "/", io_loop=self.io_loop, query_params="", headers={})
         self.assertEqual((500, 'nonexistentbackend is not found'), response)
 
     @tornado.testing.gen_test
     def test_upbackend(self):
-        response = yield checker.check_haproxy("upbackend", self.get_http_port(), "/", io_loop=self.io_loop, query_params="", headers={})
+        response = yield haproxy_checkers.check_haproxy("upbackend", self.get_http_port(), "/", io_loop=self.io_loop, query_params="", headers={})
         self.assertEqual((200, 'upbackend is UP'), response)
 
+    @tornado.testing.gen_test
+    def test_server(self):
+        response = yield haproxy_checkers.check_haproxy("server1", self.get_http_port(), "localhost", io_loop=self.io_loop, query_params="", headers={})
+        self.assertEqual((500, 'server1/localhost is DOWN'), response)
+        response = yield haproxy_checkers.check_haproxy("server1", self.get_http_port(), "/nope", io_loop=self.io_loop, query_params="", headers={})
+        self.assertEqual((500, 'server1/nope is not found'), response)
+
+    @tornado.testing.gen_test
+    def test_single_fetch_per_port(self):
+        port = self.get_http_port()
+        responses = yield [
+            haproxy_checkers.check_haproxy(name, port, "/", io_loop=self.io_loop, query_params="", headers={})
+            for name in ("upbackend", "downbackend", "stats")
+        ]
+        self.assertEqual([200, 500, 200], [code for code, _ in responses])
+        self.assertEqual(1, CountingHaproxyResponse.fetches)
+
 
 class TestHaproxyCheckerInvalidResponse(tornado.testing.AsyncHTTPTestCase):
 
@@ -118,7 +204,7 @@ class TestHaproxyCheckerInvalidResponse(tornado.testing.AsyncHTTPTestCase):
 
     @tornado.testing.gen_test
     def test_invalidhttpresponse(self):
-        response = yield checker.check_haproxy("", self.get_http_port(), "/", io_loop=self.io_loop, query_params="", headers={})
+        response = yield haproxy_checkers.check_haproxy("", self.get_http_port(), "/", io_loop=self.io_loop, query_params="", headers={})
         self.assertEqual((500, b''), response)
 
 
@@ -132,7 +218,7 @@ class TestHaproxyCheckerExceptionResponse(tornado.testing.AsyncHTTPTestCase):
     @tornado.testing.gen_test
     def test_badresponse(self):
         port = self.get_http_port()
-        response = yield checker.check_haproxy("", port, "/", io_loop=self.io_loop, query_params="", headers={})
+        response = yield haproxy_checkers.check_haproxy("", port, "/", io_loop=self.io_loop, query_params="", headers={})
         self.assertEqual(599, response[0])
 
 
@@ -183,6 +269,147 @@ class TestHTTPChecker(tornado.testing.AsyncHTTPTestCase):
         self.assertEqual(400, response[0])
 
 
+class TestHTTPUnixChecker(tornado.testing.AsyncTestCase):
+    def setUp(self):
+        super(TestHTTPUnixChecker, self).setUp()
+        cache.configure()
+        keepalive.reset_stats()
+        self.socket_dir = tempfile.mkdtemp()
+        self.server = tornado.httpserver.HTTPServer(tornado.web.Application([
+            ('/', ReturnTwoHundred),
+            ('/sname', ExpectServiceNameHeader),
+            ('/bip', ReturnFiveOhOne),
+            ('/echo_foo', EchoParamFoo),
+            ('/chunked', ReturnChunked),
+            ('/close', ReturnAndClose),
+        ], log_function=lambda handler: None), io_loop=self.io_loop)
+        self.server.add_socket(tornado.netutil.bind_unix_socket(os.path.join(self.socket_dir, 'web.sock')))
+        self.config = mock.patch.dict(config.config, {'http_unix_socket_dir': self.socket_dir})
+        self.config.start()
+
+    def tearDown(self):
+        self.config.stop()
+        keepalive.close_pools()
+        self.server.stop()
+        shutil.rmtree(self.socket_dir)
+        super(TestHTTPUnixChecker, self).tearDown()
+
+    def check(self, path, socket_name='web.sock', query_params=''):
+        return http_checkers.check_http_unix('foo', socket_name, path, io_loop=self.io_loop,
+                                             query_params=query_params, headers={})
+
+    @tornado.testing.gen_test
+    def test_check(self):
+        self.assertEqual((200, b'TEST OK'), (yield self.check('/')))
+        self.assertEqual((501, b'NOPE'), (yield self.check('/bip')))
+        self.assertEqual((200, b'TEST CHUNKED'), (yield self.check('/chunked')))
+        self.assertEqual((200, b'bar'), (yield self.check('/echo_foo', query_params='foo=bar')))
+        self.assertEqual(404, (yield self.check('/nope'))[0])
+
+    @tornado.testing.gen_test
+    def test_connections_are_kept_alive(self):
+        for path in ('/', '/bip', '/chunked', '/nope'):
+            yield self.check(path)
+        self.assertEqual(1, keepalive.get_stats()['connects'])
+        self.assertEqual(3, keepalive.get_stats()['reused'])
+
+    @tornado.testing.gen_test
+    def test_server_closes_connection(self):
+        self.assertEqual((200, b'BYE'), (yield self.check('/close')))
+        self.assertEqual((200, b'TEST OK'), (yield self.check('/')))
+        self.assertEqual(2, keepalive.get_stats()['connects'])
+
+    @tornado.testing.gen_test
+    def test_service_name_header(self):
+        with mock.patch.dict(config.config, {'service_name_header': 'SName'}):
+            self.assertEqual((200, b'foo'), (yield self.check('/sname')))
+
+    @tornado.testing.gen_test
+    def test_no_socket(self):
+        self.assertEqual(503, (yield self.check('/', socket_name='other.sock'))[0])
+        self.assertEqual(400, (yield self.check('/', socket_name='..'))[0])
+
+    @tornado.testing.gen_test
+    def test_no_socket_dir(self):
+        with mock.patch.dict(config.config, {'http_unix_socket_dir': None}):
+            self.assertEqual(500, (yield self.check('/'))[0])
+
+
+TLS_DIR = os.path.join(os.path.dirname(__file__), 'tls')
+
+
+class TestHTTPSChecker(tornado.testing.AsyncTestCase):
+    def setUp(self):
+        super(TestHTTPSChecker, self).setUp()
+        cache.configure()
+        keepalive.reset_stats()
+        context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+        context.load_cert_chain(os.path.join(TLS_DIR, 'cert.pem'), os.path.join(TLS_DIR, 'key.pem'))
+        self.server = tornado.httpserver.HTTPServer(tornado.web.Application([
+            ('/', ReturnTwoHundred),
+            ('/bip', ReturnFiveOhOne),
+            ('/echo_foo', EchoParamFoo),
+            ('/close', ReturnAndClose),
+        ], log_function=lambda handler: None), ssl_options=context, io_loop=self.io_loop)
+        sock, self.port = tornado.testing.bind_unused_port()
+        self.server.add_socket(sock)
+
+    def tearDown(self):
+        keepalive.close_pools()
+        self.server.stop()
+        super(TestHTTPSChecker, self).tearDown()
+
+    def check(self, path, query_params=''):
+        return http_checkers.check_https('foo', self.port, path, io_loop=self.io_loop, query_params=query_params, headers={})
+
+    @tornado.testing.gen_test
+    def test_check(self):
+        self.assertEqual((200, b'TEST OK'), (yield self.check('/')))
+        self.assertEqual((501, b'NOPE'), (yield self.check('/bip')))
+        self.assertEqual((200, b'bar'), (yield self.check('/echo_foo', query_params='foo=bar')))
+        stats = keepalive.get_stats()
+        self.assertEqual(1, stats['connects'])
+        self.assertEqual(1, stats['tls_handshakes'])
+        self.assertGreater(stats['tls_handshake_time'], 0)
+
+    @tornado.testing.gen_test
+    def test_sessions_are_resumed(self):
+        if not hasattr(ssl.SSLSocket, 'session'):
+            raise SkipTest('this ssl module cannot resume sessions')
+        yield self.check('/close')
+        yield self.check('/')
+        stats = keepalive.get_stats()
+        self.assertEqual(2, stats['tls_handshakes'])
+        self.assertEqual(1, stats['tls_resumed'])
+        self.assertEqual(0.5, stats['tls_resumption_rate'])
+
+    @tornado.testing.gen_test
+    def test_ca_file(self):
+        with mock.patch.dict(config.config, {'https_ca_file': os.path.join(TLS_DIR, 'cert.pem')}):
+            self.assertEqual((200, b'TEST OK'), (yield self.check('/')))
+
+    @tornado.testing.gen_test
+    def test_untrusted_certificate(self):
+        with mock.patch.dict(config.config, {'https_ca_file': os.path.join(TLS_DIR, 'other-ca.pem')}):
+            # the server may log the alert we send it
+            with tornado.testing.ExpectLog('tornado.general', 'Uncaught exception', required=False):
+                self.assertEqual(503, (yield self.check('/'))[0])
+
+    @tornado.testing.gen_test
+    def test_plain_http(self):
+        server = tornado.httpserver.HTTPServer(tornado.web.Application([('/', ReturnTwoHundred)]), io_loop=self.io_loop)
+        sock, port = tornado.testing.bind_unused_port()
+        server.add_socket(sock)
+        try:
+            # the server waits for the end of a request that never comes
+            with mock.patch.object(checker, 'TIMEOUT', 1):
+                code, _ = yield http_checkers.check_https('foo', port, '/', io_loop=self.io_loop, query_params='',
+                                                          headers={})
+            self.assertEqual(503, code)
+        finally:
+            server.stop()
+
+
 class TestServer(tornado.tcpserver.TCPServer):
     def __init__(self, io_loop, response='hello\n'):
         self.response = response
@@ -226,11 +453,12 @@ class TestTCPChecker(tornado.testing.AsyncTestCase):
             self.assertEqual(response[0], 503)
 
 
-class TestRedisSentinelChecker(tornado.testing.AsyncTestCase):
+class RedisTestCase(tornado.testing.AsyncTestCase):
     def setUp(self):
-        super(TestRedisSentinelChecker, self).setUp()
+        super(RedisTestCase, self).setUp()
+        cache.configure()
         socket, port = tornado.testing.bind_unused_port()
-        self.server = TestServer(io_loop=self.io_loop)
+        self.server = fake_redis.FakeRedisServer(io_loop=self.io_loop)
         self.server.add_socket(socket)
         self.socket = socket
         self.port = port
@@ -239,57 +467,93 @@ class TestRedisSentinelChecker(tornado.testing.AsyncTestCase):
         self.unlistened_port = unlistened_port
 
     def tearDown(self):
-        super(TestRedisSentinelChecker, self).tearDown()
+        redis.close_pools()
+        super(RedisTestCase, self).tearDown()
         try:
             self.server.stop()
             self.socket.close()
         except Exception:
             pass
 
+
+class TestRedisSentinelChecker(RedisTestCase):
     @tornado.testing.gen_test
     def test_check_success(self):
-        with mock.patch.object(self.server, 'response', b'+PONG\r\n'):
-            response = yield checker.check_redis_sentinel("foo", self.port, None, io_loop=self.io_loop, query_params="", headers={})
-            self.assertEqual(200, response[0], response[1])
+        response = yield redis_checkers.check_redis_sentinel("foo", self.port, None, io_loop=self.io_loop, query_params="", headers={})
+        self.assertEqual(200, response[0], response[1])
 
     @tornado.testing.gen_test
     def test_check_error(self):
-        with mock.patch.object(self.server, 'response', b'WAT\r\n'):
-            response = yield checker.check_redis_sentinel("foo", self.port, None, io_loop=self.io_loop, query_params="", headers={})
+        with mock.patch.dict(self.server.replies, {b'PING': b'+WAT\r\n'}):
+            response = yield redis_checkers.check_redis_sentinel("foo", self.port, None, io_loop=self.io_loop, query_params="", headers={})
+            self.assertEqual(500, response[0])
+
+    @tornado.testing.gen_test
+    def test_check_error_reply(self):
+        with mock.patch.dict(self.server.replies, {b'PING': b'-LOADING Redis is loading the dataset in memory\r\n'}):
+            response = yield redis_checkers.check_redis_sentinel("foo", self.port, None, io_loop=self.io_loop, query_params="", headers={})
             self.assertEqual(500, response[0])
 
+    @tornado.testing.gen_test
+    def test_check_connection_refused(self):
+        self.unlistened_socket.close()
+        response = yield redis_checkers.check_redis_sentinel("foo", self.unlistened_port, None, io_loop=self.io_loop, query_params="", headers={})
+        self.assertEqual(503, response[0])
+
     @tornado.testing.gen_test
     def test_check_timeout(self):
         with mock.patch.object(checker, 'TIMEOUT', 1):
             response = yield checker.check_tcp("foo", self.unlistened_port, None, io_loop=self.io_loop, query_params="", headers={})
             self.assertEqual(response[0], 503)
 
-class TestRedisInfoChecker(tornado.testing.AsyncTestCase):
-    def setUp(self):
-        super(TestRedisInfoChecker, self).setUp()
-        socket, port = tornado.testing.bind_unused_port()
-        self.server = TestServer(io_loop=self.io_loop)
-        self.server.add_socket(socket)
-        self.socket = socket
-        self.port = port
-        unlistened_socket, unlistened_port = bind_synchronous_unused_port()
-        self.unlistened_socket = unlistened_socket
-        self.unlistened_port = unlistened_port
+    @tornado.testing.gen_test
+    def test_persistent_connection(self):
+        for _ in range(3):
+            with cache.maybe_bust(True):
+                response = yield redis_checkers.check_redis_sentinel("foo", self.port, None, io_loop=self.io_loop, query_params="", headers={})
+                self.assertEqual(200, response[0])
+        self.assertEqual(1, self.server.connections)
+        self.assertEqual([b'PING'] * 3, self.server.commands)
+
+    @tornado.testing.gen_test
+    def test_reconnects(self):
+        response = yield redis_checkers.check_redis_sentinel("foo", self.port, None, io_loop=self.io_loop, query_params="", headers={})
+        self.assertEqual(200, response[0])
+        self.server.disconnect_all()
+        with cache.maybe_bust(True):
+            response = yield redis_checkers.check_redis_sentinel("foo", self.port, None, io_loop=self.io_loop, query_params="", headers={})
+            self.assertEqual(503, response[0])
+            response = yield redis_checkers.check_redis_sentinel("foo", self.port, None, io_loop=self.io_loop, query_params="", headers={})
+            self.assertEqual(200, response[0])
+        self.assertEqual(2, self.server.connections)
+
+    @tornado.testing.gen_test
+    def test_auth(self):
+        with mock.patch.object(self.server, 'password', b'sekrit'):
+            with mock.patch.dict(config.config, {'redis_password': 'sekrit'}):
+                response = yield redis_checkers.check_redis_sentinel("foo", self.port, None, io_loop=self.io_loop, query_params="", headers={})
+                self.assertEqual(200, response[0], response[1])
+        self.assertEqual([b'AUTH', b'PING'], self.server.commands)
 
-    def tearDown(self):
-        super(TestRedisInfoChecker, self).tearDown()
-        try:
-            self.server.stop()
-            self.socket.close()
-        except Exception:
-            pass
 
+class TestRedisInfoChecker(RedisTestCase):
     @tornado.testing.gen_test
     def test_check_success(self):
-        with mock.patch.object(self.server, 'response', b'$25\r\nredis_version:123\r\nKeyspace'):
-            response = yield checker.check_redis_info("foo", self.port, None, io_loop=self.io_loop, query_params="", headers={})
+        with mock.patch.dict(self.server.replies, {b'INFO': fake_redis.bulk(b'redis_version:123\r\n')}):
+            response = yield redis_checkers.check_redis_info("foo", self.port, None, io_loop=self.io_loop, query_params="", headers={})
             self.assertEqual(200, response[0], response[1])
 
+    @tornado.testing.gen_test
+    def test_match_queries_share_snapshot(self):
+        with mock.patch.dict(self.server.replies, {b'INFO': fake_redis.bulk(fake_redis.REDIS_INFO)}):
+            response = yield redis_checkers.check_redis_info("foo", self.port, "match", io_loop=self.io_loop, query_params="role=slave", headers={})
+            self.assertEqual((200, 'Match found: field role, value slave'), response)
+            response = yield redis_checkers.check_redis_info("foo", self.port, "match", io_loop=self.io_loop, query_params="role=master", headers={})
+            self.assertEqual((500, 'No matching field found'), response)
+            response = yield redis_checkers.check_redis_info("bar", self.port, "", io_loop=self.io_loop, query_params="", headers={})
+            self.assertEqual('slave', json.loads(response[1])['role'])
+        self.assertEqual([b'INFO'], self.server.commands)
+
     @tornado.testing.gen_test
     def test_check_timeout(self):
         with mock.patch.object(checker, 'TIMEOUT', 1):
@@ -297,30 +561,18 @@ class TestRedisInfoChecker(tornado.testing.AsyncTestCase):
             self.assertEqual(response[0], 503)
 
 
-class TestSentinelInfoChecker(tornado.testing.AsyncTestCase):
-    def setUp(self):
-        super(TestSentinelInfoChecker, self).setUp()
-        socket, port = tornado.testing.bind_unused_port()
-        self.server = TestServer(io_loop=self.io_loop)
-        self.server.add_socket(socket)
-        self.socket = socket
-        self.port = port
-        unlistened_socket, unlistened_port = bind_synchronous_unused_port()
-        self.unlistened_socket = unlistened_socket
-        self.unlistened_port = unlistened_port
-
-    def tearDown(self):
-        super(TestSentinelInfoChecker, self).tearDown()
-        try:
-            self.server.stop()
-            self.socket.close()
-        except Exception:
-            pass
-
+class TestSentinelInfoChecker(RedisTestCase):
     @tornado.testing.gen_test
     def test_check_success(self):
-        with mock.patch.object(self.server, 'response', b'$26\r\nredis_version:123\r\nsentinels'):
-            response = yield checker.check_sentinel_info("foo", self.port, None, io_loop=self.io_loop, query_params="", headers={})
+        with mock.patch.dict(self.server.replies, {b'INFO': fake_redis.bulk(b'redis_version:123\r\n# Sentinel\r\n')}):
+            response = yield redis_checkers.check_sentinel_info("foo", self.port, None, io_loop=self.io_loop, query_params="", headers={})
+            self.assertEqual(200, response[0], response[1])
+
+    @tornado.testing.gen_test
+    def test_match_master(self):
+        with mock.patch.dict(self.server.replies, {b'INFO': fake_redis.bulk(fake_redis.SENTINEL_INFO)}):
+            response = yield redis_checkers.check_sentinel_info("foo", self.port, "match", io_loop=self.io_loop,
+                                                                query_params="redis_master=10.12.3.9:6380", headers={})
             self.assertEqual(200, response[0], response[1])
 
     @tornado.testing.gen_test
@@ -328,3 +580,252 @@ class TestSentinelInfoChecker(tornado.testing.AsyncTestCase):
         with mock.patch.object(checker, 'TIMEOUT', 1):
             response = yield checker.check_tcp("foo", self.unlistened_port, None, io_loop=self.io_loop, query_params="", headers={})
             self.assertEqual(response[0], 503)
+
+
+class TestMySQLChecker(tornado.testing.AsyncTestCase):
+    def setUp(self):
+        super(TestMySQLChecker, self).setUp()
+        cache.configure()
+        sock, self.port = tornado.testing.bind_unused_port()
+        self.server = fake_mysql.FakeMySQLServer('hacheck', 'secret', io_loop=self.io_loop)
+        self.server.add_socket(sock)
+        self.config = mock.patch.dict(config.config, {
+            'mysql_username': 'hacheck',
+            'mysql_password': 'secret',
+            'mysql_persistent': True,
+        })
+        self.config.start()
+
+    def tearDown(self):
+        self.config.stop()
+        mysql.close_connections()
+        self.server.stop()
+        super(TestMySQLChecker, self).tearDown()
+
+    def check(self, service_name):
+        return mysql_checkers.check_mysql(service_name, self.port, None, io_loop=self.io_loop, query_params="", headers={})
+
+    @tornado.testing.gen_test
+    def test_persistent(self):
+        for service_name in ('foo', 'bar'):
+            response = yield self.check(service_name)
+            self.assertEqual(200, response[0], response[1])
+        self.assertEqual(1, self.server.logins)
+        self.assertEqual([mysql.COM_PING, mysql.COM_PING], self.server.commands)
+
+    @tornado.testing.gen_test
+    def test_access_denied(self):
+        with mock.patch.dict(config.config, {'mysql_password': 'wrong'}):
+            response = yield self.check('foo')
+        self.assertEqual(500, response[0])
+        self.assertIn('Access denied', response[1])
+
+    @tornado.testing.gen_test
+    def test_connection_refused(self):
+        self.server.stop()
+        response = yield self.check('foo')
+        self.assertEqual(503, response[0])
+
+
+class TestMySQLReplicaChecker(tornado.testing.AsyncTestCase):
+    COLUMNS = [b'Slave_IO_Running', b'Slave_SQL_Running', b'Last_IO_Error', b'Last_SQL_Error', b'Seconds_Behind_Master']
+
+    def setUp(self):
+        super(TestMySQLReplicaChecker, self).setUp()
+        cache.configure()
+        sock, self.port = tornado.testing.bind_unused_port()
+        self.server = fake_mysql.FakeMySQLServer('hacheck', 'secret', io_loop=self.io_loop)
+        self.server.add_socket(sock)
+        self.config = mock.patch.dict(config.config, {'mysql_username': 'hacheck', 'mysql_password': 'secret'})
+        self.config.start()
+
+    def tearDown(self):
+        self.config.stop()
+        mysql.close_connections()
+        self.server.stop()
+        super(TestMySQLReplicaChecker, self).tearDown()
+
+    def slave_status(self, *rows):
+        self.server.queries[b'SHOW SLAVE STATUS'] = fake_mysql.resultset(self.COLUMNS, rows)
+
+    def check(self, query_params=''):
+        return mysql_checkers.check_mysql_replica('foo', self.port, '', io_loop=self.io_loop,
+                                                  query_params=query_params, headers={})
+
+    @tornado.testing.gen_test
+    def test_max_lag(self):
+        self.slave_status((b'Yes', b'Yes', b'', b'', b'12'))
+        self.assertEqual((200, 'Replication lag 12s'), (yield self.check()))
+        self.assertEqual((200, 'Replication lag 12s'), (yield self.check('max_lag=30')))
+        self.assertEqual((500, 'Replication lag 12s exceeds 10s'), (yield self.check('max_lag=10')))
+        self.assertEqual([mysql.COM_QUERY], self.server.commands)
+
+    @tornado.testing.gen_test
+    def test_not_running(self):
+        self.slave_status((b'Yes', b'No', b'', b'Duplicate entry', None))
+        self.assertEqual((500, 'Slave_SQL_Running is No: Duplicate entry'), (yield self.check()))
+
+    @tornado.testing.gen_test
+    def test_not_a_replica(self):
+        self.slave_status()
+        self.assertEqual((500, 'Not a replica'), (yield self.check()))
+
+    @tornado.testing.gen_test
+    def test_bad_max_lag(self):
+        self.assertEqual(400, (yield self.check('max_lag=soon'))[0])
+
+
+class TestPostgresChecker(tornado.testing.AsyncTestCase):
+    def setUp(self):
+        super(TestPostgresChecker, self).setUp()
+        cache.configure()
+        sock, self.port = tornado.testing.bind_unused_port()
+        self.server = fake_postgres.FakePostgresServer('hacheck', io_loop=self.io_loop)
+        self.server.add_socket(sock)
+        self.config = mock.patch.dict(config.config, {'postgres_user': 'hacheck'})
+        self.config.start()
+
+    def tearDown(self):
+        self.config.stop()
+        postgres.close_connections()
+        self.server.stop()
+        super(TestPostgresChecker, self).tearDown()
+
+    def check(self, service_name, query=''):
+        return postgres_checkers.check_postgres(service_name, self.port, query, io_loop=self.io_loop, query_params="", headers={})
+
+    @tornado.testing.gen_test
+    def test_startup_only(self):
+        response = yield self.check('foo')
+        self.assertEqual(200, response[0], response[1])
+        self.assertEqual(1, self.server.logins)
+        self.assertEqual([], self.server.queries)
+
+    @tornado.testing.gen_test
+    def test_persistent(self):
+        with mock.patch.dict(config.config, {'postgres_persistent': True}):
+            for service_name in ('foo', 'bar'):
+                response = yield self.check(service_name)
+                self.assertEqual(200, response[0], response[1])
+        self.assertEqual(1, self.server.logins)
+        self.assertEqual([b'SELECT 1', b'SELECT 1'], self.server.queries)
+
+    @tornado.testing.gen_test
+    def test_role(self):
+        self.assertEqual((200, 'PostgreSQL is a primary'), (yield self.check('foo', 'primary')))
+        self.server.in_recovery = True
+        self.assertEqual((500, 'PostgreSQL is a replica, not a primary'), (yield self.check('bar', 'primary')))
+        self.assertEqual(400, (yield self.check('foo', 'standby'))[0])
+
+    @tornado.testing.gen_test
+    def test_login_refused(self):
+        with mock.patch.dict(config.config, {'postgres_user': 'nobody'}):
+            response = yield self.check('foo')
+        self.assertEqual(500, response[0])
+        self.assertIn('28000', response[1])
+
+    @tornado.testing.gen_test
+    def test_connection_refused(self):
+        self.server.stop()
+        response = yield self.check('foo')
+        self.assertEqual(503, response[0])
+
+
+class TestMemcachedChecker(tornado.testing.AsyncTestCase):
+    def setUp(self):
+        super(TestMemcachedChecker, self).setUp()
+        cache.configure()
+        sock, self.port = tornado.testing.bind_unused_port()
+        self.server = fake_memcached.FakeMemcachedServer({'curr_connections': 10, 'evictions': 0},
+                                                         io_loop=self.io_loop)
+        self.server.add_socket(sock)
+
+    def tearDown(self):
+        memcached.close_connections()
+        self.server.stop()
+        super(TestMemcachedChecker, self).tearDown()
+
+    def check(self, query='', query_params=''):
+        return memcached_checkers.check_memcached('foo', self.port, query, io_loop=self.io_loop,
+                                                  query_params=query_params, headers={})
+
+    @tornado.testing.gen_test
+    def test_version(self):
+        self.assertEqual((200, 'memcached version 1.4.25'), (yield self.check()))
+        self.assertEqual((200, 'memcached version 1.4.25'), (yield self.check()))
+        self.assertEqual([b'version'], self.server.commands)
+
+    @tornado.testing.gen_test
+    def test_thresholds(self):
+        self.assertEqual(200, (yield self.check(query_params='max_curr_connections=100'))[0])
+        self.assertEqual((500, 'curr_connections is 10, max is 5'),
+                         (yield self.check(query_params='max_curr_connections=5')))
+        self.assertEqual(500, (yield self.check(query_params='min_nonexistent=1'))[0])
+        self.assertEqual(400, (yield self.check(query_params='max_evictions=lots'))[0])
+        self.assertEqual([b'stats'], self.server.commands)
+
+    @tornado.testing.gen_test
+    def test_rate(self):
+        with mock.patch.object(memcached, 'time') as fake_time:
+            fake_time.time.return_value = 100.0
+            self.assertEqual(200, (yield self.check(query_params='max_evictions_rate=1'))[0])
+            cache.configure()
+            self.server.stats['evictions'] = 50
+            fake_time.time.return_value = 110.0
+            self.assertEqual((500, 'evictions_rate is 5, max is 1'),
+                             (yield self.check(query_params='max_evictions_rate=1')))
+
+    @tornado.testing.gen_test
+    def test_connection_refused(self):
+        self.server.stop()
+        self.assertEqual(503, (yield self.check())[0])
+
+
+class TestExecChecker(tornado.testing.AsyncTestCase):
+    def setUp(self):
+        super(TestExecChecker, self).setUp()
+        cache.configure()
+        self.config = mock.patch.dict(config.config, {'exec_commands': config.exec_commands({
+            'ok': [sys.executable, '-c', 'import os; print("checked " + os.environ["HACHECK_SERVICE"])'],
+            'warning': {'command': [sys.executable, '-c', 'import sys; sys.exit(1)'], 'exit_codes': {1: 200}},
+            'critical': {'command': [sys.executable, '-c', 'import sys; sys.exit(2)']},
+            'slow': {'command': [sys.executable, '-c', 'import time; time.sleep(30)'], 'timeout': 0.2},
+            'missing': '/nonexistent/check --flag',
+        })})
+        self.config.start()
+
+    def tearDown(self):
+        self.config.stop()
+        scripts.close_pool()
+        super(TestExecChecker, self).tearDown()
+
+    def check(self, name):
+        return scripts_checkers.check_exec('foo', 1, name, io_loop=self.io_loop, query_params='', headers={})
+
+    @tornado.testing.gen_test
+    def test_exit_codes(self):
+        self.assertEqual((200, 'checked foo'), (yield self.check('ok')))
+        self.assertEqual((200, 'Command warning exited with 1'), (yield self.check('warning')))
+        self.assertEqual((503, 'Command critical exited with 2'), (yield self.check('critical')))
+
+    @tornado.testing.gen_test
+    def test_runs_once_per_cache_window(self):
+        scripts.reset_stats()
+        # both share the cached future, which can't be yielded twice in one list
+        first, second = self.check('ok'), self.check('ok')
+        self.assertEqual((200, 'checked foo'), (yield first))
+        self.assertEqual((200, 'checked foo'), (yield second))
+        yield self.check('ok')
+        self.assertEqual(1, scripts.get_stats()['runs'])
+
+    @tornado.testing.gen_test
+    def test_timeout(self):
+        self.assertEqual((503, 'Command slow timed out after 0.20s'), (yield self.check('slow')))
+
+    @tornado.testing.gen_test
+    def test_not_whitelisted(self):
+        self.assertEqual(404, (yield self.check('rm'))[0])
+
+    @tornado.testing.gen_test
+    def test_cannot_run(self):
+        self.assertEqual(500, (yield self.check('missing'))[0])
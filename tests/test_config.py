@@ -0,0 +1,30 @@
+import tempfile
+
+import mock
+
+from unittest import TestCase
+
+from hacheck import config
+
+
+class ConfigTestCase(TestCase):
+    def load(self, text):
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.yaml') as f:
+            f.write(text)
+            f.flush()
+            with mock.patch.dict(config.config):
+                return dict(config.load_from(f.name))
+
+    def test_load(self):
+        loaded = self.load('batch_concurrency: 5\nunknown: 1\n')
+        self.assertEqual(5, loaded['batch_concurrency'])
+        self.assertNotIn('unknown', loaded)
+
+    def test_positive_int(self):
+        self.assertEqual(1, config.positive_int('1'))
+        self.assertRaises(ValueError, config.positive_int, 0)
+
+    def test_bad_value(self):
+        with self.assertRaises(ValueError) as cm:
+            self.load('batch_concurrency: 0\n')
+        self.assertIn('batch_concurrency', str(cm.exception))
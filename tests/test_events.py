@@ -0,0 +1,43 @@
+from unittest import TestCase
+
+from hacheck import events
+
+
+class TestEvents(TestCase):
+    def setUp(self):
+        events.configure(replay=3, buffer_size=2)
+
+    def tearDown(self):
+        events.configure()
+
+    def test_publish(self):
+        subscriber = events.subscribe()
+        self.assertFalse(subscriber.wait().done())
+        waiter = subscriber.wait()
+        event = events.publish('foo', 200, 503, '127.0.0.1', 1000.0)
+        self.assertTrue(waiter.done())
+        self.assertEqual(('foo', 200, 503, '127.0.0.1', 1000.0), event[1:])
+        self.assertEqual(([event], 0), subscriber.take())
+        self.assertEqual(([], 0), subscriber.take())
+        subscriber.close()
+        self.assertEqual(0, events.get_stats()['subscribers'])
+
+    def test_slow_subscriber(self):
+        subscriber = events.subscribe()
+        published = [events.publish('foo', i, i + 1, '127.0.0.1', 1000.0 + i) for i in range(5)]
+        self.assertEqual((published[3:], 3), subscriber.take())
+        self.assertEqual(3, events.get_stats()['dropped'])
+        subscriber.close()
+
+    def test_replay(self):
+        published = [events.publish('foo', i, i + 1, '127.0.0.1', 1000.0 + i) for i in range(4)]
+        for kwargs, expected in (
+            ({}, ([], 0)),
+            ({'replay': 1}, (published[-1:], 0)),
+            # only three are kept, and each subscriber's buffer only holds two
+            ({'replay': 10}, (published[2:], 1)),
+            ({'last_event_id': published[2].id}, (published[3:], 0)),
+        ):
+            subscriber = events.subscribe(**kwargs)
+            self.assertEqual(expected, subscriber.take())
+            subscriber.close()
@@ -0,0 +1,49 @@
+from unittest import TestCase
+
+from hacheck import accounting
+from hacheck import flapping
+
+
+def results(*codes):
+    return [accounting.Result(1000 + i, code, 0.01) for i, code in enumerate(codes)]
+
+
+class TestFlapping(TestCase):
+    def setUp(self):
+        flapping.configure(threshold=3, stable_probes=2, cache_factor=4)
+
+    def tearDown(self):
+        flapping.configure()
+
+    def test_flips(self):
+        self.assertEqual(0, flapping.flips([]))
+        self.assertEqual(0, flapping.flips(results(200, 200, 404)[:2]))
+        # 404 and 503 are both down
+        self.assertEqual(1, flapping.flips(results(200, 404, 503)))
+        self.assertEqual(3, flapping.flips(results(200, 503, 200, 503)))
+
+    def test_stable_for(self):
+        self.assertEqual(0, flapping.stable_for(results(200, 503)))
+        self.assertEqual(2, flapping.stable_for(results(503, 200, 200)))
+
+    def test_damp(self):
+        self.assertEqual((200, 'ok'), flapping.damp(results(200, 503, 200), 200, 'ok'))
+        code, message = flapping.damp(results(200, 503, 200, 503, 200), 200, 'ok')
+        self.assertEqual(503, code)
+        self.assertIn('up for 1 of 2', message)
+        # down results are never held
+        self.assertEqual((503, 'no'), flapping.damp(results(200, 503, 200, 503), 503, 'no'))
+        self.assertEqual((200, 'ok'), flapping.damp(results(200, 503, 200, 503, 200, 200), 200, 'ok'))
+        self.assertEqual(1, flapping.get_stats()['held_down'])
+
+    def test_cache_factor(self):
+        self.assertEqual(1, flapping.cache_factor(None))
+        self.assertEqual(1, flapping.cache_factor(results(200, 503, 200)))
+        self.assertEqual(4, flapping.cache_factor(results(200, 503, 200, 503)))
+        self.assertEqual(1, flapping.get_stats()['flapping_checks'])
+
+    def test_off(self):
+        flapping.configure()
+        flaps = results(200, 503, 200, 503, 200)
+        self.assertFalse(flapping.is_flapping(flaps))
+        self.assertEqual((200, 'ok'), flapping.damp(flaps, 200, 'ok'))
@@ -0,0 +1,115 @@
+import os
+import shutil
+import tempfile
+
+import mock
+import tornado.testing
+
+try:
+    from unittest2 import TestCase
+except ImportError:
+    from unittest import TestCase
+
+from hacheck import cache
+from hacheck import config
+from hacheck import haproxy
+from hacheck.checkers import haproxy as haproxy_checkers
+
+from . import fake_haproxy
+
+STATS = '''# pxname,svname,qcur,qmax,scur,smax,slim,stot,bin,bout,dreq,dresp,ereq,econ,eresp,wretr,wredis,status,weight
+web,FRONTEND,,,1,1,2000,48,4542,293789,0,0,0,,,,,OPEN,
+web,web01,0,0,0,0,,0,0,0,,0,,0,0,0,0,UP 1/3,100
+web,web02,0,0,0,0,,0,0,0,,0,,0,0,0,0,DOWN,100
+web,BACKEND,0,0,0,0,200,0,4542,293789,0,0,,0,0,0,0,UP,0
+'''
+
+
+class TestHaproxyStats(TestCase):
+    def setUp(self):
+        haproxy.reset_stats()
+
+    def test_parse(self):
+        table = haproxy.parse_stats(STATS)
+        self.assertEqual({
+            ('web', 'FRONTEND'): 'OPEN',
+            ('web', 'web01'): 'UP 1/3',
+            ('web', 'web02'): 'DOWN',
+            ('web', 'BACKEND'): 'UP',
+        }, table)
+        self.assertEqual(1, haproxy.get_stats()['parses'])
+        self.assertEqual(4, haproxy.get_stats()['rows'])
+
+    def test_parse_headerless(self):
+        table = haproxy.parse_stats(STATS.split('\n', 1)[1])
+        self.assertEqual('UP', table[('web', 'BACKEND')])
+
+    def test_is_up(self):
+        self.assertTrue(haproxy.is_up('UP'))
+        self.assertTrue(haproxy.is_up('UP 1/3'))
+        self.assertTrue(haproxy.is_up('no check'))
+        self.assertFalse(haproxy.is_up('DOWN 1/2'))
+        self.assertFalse(haproxy.is_up('MAINT'))
+
+
+class TestHaproxyStatsSocket(tornado.testing.AsyncTestCase):
+    def setUp(self):
+        super(TestHaproxyStatsSocket, self).setUp()
+        cache.configure()
+        self.root = tempfile.mkdtemp()
+        self.server = fake_haproxy.FakeStatsSocketServer(
+            os.path.join(self.root, 'haproxy-8080.sock'),
+            statuses={('web', 'BACKEND'): 'UP', ('web', 'web01'): 'DOWN'},
+            io_loop=self.io_loop,
+        )
+        self.server.start_listening()
+        self.config_patch = mock.patch.dict(
+            config.config,
+            {'haproxy_stats_socket': os.path.join(self.root, 'haproxy-{port}.sock')}
+        )
+        self.config_patch.start()
+
+    def tearDown(self):
+        self.config_patch.stop()
+        haproxy.close_stats_sockets()
+        self.server.stop()
+        shutil.rmtree(self.root)
+        super(TestHaproxyStatsSocket, self).tearDown()
+
+    def check(self, service_name, port=8080, check_path=''):
+        return haproxy_checkers.check_haproxy_socket(service_name, port, check_path, io_loop=self.io_loop,
+                                                     query_params='', headers={})
+
+    @tornado.testing.gen_test
+    def test_statuses(self):
+        self.assertEqual((200, 'web is UP'), (yield self.check('web')))
+        self.assertEqual((500, 'web/web01 is DOWN'), (yield self.check('web', check_path='web01')))
+        self.assertEqual((500, 'other is not found'), (yield self.check('other')))
+
+    @tornado.testing.gen_test
+    def test_persistent_connection(self):
+        for _ in range(3):
+            with cache.maybe_bust(True):
+                self.assertEqual(200, (yield self.check('web'))[0])
+        self.assertEqual(1, self.server.connections)
+        # prompt, then one show stat per check
+        self.assertEqual(4, self.server.commands)
+
+    @tornado.testing.gen_test
+    def test_reconnects(self):
+        self.assertEqual(200, (yield self.check('web'))[0])
+        haproxy.stats_socket(self.server.path, io_loop=self.io_loop).close()
+        with cache.maybe_bust(True):
+            self.assertEqual(200, (yield self.check('web'))[0])
+        self.assertEqual(2, self.server.connections)
+
+    @tornado.testing.gen_test
+    def test_missing_socket(self):
+        response = yield self.check('web', port=8081)
+        self.assertEqual(503, response[0])
+
+    @tornado.testing.gen_test
+    def test_not_configured(self):
+        with mock.patch.dict(config.config, {'haproxy_stats_socket': None}):
+            response = yield self.check('web')
+        self.assertEqual(500, response[0])
@@ -0,0 +1,146 @@
+import socket
+
+import tornado.gen
+import tornado.iostream
+import tornado.tcpserver
+import tornado.testing
+
+from hacheck import keepalive
+
+
+class FakeHTTPServer(tornado.tcpserver.TCPServer):
+    """Answers each request on a connection with the next of `responses', and
+    hangs up (or, given `hang', stops answering) once they have run out"""
+
+    def __init__(self, responses, hang=False, io_loop=None):
+        super(FakeHTTPServer, self).__init__(io_loop=io_loop)
+        self.responses = responses
+        self.hang = hang
+        self.connections = 0
+        self.requests = []
+        self.streams = []
+
+    @tornado.gen.coroutine
+    def handle_stream(self, stream, address):
+        self.connections += 1
+        self.streams.append(stream)
+        try:
+            for response in self.responses:
+                request = yield stream.read_until(b'\r\n\r\n')
+                self.requests.append(request)
+                yield stream.write(response)
+            request = yield stream.read_until(b'\r\n\r\n')
+            if self.hang:
+                self.requests.append(request)
+                yield stream.read_until_close()
+        except tornado.iostream.StreamClosedError:
+            pass
+        finally:
+            stream.close()
+
+    def disconnect_all(self):
+        for stream in self.streams:
+            stream.close()
+        self.streams = []
+
+
+OK = b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nOK'
+
+
+class TestHTTPConnection(tornado.testing.AsyncTestCase):
+    def setUp(self):
+        super(TestHTTPConnection, self).setUp()
+        keepalive.reset_stats()
+        self.connections = []
+
+    def serve(self, *responses, **kwargs):
+        self.server = FakeHTTPServer(responses, io_loop=self.io_loop, **kwargs)
+        sock, self.port = tornado.testing.bind_unused_port()
+        self.server.add_socket(sock)
+
+    def tearDown(self):
+        for conn in self.connections:
+            conn.close()
+        self.server.disconnect_all()
+        self.server.stop()
+        # let the server's handlers see their connections close
+        self.io_loop.run_sync(lambda: tornado.gen.moment)
+        super(TestHTTPConnection, self).tearDown()
+
+    def connection(self):
+        conn = keepalive.HTTPConnection(('127.0.0.1', self.port), host='example', timeout=1, io_loop=self.io_loop)
+        self.connections.append(conn)
+        return conn
+
+    @tornado.testing.gen_test
+    def test_request(self):
+        self.serve(OK)
+        response = yield self.connection().fetch('/health?x=1', {'User-Agent': 'test'})
+        self.assertEqual((200, 'OK', b'OK'), (response.code, response.reason, response.body))
+        request = self.server.requests[0]
+        self.assertTrue(request.startswith(b'GET /health?x=1 HTTP/1.1\r\n'))
+        self.assertIn(b'\r\nHost: example\r\n', request)
+        self.assertIn(b'\r\nUser-Agent: test\r\n', request)
+
+    @tornado.testing.gen_test
+    def test_stale_connection_is_retried(self):
+        # the server answers one request per connection, then hangs up on the next
+        self.serve(OK)
+        conn = self.connection()
+        yield conn.fetch('/')
+        response = yield conn.fetch('/')
+        self.assertEqual(b'OK', response.body)
+        self.assertEqual(2, self.server.connections)
+        self.assertEqual(1, keepalive.get_stats()['reused'])
+
+    @tornado.testing.gen_test
+    def test_timeout_is_not_retried(self):
+        # the server answers one request, then never answers the next
+        self.serve(OK, hang=True)
+        conn = self.connection()
+        conn.timeout = 0.5
+        yield conn.fetch('/')
+        with self.assertRaises(keepalive.connection.Timeout):
+            yield conn.fetch('/')
+        self.assertEqual((1, 2), (self.server.connections, len(self.server.requests)))
+
+    @tornado.testing.gen_test
+    def test_body_until_close(self):
+        self.serve(b'HTTP/1.0 503 Down\r\n\r\nnot ready')
+        conn = self.connection()
+        response = yield conn.fetch('/')
+        self.assertEqual((503, b'not ready'), (response.code, response.body))
+        self.assertTrue(conn.closed())
+
+    @tornado.testing.gen_test
+    def test_too_large(self):
+        self.serve(b'HTTP/1.1 200 OK\r\nContent-Length: 999999999\r\n\r\n')
+        conn = self.connection()
+        with self.assertRaises(keepalive.ProtocolError):
+            yield conn.fetch('/')
+        self.assertTrue(conn.closed())
+
+    @tornado.testing.gen_test
+    def test_connection_refused(self):
+        self.serve()
+        self.server.stop()
+        with self.assertRaises((socket.error, tornado.iostream.StreamClosedError)):
+            yield self.connection().fetch('/')
+
+
+class TestHTTPPool(tornado.testing.AsyncTestCase):
+    @tornado.testing.gen_test
+    def test_pool_size(self):
+        server = FakeHTTPServer([OK] * 3, io_loop=self.io_loop)
+        sock, port = tornado.testing.bind_unused_port()
+        server.add_socket(sock)
+        pool = keepalive.HTTPPool(('127.0.0.1', port), size=2, io_loop=self.io_loop)
+        try:
+            responses = yield [pool.fetch('/') for _ in range(5)]
+            self.assertEqual([b'OK'] * 5, [response.body for response in responses])
+            self.assertEqual(2, len(pool.connections))
+            self.assertEqual(2, server.connections)
+        finally:
+            pool.close()
+            server.disconnect_all()
+            server.stop()
@@ -0,0 +1,55 @@
+import time
+
+import tornado.gen
+import tornado.testing
+
+from hacheck import looplag
+from hacheck import metrics
+
+
+def block(seconds):
+    # spin rather than sleep, so that the SIGALRM doesn't cut it short
+    end = time.time() + seconds
+    while time.time() < end:
+        pass
+
+
+class TestLagMonitor(tornado.testing.AsyncTestCase):
+    def setUp(self):
+        super(TestLagMonitor, self).setUp()
+        looplag.reset_stats()
+        metrics.reset_stats()
+
+    def tearDown(self):
+        looplag.stop()
+        super(TestLagMonitor, self).tearDown()
+
+    @tornado.testing.gen_test
+    def test_lag(self):
+        looplag.start(interval=0.01, io_loop=self.io_loop)
+        yield tornado.gen.Task(self.io_loop.add_timeout, self.io_loop.time() + 0.005)
+        block(0.05)
+        yield tornado.gen.Task(self.io_loop.add_timeout, self.io_loop.time() + 0.05)
+        stats = looplag.get_stats()
+        self.assertGreater(stats['samples'], 1)
+        self.assertGreaterEqual(stats['lag_max_ms'], 40)
+        self.assertLess(stats['lag_p50_ms'], 40)
+        self.assertEqual(stats['samples'], sum(metrics.loop_lag.counts))
+        self.assertIn('hacheck_ioloop_lag_seconds_count %d' % stats['samples'],
+                      metrics.render(0).splitlines())
+
+    @tornado.testing.gen_test
+    def test_blocked_stacks(self):
+        looplag.start(interval=1, blocking_threshold=0.02, io_loop=self.io_loop)
+        yield tornado.gen.Task(self.io_loop.add_callback)
+        block(0.1)
+        yield tornado.gen.Task(self.io_loop.add_callback)
+        stats = looplag.get_stats()
+        self.assertEqual(1, stats['blocked'])
+        self.assertIn('in block', stats['blocked_stacks'][0]['stack'])
+        self.assertIn('hacheck_ioloop_blocked_total 1', metrics.render(0).splitlines())
+
+    def test_no_samples(self):
+        stats = looplag.get_stats()
+        self.assertEqual(None, stats['lag_p99_ms'])
+        self.assertEqual([], stats['blocked_stacks'])
@@ -0,0 +1,66 @@
+try:
+    from unittest2 import TestCase
+except ImportError:
+    from unittest import TestCase
+
+import tornado.testing
+
+from hacheck import memcached
+
+from . import fake_memcached
+
+
+class TestStats(TestCase):
+    def test_parse_stats(self):
+        self.assertEqual(
+            {'pid': '1234', 'version': '1.4.25', 'rusage_user': '0.560000'},
+            memcached.parse_stats(b'STAT pid 1234\r\nSTAT version 1.4.25\r\nSTAT rusage_user 0.560000\r\nEND\r\n')
+        )
+        with self.assertRaises(memcached.MemcachedError):
+            memcached.parse_stats(b'SERVER_ERROR out of memory\r\n')
+
+    def test_get(self):
+        stats = memcached.Stats({'evictions': '50', 'version': '1.4.25'}, 20.0, ({'evictions': '30'}, 10.0))
+        self.assertEqual(50, stats.get('evictions'))
+        self.assertEqual(2, stats.get('evictions_rate'))
+        self.assertEqual(None, stats.get('version'))
+        with self.assertRaises(KeyError):
+            stats.get('curr_connections')
+
+    def test_rate_unknown(self):
+        self.assertEqual(None, memcached.Stats({'evictions': '50'}, 20.0).rate('evictions'))
+        # restarted
+        self.assertEqual(None, memcached.Stats({'evictions': '5'}, 20.0, ({'evictions': '30'}, 10.0)).rate('evictions'))
+
+
+class TestMemcachedConnection(tornado.testing.AsyncTestCase):
+    def setUp(self):
+        super(TestMemcachedConnection, self).setUp()
+        sock, self.port = tornado.testing.bind_unused_port()
+        self.server = fake_memcached.FakeMemcachedServer({'evictions': 10}, io_loop=self.io_loop)
+        self.server.add_socket(sock)
+
+    def tearDown(self):
+        memcached.close_connections()
+        self.server.stop()
+        super(TestMemcachedConnection, self).tearDown()
+
+    @tornado.testing.gen_test
+    def test_commands(self):
+        conn = memcached.persistent_connection(self.port, io_loop=self.io_loop)
+        version, first, second = yield [conn.version(), conn.fetch_stats(), conn.fetch_stats()]
+        self.assertEqual('1.4.25', version)
+        self.assertEqual({'evictions': '10'}, second.values)
+        self.assertEqual((first.values, first.time), second.previous)
+        self.assertEqual(1, self.server.connections)
+        self.assertEqual([b'version', b'stats', b'stats'], self.server.commands)
+
+    @tornado.testing.gen_test
+    def test_reconnect(self):
+        conn = memcached.persistent_connection(self.port, io_loop=self.io_loop)
+        yield conn.version()
+        self.server.disconnect_all()
+        with self.assertRaises(Exception):
+            yield conn.version()
+        yield conn.version()
+        self.assertEqual(2, self.server.connections)
@@ -0,0 +1,70 @@
+from unittest import TestCase
+
+import mock
+import tornado.concurrent
+
+from hacheck import accounting
+from hacheck import cache
+from hacheck import metrics
+
+
+class TestHistogram(TestCase):
+    def test_buckets(self):
+        histogram = metrics.Histogram()
+        for value in (0.0001, 0.0005, 0.003, 0.003, 60):
+            histogram.observe(value)
+        # bounds are inclusive, as Prometheus' `le' is
+        self.assertEqual(2, histogram.counts[0])
+        self.assertEqual(2, histogram.counts[metrics.BUCKETS.index(0.005)])
+        self.assertEqual(1, histogram.counts[-1])
+        self.assertEqual(5, sum(histogram.counts))
+        self.assertAlmostEqual(60.0066, histogram.sum)
+
+
+class TestMetrics(TestCase):
+    def setUp(self):
+        cache.configure()
+        metrics.reset_stats()
+
+    def test_record_probe(self):
+        future = tornado.concurrent.Future()
+        with mock.patch.object(metrics, 'time') as t:
+            t.time.return_value = 100.0
+            metrics.record_probe('check_tcp', 'foo', future)
+            self.assertEqual(1, metrics.in_progress['check_tcp'])
+            t.time.return_value = 100.002
+            future.set_result((200, 'OK'))
+        self.assertEqual(0, metrics.in_progress['check_tcp'])
+        histogram = metrics.probe_durations['check_tcp', 'foo']
+        self.assertEqual(1, histogram.counts[metrics.BUCKETS.index(0.0025)])
+
+    def test_bounded_by_accounting(self):
+        accounting.configure(max_services=10)
+        self.addCleanup(accounting.configure)
+        for i in range(100):
+            name = 'service%d' % i
+            accounting.record_request(name, '10.0.0.1', now=1000 + i)
+            metrics.record_request(name, 200, 0.002)
+            metrics.record_probe('check_tcp', name, tornado.concurrent.Future())
+        services = set(accounting.scan())
+        self.assertLessEqual(len(services), 10)
+        self.assertEqual(set(record.name for record in services), set(metrics.request_durations))
+        self.assertEqual(set(record.name for record in services), set(name for name, _ in metrics.responses))
+        self.assertIn('service99', metrics.request_durations)
+
+    def test_render(self):
+        metrics.record_request('foo', 200, 0.002)
+        metrics.record_request('foo', 503, 20)
+        metrics.record_request('b"ar', 200, 0.002)
+        cache.stats['hits'] += 3
+        lines = metrics.render(1000).splitlines()
+        self.assertIn('# TYPE hacheck_request_duration_seconds histogram', lines)
+        self.assertIn('hacheck_request_duration_seconds_bucket{service="foo",le="0.001"} 0', lines)
+        self.assertIn('hacheck_request_duration_seconds_bucket{service="foo",le="0.0025"} 1', lines)
+        self.assertIn('hacheck_request_duration_seconds_bucket{service="foo",le="10.0"} 1', lines)
+        self.assertIn('hacheck_request_duration_seconds_bucket{service="foo",le="+Inf"} 2', lines)
+        self.assertIn('hacheck_request_duration_seconds_count{service="foo"} 2', lines)
+        self.assertIn('hacheck_request_duration_seconds_count{service="b\\"ar"} 1', lines)
+        self.assertIn('hacheck_responses_total{service="foo",code="503"} 1', lines)
+        self.assertIn('hacheck_cache_hits_total 3', lines)
+        self.assertIn('process_start_time_seconds 1000.0', lines)
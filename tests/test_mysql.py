@@ -3,10 +3,12 @@ try:
 except ImportError:
     from unittest import TestCase
 
-#import tornado.testing
+import tornado.testing
 
 from hacheck import mysql
 
+from . import fake_mysql
+
 
 class TestMySQLHelpers(TestCase):
     def test_sxor(self):
@@ -21,12 +23,100 @@ class TestMySQLHelpers(TestCase):
         self.assertEqual((255, 3), mysql._read_lenc(b'\xfc\xff\x00'))
         self.assertEqual((16777215, 4), mysql._read_lenc(b'\xfd\xff\xff\xff'))
         self.assertEqual((4294967295, 9), mysql._read_lenc(b'\xfe\xff\xff\xff\xff\x00\x00\x00\x00'))
+        self.assertEqual((None, 1), mysql._read_lenc(b'\xfb'))
+        self.assertEqual((2, 3), mysql._read_lenc(b'\x00\x00\x02', 2))
+
+    def test_parse_row(self):
+        payload = fake_mysql.lenc_string(b'Yes') + fake_mysql.lenc_string(None) + fake_mysql.lenc_string(b'x' * 300)
+        self.assertEqual((b'Yes', None, b'x' * 300), mysql._parse_row(payload, 3))
+
+    def test_column_name(self):
+        self.assertEqual('Seconds_Behind_Master',
+                         mysql._column_name(fake_mysql.column_definition(b'Seconds_Behind_Master')))
 
     def test_password_hash(self):
         self.assertEqual(
             b'\x19W\xdc\xe2rB\x82\xe0\x18\xf4\r\x90X$\xcbca\xf8\x8dA',
             mysql._stupid_hash_password('12345678901234567890', 'password')
         )
+        self.assertEqual(
+            mysql._stupid_hash_password('12345678901234567890', 'password'),
+            mysql._stupid_hash_password(b'12345678901234567890', u'password')
+        )
+
+    def test_parse_greeting(self):
+        response = mysql.MySQLResponse(fake_mysql.greeting(7))
+        self.assertEqual('CONN 10', response.response_type)
+        self.assertEqual(b'5.6.30-log', response.server_version)
+        self.assertEqual(7, response.connection_id)
+        self.assertEqual(mysql.CAPABILITIES, response.capability_flags)
+        self.assertEqual(fake_mysql.SALT, response.plugin_data)
+        self.assertEqual(b'mysql_native_password', response.auth_method)
+
+    def test_parse_error(self):
+        response = mysql.MySQLResponse(fake_mysql.error(1045, b'Access denied'))
+        self.assertFalse(response.OK)
+        self.assertEqual(1045, response.error_code)
+        self.assertEqual(b'Access denied', response.message)
+
+
+class TestMySQLConnection(tornado.testing.AsyncTestCase):
+    def setUp(self):
+        super(TestMySQLConnection, self).setUp()
+        mysql.reset_stats()
+        sock, self.port = tornado.testing.bind_unused_port()
+        self.server = fake_mysql.FakeMySQLServer('hacheck', 'secret', io_loop=self.io_loop, queries={
+            b'SELECT 1, NULL': fake_mysql.resultset([b'1', b'NULL'], [(b'1', None)]),
+            b'SET @a = 1': [fake_mysql.OK],
+        })
+        self.server.add_socket(sock)
+
+    def tearDown(self):
+        mysql.close_connections()
+        self.server.stop()
+        super(TestMySQLConnection, self).tearDown()
+
+    @tornado.testing.gen_test
+    def test_ping_reuses_login(self):
+        conn = mysql.persistent_connection(self.port, 'hacheck', 'secret', io_loop=self.io_loop)
+        # concurrent pings share one future, which can't be yielded twice in one list
+        first, second = conn.ping(), conn.ping()
+        self.assertTrue((yield first).OK)
+        self.assertTrue((yield second).OK)
+        yield conn.ping()
+        self.assertEqual(1, self.server.logins)
+        self.assertEqual([mysql.COM_PING, mysql.COM_PING], self.server.commands)
+        self.assertEqual(1, mysql.get_stats()['connects'])
+        self.assertEqual(2, mysql.get_stats()['pings'])
+        self.assertIsNotNone(conn.ping_time)
+
+    @tornado.testing.gen_test
+    def test_reconnect(self):
+        conn = mysql.persistent_connection(self.port, 'hacheck', 'secret', io_loop=self.io_loop)
+        yield conn.ping()
+        self.server.disconnect_all()
+        with self.assertRaises(Exception):
+            yield conn.ping()
+        yield conn.ping()
+        self.assertEqual(2, self.server.logins)
 
+    @tornado.testing.gen_test
+    def test_bad_password(self):
+        conn = mysql.persistent_connection(self.port, 'hacheck', 'wrong', io_loop=self.io_loop)
+        with self.assertRaises(mysql.MySQLError) as cm:
+            yield conn.ping()
+        self.assertEqual(1045, cm.exception.response.error_code)
+        self.assertTrue(conn.closed())
 
-# TODO: Write unit tests of the actual protocol
+    @tornado.testing.gen_test
+    def test_query(self):
+        conn = mysql.persistent_connection(self.port, 'hacheck', 'secret', io_loop=self.io_loop)
+        result, empty, ping = yield [conn.query('SELECT 1, NULL'), conn.query('SET @a = 1'), conn.ping()]
+        self.assertEqual(['1', 'NULL'], result.columns)
+        self.assertEqual([{'1': b'1', 'NULL': None}], result.dicts())
+        self.assertEqual([], empty.rows)
+        self.assertTrue(ping.OK)
+        with self.assertRaises(mysql.MySQLError):
+            yield conn.query('SELEKT')
+        self.assertEqual(1, self.server.logins)
+        self.assertEqual(2, mysql.get_stats()['queries'])
@@ -0,0 +1,110 @@
+try:
+    from unittest2 import TestCase
+except ImportError:
+    from unittest import TestCase
+
+import tornado.testing
+
+from hacheck import compat
+from hacheck import postgres
+
+from . import fake_postgres
+
+
+class TestPostgresHelpers(TestCase):
+    def test_startup_message(self):
+        self.assertEqual(
+            b'\x00\x00\x00\x38\x00\x03\x00\x00user\x00foo\x00database\x00bar\x00application_name\x00hacheck\x00\x00',
+            postgres._startup_message('foo', 'bar')
+        )
+
+    def test_md5_password(self):
+        # 'md5' + md5(md5(password + user) + salt)
+        self.assertEqual(b'md59cd65cda7bfce93ed5190dc74c6f233f',
+                         postgres._md5_password('foo', 'secret', fake_postgres.SALT))
+
+    def test_scram(self):
+        # the example exchange of RFC 7677
+        scram = postgres.ScramSHA256('pencil', user=b'user', nonce=b'rOprNGfwEbeRWgbNEkqO')
+        self.assertEqual(b'n,,n=user,r=rOprNGfwEbeRWgbNEkqO', scram.client_first())
+        nonce = b'rOprNGfwEbeRWgbNEkqO%hvYDpWUa2RaTCAfuxFIlj)hNlF$k0'
+        self.assertEqual(
+            b'c=biws,r=' + nonce + b',p=dHzbZapWIk4jUhN+Ute9ytag9zjfMHgsqmmiz7AndVQ=',
+            scram.client_final(b'r=' + nonce + b',s=W22ZaJ0SNY7soEsUEjb6gQ==,i=4096')
+        )
+        scram.verify(b'v=6rriTRBi23WpRR/wtup+mMhUZUn/dB5nLTJRsjl95G4=')
+        with self.assertRaises(postgres.PostgresError):
+            scram.verify(b'v=' + b'A' * 44)
+
+    def test_pbkdf2(self):
+        self.assertEqual(compat.pbkdf2_hmac('sha256', b'pencil', b'salt', 3),
+                         compat.pbkdf2_hmac2('sha256', b'pencil', b'salt', 3))
+
+    def test_parse_error(self):
+        message = fake_postgres.error(b'FATAL', b'57P03', b'the database system is starting up')
+        fields = postgres._parse_error(message[5:])
+        self.assertEqual({'S': 'FATAL', 'C': '57P03', 'M': 'the database system is starting up'}, fields)
+        self.assertEqual('FATAL 57P03: the database system is starting up', str(postgres.PostgresError(fields)))
+
+    def test_parse_data_row(self):
+        self.assertEqual((b't', None, b''), postgres._parse_data_row(fake_postgres.data_row(b't', None, b'')[5:]))
+
+
+class TestPostgresConnection(tornado.testing.AsyncTestCase):
+    def setUp(self):
+        super(TestPostgresConnection, self).setUp()
+        postgres.reset_stats()
+        sock, self.port = tornado.testing.bind_unused_port()
+        self.server = fake_postgres.FakePostgresServer('hacheck', 'secret', io_loop=self.io_loop)
+        self.server.add_socket(sock)
+
+    def tearDown(self):
+        postgres.close_connections()
+        self.server.stop()
+        super(TestPostgresConnection, self).tearDown()
+
+    @tornado.testing.gen_test
+    def test_query(self):
+        conn = postgres.persistent_connection(self.port, 'hacheck', 'secret', io_loop=self.io_loop)
+        one, recovery = yield [conn.query('SELECT 1'), conn.query('SELECT pg_is_in_recovery()')]
+        self.assertEqual([(b'1',)], one)
+        self.assertEqual([(b'f',)], recovery)
+        with self.assertRaises(postgres.PostgresError):
+            yield conn.query('SELEKT 1')
+        self.assertEqual(1, self.server.logins)
+        self.assertEqual(1, postgres.get_stats()['connects'])
+        self.assertEqual(2, postgres.get_stats()['queries'])
+
+    @tornado.testing.gen_test
+    def test_reconnect(self):
+        conn = postgres.persistent_connection(self.port, 'hacheck', 'secret', io_loop=self.io_loop)
+        yield conn.query('SELECT 1')
+        self.server.disconnect_all()
+        with self.assertRaises(Exception):
+            yield conn.query('SELECT 1')
+        yield conn.query('SELECT 1')
+        self.assertEqual(2, self.server.logins)
+
+    @tornado.testing.gen_test
+    def test_bad_password(self):
+        conn = postgres.PostgresConnection(self.port, 'hacheck', 'wrong', io_loop=self.io_loop)
+        with self.assertRaises(postgres.PostgresError) as cm:
+            yield conn.startup()
+        self.assertEqual('28P01', cm.exception.fields['C'])
+
+    @tornado.testing.gen_test
+    def test_scram_login(self):
+        self.server.auth = 'scram'
+        conn = postgres.PostgresConnection(self.port, 'hacheck', 'secret', io_loop=self.io_loop)
+        yield conn.query('SELECT 1')
+        self.assertEqual(1, self.server.logins)
+        conn = postgres.PostgresConnection(self.port, 'hacheck', 'wrong', io_loop=self.io_loop)
+        with self.assertRaises(postgres.PostgresError) as cm:
+            yield conn.startup()
+        self.assertEqual('28P01', cm.exception.fields['C'])
+
+    @tornado.testing.gen_test
+    def test_no_password(self):
+        conn = postgres.PostgresConnection(self.port, 'hacheck', io_loop=self.io_loop)
+        with self.assertRaises(postgres.PostgresError):
+            yield conn.startup()
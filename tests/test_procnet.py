@@ -0,0 +1,84 @@
+import os
+import shutil
+import tempfile
+
+import mock
+
+try:
+    from unittest2 import TestCase
+except ImportError:
+    from unittest import TestCase
+
+from hacheck import procnet
+
+# lines of /proc/net/tcp and tcp6 are wider than is comfortable to read here,
+# so each is split after its local and remote addresses
+PROC_NET_TCP = (
+    '  sl  local_address rem_address   '
+    'st tx_queue rx_queue tr tm->when retrnsmt   uid  timeout inode\n'
+    '   0: 0100007F:0CEA 00000000:0000 '
+    '0A 00000000:00000000 00:00000000 00000000     0        0 18511 1 0000000000000000 100 0 0 10 0\n'
+    '   1: 00000000:0016 00000000:0000 '
+    '0A 00000000:00000000 00:00000000 00000000     0        0 15231 1 0000000000000000 100 0 0 10 0\n'
+    '   2: 0100007F:0CEA 0100007F:D2F0 '
+    '01 00000000:00000000 00:00000000 00000000     0        0 22004 1 0000000000000000 20 4 30 10 -1\n'
+    '   3: 0100007F:1F90 0100007F:D2F2 '
+    '06 00000000:00000000 03:00000b7d 00000000     0        0 0 3 0000000000000000\n'
+)
+
+PROC_NET_TCP6 = (
+    '  sl  local_address                         remote_address                        '
+    'st tx_queue rx_queue tr tm->when retrnsmt   uid  timeout inode\n'
+    '   0: 00000000000000000000000000000000:0016 00000000000000000000000000000000:0000 '
+    '0A 00000000:00000000 00:00000000 00000000     0        0 15233 1 0000000000000000 100 0 0 10 0\n'
+    '   1: 00000000000000000000000001000000:1F91 00000000000000000000000000000000:0000 '
+    '0A 00000000:00000000 00:00000000 00000000     0        0 15234 1 0000000000000000 100 0 0 10 0\n'
+)
+
+
+class TestProcNet(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.tcp = os.path.join(self.root, 'tcp')
+        self.tcp6 = os.path.join(self.root, 'tcp6')
+        with open(self.tcp, 'w') as f:
+            f.write(PROC_NET_TCP)
+        with open(self.tcp6, 'w') as f:
+            f.write(PROC_NET_TCP6)
+        procnet.configure(refresh_interval=10)
+        self.paths_patch = mock.patch.dict(procnet.config, {'paths': (self.tcp, self.tcp6)})
+        self.paths_patch.start()
+
+    def tearDown(self):
+        self.paths_patch.stop()
+        procnet.configure()
+        shutil.rmtree(self.root)
+
+    def test_parse(self):
+        ports = procnet.parse(PROC_NET_TCP.splitlines())
+        self.assertEqual({3306: set(['0100007F']), 22: set(['00000000'])}, ports)
+
+    def test_format_address(self):
+        self.assertEqual('127.0.0.1', procnet.format_address('0100007F'))
+        self.assertEqual('[::]', procnet.format_address('0' * 32))
+        self.assertEqual('[::1]', procnet.format_address('00000000000000000000000001000000'))
+
+    def test_listening_addresses(self):
+        self.assertEqual(set(['00000000', '0' * 32]), procnet.listening_addresses(22))
+        self.assertEqual(set(['00000000000000000000000001000000']), procnet.listening_addresses(8081))
+        # established and TIME_WAIT sockets don't count
+        self.assertEqual(set(), procnet.listening_addresses(8080))
+
+    def test_refresh_interval(self):
+        procnet.listening_addresses(22, now=100)
+        os.unlink(self.tcp6)
+        with open(self.tcp, 'w') as f:
+            f.write(PROC_NET_TCP.splitlines()[0])
+        # still served from the snapshot
+        self.assertEqual(2, len(procnet.listening_addresses(22, now=105)))
+        self.assertEqual(set(), procnet.listening_addresses(22, now=111))
+
+    def test_unreadable(self):
+        shutil.rmtree(self.root)
+        os.mkdir(self.root)
+        self.assertRaises(EnvironmentError, procnet.listening_addresses, 22)
@@ -0,0 +1,170 @@
+import json
+
+try:
+    from unittest2 import TestCase
+except ImportError:
+    from unittest import TestCase
+
+import tornado.gen
+import tornado.testing
+
+from hacheck import cache
+from hacheck import redis
+from hacheck.checkers import redis as redis_checkers
+
+from . import fake_redis
+
+
+class TestRedisProtocol(TestCase):
+    def test_encode_command(self):
+        self.assertEqual(b'*1\r\n$4\r\nPING\r\n', redis.encode_command('PING'))
+        self.assertEqual(b'*2\r\n$4\r\nAUTH\r\n$3\r\nfoo\r\n', redis.encode_command(b'AUTH', 'foo'))
+
+
+class TestInfoSnapshot(TestCase):
+    def test_redis(self):
+        snapshot = redis.InfoSnapshot(fake_redis.REDIS_INFO)
+        self.assertEqual('3.0.7', snapshot.fields['redis_version'])
+        self.assertEqual('slave', snapshot.sections['replication']['role'])
+        self.assertEqual('keys=12,expires=0,avg_ttl=0', snapshot.sections['keyspace']['db3'])
+        self.assertNotIn('redis_master', snapshot.fields)
+        self.assertEqual([], snapshot.masters)
+
+    def test_values_with_colons(self):
+        snapshot = redis.InfoSnapshot(b'redis_version:3.0.7\r\nexecutable:C:\\redis\\redis-server.exe\r\n')
+        self.assertEqual('C:\\redis\\redis-server.exe', snapshot.fields['executable'])
+
+    def test_sentinel(self):
+        snapshot = redis.InfoSnapshot(fake_redis.SENTINEL_INFO)
+        self.assertEqual(['sessions', 'cache'], [m['name'] for m in snapshot.masters])
+        self.assertEqual('sdown', snapshot.masters[1]['status'])
+        self.assertEqual('10.12.3.9:6380', snapshot.fields['redis_master'])
+
+    def test_json(self):
+        snapshot = redis.InfoSnapshot(fake_redis.REDIS_INFO)
+        self.assertEqual(snapshot.fields, json.loads(snapshot.json))
+        self.assertIs(snapshot.json, snapshot.json)
+
+    def test_match(self):
+        snapshot = redis.InfoSnapshot(fake_redis.REDIS_INFO)
+        self.assertEqual(('role', 'slave'), snapshot.match({'role': ['master', 'slave']}))
+        self.assertEqual(None, snapshot.match({'role': ['master'], 'nonexistent': ['1']}))
+
+
+class TestRedisPool(tornado.testing.AsyncTestCase):
+    def setUp(self):
+        super(TestRedisPool, self).setUp()
+        sock, self.port = tornado.testing.bind_unused_port()
+        self.server = fake_redis.FakeRedisServer(io_loop=self.io_loop, replies={
+            b'INFO': fake_redis.bulk(b'# Server\r\nredis_version:2.8.19\r\n'),
+            b'LIST': b'*3\r\n:1\r\n$-1\r\n*1\r\n+nested\r\n',
+        })
+        self.server.add_socket(sock)
+
+    def tearDown(self):
+        redis.close_pools()
+        self.server.stop()
+        super(TestRedisPool, self).tearDown()
+
+    @tornado.testing.gen_test
+    def test_replies(self):
+        pool = redis.pool(self.port, io_loop=self.io_loop)
+        self.assertEqual(b'PONG', (yield pool.execute('PING')))
+        self.assertEqual(b'# Server\r\nredis_version:2.8.19\r\n', (yield pool.execute('INFO')))
+        self.assertEqual([1, None, [b'nested']], (yield pool.execute('LIST')))
+        with self.assertRaises(redis.RedisError):
+            yield pool.execute('FLUSHALL')
+
+    @tornado.testing.gen_test
+    def test_pipelining(self):
+        pool = redis.pool(self.port, size=1, io_loop=self.io_loop)
+        replies = yield [pool.execute(command) for command in ('PING', 'INFO', 'PING', 'PING')]
+        self.assertEqual([b'PONG', b'PONG'], [replies[0], replies[2]])
+        self.assertEqual(1, self.server.connections)
+        self.assertEqual([b'PING', b'INFO', b'PING', b'PING'], self.server.commands)
+
+    @tornado.testing.gen_test
+    def test_pipelined_behind_timeout(self):
+        # the server stops answering
+        self.server.replies[b'PING'] = b''
+        pool = redis.pool(self.port, size=1, timeout=0.5, io_loop=self.io_loop)
+        first = redis_checkers.check_redis(pool.execute('PING'), 'PING', lambda reply: (200, reply))
+        yield tornado.gen.sleep(0.2)
+        second = redis_checkers.check_redis(pool.execute('PING'), 'PING', lambda reply: (200, reply))
+        first, second = yield [first, second]
+        self.assertEqual(503, first[0])
+        self.assertIn('timed out', first[1])
+        # its reply went with the connection the first timed out on
+        self.assertEqual(503, second[0])
+        self.assertEqual(1, self.server.connections)
+
+
+class TestSentinelMonitor(tornado.testing.AsyncTestCase):
+    def setUp(self):
+        super(TestSentinelMonitor, self).setUp()
+        cache.configure()
+        sock, self.port = tornado.testing.bind_unused_port()
+        self.server = fake_redis.FakeRedisServer(io_loop=self.io_loop, replies={
+            b'INFO': fake_redis.bulk(fake_redis.SENTINEL_INFO),
+        })
+        self.server.add_socket(sock)
+        self.monitor = redis.monitor_sentinel(self.port, reconnect_interval=0.01, io_loop=self.io_loop)
+
+    def tearDown(self):
+        redis.stop_sentinel_monitors()
+        self.io_loop.run_sync(lambda: self.monitor.running)
+        redis.close_pools()
+        self.server.stop()
+        super(TestSentinelMonitor, self).tearDown()
+
+    @tornado.gen.coroutine
+    def wait_for(self, condition):
+        while not condition():
+            yield tornado.gen.Task(self.io_loop.add_callback)
+
+    def check(self, query_params):
+        return redis_checkers.check_sentinel_info('foo', self.port, 'match', io_loop=self.io_loop,
+                                                  query_params=query_params, headers={})
+
+    @tornado.testing.gen_test
+    def test_seeded_from_info(self):
+        yield self.wait_for(lambda: self.monitor.subscribed)
+        self.assertEqual(
+            'name=sessions,status=ok,address=10.12.3.4:6379,slaves=2,sentinels=3',
+            self.monitor.snapshot().fields['master0']
+        )
+        self.assertEqual((200, 'Match found: field redis_master, value 10.12.3.9:6380'),
+                         (yield self.check('redis_master=10.12.3.9:6380')))
+        self.assertEqual([b'INFO', b'SUBSCRIBE'], self.server.commands)
+
+    @tornado.testing.gen_test
+    def test_switch_master(self):
+        yield self.wait_for(lambda: self.monitor.subscribed)
+        self.server.publish(b'+switch-master', b'cache 10.12.3.9 6380 10.12.3.10 6380')
+        yield self.wait_for(lambda: self.monitor.events)
+        self.assertEqual(200, (yield self.check('redis_master=10.12.3.10:6380'))[0])
+        self.assertEqual('ok', self.monitor.snapshot().masters[1]['status'])
+        self.assertEqual([b'INFO', b'SUBSCRIBE'], self.server.commands)
+
+    @tornado.testing.gen_test
+    def test_down_states(self):
+        yield self.wait_for(lambda: self.monitor.subscribed)
+        self.server.publish(b'+sdown', b'master sessions 10.12.3.4 6379')
+        self.server.publish(b'+odown', b'master sessions 10.12.3.4 6379 #quorum 2/2')
+        self.server.publish(b'+sdown', b'slave 10.12.3.5:6379 10.12.3.5 6379 @ sessions 10.12.3.4 6379')
+        yield self.wait_for(lambda: self.monitor.events == 2)
+        self.assertEqual('odown', self.monitor.snapshot().masters[0]['status'])
+        self.server.publish(b'-odown', b'master sessions 10.12.3.4 6379')
+        yield self.wait_for(lambda: self.monitor.events == 3)
+        self.assertEqual('sdown', self.monitor.snapshot().masters[0]['status'])
+        self.assertEqual(200, (yield self.check('master0=name=sessions,status=sdown,address=10.12.3.4:6379,'
+                                                'slaves=2,sentinels=3'))[0])
+
+    @tornado.testing.gen_test
+    def test_falls_back_to_polling(self):
+        yield self.wait_for(lambda: self.monitor.subscribed)
+        self.server.disconnect_all()
+        yield self.wait_for(lambda: not self.monitor.subscribed)
+        self.assertEqual(200, (yield self.check('redis_master=10.12.3.9:6380'))[0])
+        self.assertIn(b'INFO', self.server.commands[2:])
+        yield self.wait_for(lambda: self.monitor.subscriptions == 2)
@@ -0,0 +1,111 @@
+import subprocess
+import sys
+
+import mock
+import tornado.concurrent
+import tornado.testing
+
+try:
+    from unittest2 import TestCase
+except ImportError:
+    from unittest import TestCase
+
+from hacheck import cache
+from hacheck import checker
+from hacheck import main
+from hacheck import registry
+from hacheck import spool
+from hacheck.checkers import redis as redis_checkers
+
+
+@tornado.concurrent.return_future
+def check_plugin(service_name, port, query, io_loop, callback, query_params, headers):
+    callback((200, 'plugin says hi to %s' % service_name))
+
+
+class TestRegistry(TestCase):
+    def setUp(self):
+        registry.configure()
+        registry._entry_points = None
+
+    def tearDown(self):
+        registry.configure()
+        registry._entry_points = None
+
+    def test_builtin_chains(self):
+        self.assertEqual([checker.check_spool, checker.check_tcp], registry.chain('tcp'))
+        self.assertEqual([checker.check_spool, redis_checkers.check_redis_sentinel], registry.chain('sentinel'))
+        self.assertEqual([checker.check_spool], registry.chain('spool'))
+
+    def test_checkers_are_imported_on_first_use(self):
+        code = (
+            'import sys; import hacheck.main; '
+            'lazy = ("hacheck.mysql", "hacheck.redis", "hacheck.checkers.mysql", "hacheck.keepalive"); '
+            'loaded = [m for m in lazy if m in sys.modules]; '
+            'from hacheck import registry; registry.chain("mysql"); '
+            'sys.exit(1 if loaded or "hacheck.mysql" not in sys.modules else 0)'
+        )
+        self.assertEqual(0, subprocess.call([sys.executable, '-c', code]))
+
+    def test_config(self):
+        registry.configure(
+            {'plugin': 'tests.test_registry:check_plugin'},
+            {'both': ['tcp', 'plugin']},
+        )
+        self.assertEqual([checker.check_spool, check_plugin], registry.chain('plugin'))
+        self.assertEqual([checker.check_tcp, check_plugin], registry.chain('both'))
+
+    def test_entry_points(self):
+        entry_point = mock.Mock()
+        entry_point.name = 'plugin'
+        entry_point.load.return_value = check_plugin
+        with mock.patch('pkg_resources.iter_entry_points', return_value=[entry_point]) as iter_entry_points:
+            self.assertEqual([checker.check_spool, check_plugin], registry.chain('plugin'))
+            self.assertEqual([checker.check_spool, check_plugin], registry.chain('plugin'))
+            iter_entry_points.assert_called_once_with('hacheck.checkers')
+        entry_point.load.assert_called_once_with()
+
+    def test_unknown(self):
+        with mock.patch('pkg_resources.iter_entry_points', return_value=[]):
+            self.assertRaises(KeyError, registry.chain, 'nonsense')
+        registry.configure(extra_protocols={'broken': ['spool', 'nonsense']})
+        self.assertRaises(KeyError, registry.chain, 'broken')
+
+
+class TestPluginProtocols(tornado.testing.AsyncHTTPTestCase):
+    def setUp(self):
+        cache.configure()
+        registry.configure({'plugin': 'tests.test_registry:check_plugin'})
+        super(TestPluginProtocols, self).setUp()
+
+    def tearDown(self):
+        registry.configure()
+        super(TestPluginProtocols, self).tearDown()
+
+    def get_app(self):
+        return main.get_app()
+
+    def test_plugin_protocol(self):
+        with mock.patch.object(spool, 'is_up', return_value=(True, {})):
+            response = self.fetch('/plugin/foo/1/')
+        self.assertEqual(200, response.code)
+        self.assertEqual(b'plugin says hi to foo', response.body)
+
+    def test_builtin_override(self):
+        registry.configure({'plugin': 'tests.test_registry:check_plugin'}, {'sentinel': ['spool', 'plugin']})
+        self.assertEqual([checker.check_spool, redis_checkers.check_redis_sentinel], registry.chain('redis'))
+        with mock.patch.object(spool, 'is_up', return_value=(True, {})):
+            response = self.fetch('/sentinel/foo/1/')
+            self.assertEqual(b'plugin says hi to foo', response.body)
+            response = self.fetch('/batch?check=sentinel/bar/1')
+            self.assertIn(b'plugin says hi to bar', response.body)
+
+    def test_unknown_protocol(self):
+        with mock.patch('pkg_resources.iter_entry_points', return_value=[]):
+            response = self.fetch('/nonsense/foo/1/')
+        self.assertEqual(404, response.code)
+
+    def test_batch(self):
+        with mock.patch.object(spool, 'is_up', return_value=(True, {})):
+            response = self.fetch('/batch?check=plugin/foo/1')
+        self.assertIn(b'plugin says hi to foo', response.body)
@@ -0,0 +1,52 @@
+import sys
+
+import tornado.testing
+
+from hacheck import scripts
+
+
+class TestProcessPool(tornado.testing.AsyncTestCase):
+    def setUp(self):
+        super(TestProcessPool, self).setUp()
+        scripts.reset_stats()
+
+    def tearDown(self):
+        scripts.close_pool()
+        super(TestProcessPool, self).tearDown()
+
+    def python(self, code):
+        return [sys.executable, '-c', code]
+
+    @tornado.testing.gen_test
+    def test_output_and_exit_code(self):
+        pool = scripts.pool(2, io_loop=self.io_loop)
+        result = yield pool.run(self.python('import sys; sys.stdout.write("hello"); sys.exit(3)'))
+        self.assertEqual(3, result.returncode)
+        self.assertEqual(b'hello', result.output)
+        self.assertFalse(result.timed_out)
+
+    @tornado.testing.gen_test
+    def test_output_is_capped(self):
+        pool = scripts.pool(2, io_loop=self.io_loop)
+        result = yield pool.run(self.python('import sys; sys.stdout.write("x" * 100000)'), max_output=10)
+        self.assertEqual(0, result.returncode)
+        self.assertEqual(b'x' * 10, result.output)
+
+    @tornado.testing.gen_test
+    def test_timeout(self):
+        pool = scripts.pool(2, io_loop=self.io_loop)
+        result = yield pool.run(self.python('import time; time.sleep(30)'), timeout=0.2)
+        self.assertTrue(result.timed_out)
+        self.assertLess(result.duration, 5)
+        self.assertEqual(1, scripts.get_stats()['timeouts'])
+
+    @tornado.testing.gen_test
+    def test_concurrency_cap(self):
+        pool = scripts.pool(1, io_loop=self.io_loop)
+        futures = [pool.run(self.python('pass')) for _ in range(3)]
+        self.assertEqual(1, pool.running)
+        self.assertEqual(2, len(pool.waiting))
+        results = yield futures
+        self.assertEqual([0, 0, 0], [result.returncode for result in results])
+        self.assertEqual(0, pool.running)
+        self.assertEqual(2, scripts.get_stats()['queued'])
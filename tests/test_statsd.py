@@ -0,0 +1,96 @@
+import socket
+from unittest import TestCase
+
+import mock
+import tornado.ioloop
+
+from hacheck import cache
+from hacheck import metrics
+from hacheck import statsd
+
+
+class TestPackets(TestCase):
+    def test_packets(self):
+        lines = [b'a' * 10, b'b' * 10, b'c' * 10, b'd' * 30]
+        self.assertEqual(
+            [b'a' * 10 + b'\n' + b'b' * 10, b'c' * 10, b'd' * 30],
+            list(statsd.packets(lines, max_size=21)),
+        )
+
+    def test_parse_address(self):
+        self.assertEqual(('statsd.local', 8126), statsd.parse_address('statsd.local:8126'))
+        self.assertEqual(('statsd.local', statsd.DEFAULT_PORT), statsd.parse_address('statsd.local'))
+
+
+class TestStatsdClient(TestCase):
+    def setUp(self):
+        cache.configure()
+        statsd.reset_stats()
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.settimeout(1)
+        self.io_loop = tornado.ioloop.IOLoop()
+        self.client = statsd.StatsdClient('127.0.0.1:%d' % self.server.getsockname()[1], prefix='hc',
+                                          max_packet_size=100, io_loop=self.io_loop)
+
+    def tearDown(self):
+        self.client.stop()
+        statsd.stop()
+        self.server.close()
+        self.io_loop.close()
+
+    def receive(self):
+        lines = []
+        self.server.setblocking(False)
+        while True:
+            try:
+                packet = self.server.recv(65536)
+            except socket.error:
+                break
+            self.assertLessEqual(len(packet), 100)
+            lines.extend(packet.split(b'\n'))
+        return lines
+
+    def test_flush(self):
+        self.client.incr('requests.foo.200')
+        self.client.incr('requests.foo.200')
+        self.client.incr('requests.b:ar.503')
+        for i in range(10):
+            self.client.timing('request_time.foo', i)
+        cache.stats['hits'] += 2
+        self.client.flush()
+        lines = self.receive()
+        self.assertEqual([b'hc.cache.hits:2|c', b'hc.requests.b_ar.503:1|c', b'hc.requests.foo.200:2|c'], lines[:3])
+        self.assertIn(b'hc.request_time.foo:9.000|ms', lines)
+        self.assertEqual(13, len(lines))
+        self.assertEqual(13, statsd.get_stats()['metrics'])
+        self.assertGreater(statsd.get_stats()['packets'], 1)
+        # nothing new, so nothing to send
+        self.client.flush()
+        self.assertEqual([], self.receive())
+
+    def test_sampled_timers(self):
+        with mock.patch.object(statsd, 'MAX_TIMER_SAMPLES', 4):
+            for i in range(8):
+                self.client.timing('t', i)
+        self.client.flush()
+        lines = self.receive()
+        self.assertEqual(4, len(lines))
+        self.assertTrue(all(line.endswith(b'|ms|@0.5000') for line in lines))
+
+    def test_send_errors_are_dropped(self):
+        self.client.incr('foo')
+        with mock.patch.object(self.client, 'socket') as s:
+            s.sendto.side_effect = socket.error(11, 'Resource temporarily unavailable')
+            self.client.flush()
+        self.assertEqual(1, statsd.get_stats()['send_errors'])
+        self.assertEqual(0, statsd.get_stats()['packets'])
+
+    def test_metrics_are_passed_on(self):
+        statsd.client = self.client
+        try:
+            metrics.record_request('foo', 200, 0.25)
+        finally:
+            statsd.client = None
+        self.client.flush()
+        self.assertEqual([b'hc.requests.foo.200:1|c', b'hc.request_time.foo:250.000|ms'], self.receive())